@@ -1,61 +1,229 @@
+import asyncio
 import contextlib
+import json
+import math
+import os
+import time
+import uuid
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.background import BackgroundTask
 
+from core.admission import AdmissionController, AdmissionRejectedError
 from core.factory import AgentFactory
-from core.hitl_hooks import build_hitl_hooks
+from core.hitl_hooks import ApprovalBroker, build_hitl_hooks
+from core.mcp_pool import MCPSessionPool
+from core.metrics import (
+    CHAT_REQUESTS,
+    REGISTRY,
+    Timings,
+    bind_timings,
+    build_timing_hook,
+    record_phase,
+    span,
+    startup_report,
+    use_timings,
+)
+from core.plan_cache import PlanCache
 from core.planner import PlannerAgent
+from core.prewarm import SpeculativePrewarm
+from core.sessions import ChatSession, SessionStore
+from core.spill_store import SpillStore, build_spill_hook
+from core.task_graph import TaskGraphRun
+from core.tool_cache import ToolResultCache, build_result_cache_hook, tool_servers
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI()
+MCP_CONFIG_PATH = os.environ.get(
+    "MCP_CONFIG_PATH", "/Users/mrityunjay/Code/2025/jarvis_playground/mcp/mcp_config.json"
+)
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", 1000))
+# earlier turns of a kept session replayed to the agent on each follow-up
+SESSION_HISTORY_RUNS = int(os.environ.get("SESSION_HISTORY_RUNS", 5))
+# connect the servers the query most likely needs while the planner runs (per request: `prewarm`)
+SPECULATIVE_PREWARM = os.environ.get("SPECULATIVE_PREWARM", "") not in ("", "0")
+PREWARM_MAX_SERVERS = int(os.environ.get("PREWARM_MAX_SERVERS", 2))
+# workers on one host share the stdio servers of the broker on this socket (python -m core.mcp_broker)
+MCP_BROKER_SOCKET = os.environ.get("MCP_BROKER_SOCKET") or None
+# spread the tool calls of one model turn over idle pooled sessions (max_parallel_tool_calls per server)
+PARALLEL_TOOL_CALLS = os.environ.get("PARALLEL_TOOL_CALLS", "") not in ("", "0")
+# append every run's planner, model and tool traffic to this file (see core.trace)
+TRACE_RECORD_PATH = os.environ.get("TRACE_RECORD_PATH") or None
+# serve runs from a recorded trace instead of Gemini, OpenAI and the MCP servers
+TRACE_REPLAY_PATH = os.environ.get("TRACE_REPLAY_PATH") or None
+# recorded latencies are multiplied by this on replay; 0 replays without waiting
+TRACE_REPLAY_LATENCY_SCALE = float(os.environ.get("TRACE_REPLAY_LATENCY_SCALE", 1.0))
+# run events buffered per stream before the agent waits for a slow client to read
+STREAM_BUFFER_EVENTS = int(os.environ.get("STREAM_BUFFER_EVENTS", 64))
+MCP_TOOLS_PATH = os.environ.get(
+    "MCP_TOOLS_PATH", "/Users/mrityunjay/Code/2025/jarvis_playground/mcp/mcp_tools.json"
+)
 
 
-@app.post("/chat")
-async def chat(request: Request):
-    body = await request.json()
-    user_input = body.get("query")
-    debug = body.get("debug", False)
-    if not user_input:
-        raise HTTPException(status_code=400, detail="Missing 'query' in request.")
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = Timings()
+    app.state.trace = None
+    if TRACE_REPLAY_PATH:
+        # imported only when tracing, it pulls in httpx
+        from core.trace import TraceReplay
 
-    # --- Run planner agent as in main.py ---
-    planner_agent = PlannerAgent(debug=debug)
-    agent_spec = planner_agent.run(user_input)
-    hitl_hooks = build_hitl_hooks(agent_spec.tools_requiring_approval, debug=debug)
+        app.state.trace = TraceReplay(TRACE_REPLAY_PATH, latency_scale=TRACE_REPLAY_LATENCY_SCALE)
+    elif TRACE_RECORD_PATH:
+        from core.trace import TraceRecorder
 
-    # Collect response content instead of streaming
-    response_content = ""
-    tool_calls = []
-    status = "completed"
-    error_message = None
+        app.state.trace = TraceRecorder(TRACE_RECORD_PATH)
+    replay = TRACE_REPLAY_PATH is not None
+    # MCP sessions stay open between requests and are shared by every /chat call
+    app.state.mcp_pool = MCPSessionPool()
+    # Repeat queries reuse validated plans; set PLAN_CACHE_PATH to persist them across restarts
+    app.state.plan_cache = PlanCache(db_path=os.environ.get("PLAN_CACHE_PATH"))
+    # Built once per process: one genai client (on first plan), one tool map and prompt, one registry
+    with use_timings(startup):
+        with span("planner_init"):
+            # with PLANNER_FALLBACK_MODEL set, slow or failed Gemini plans are hedged with that model
+            app.state.planner = PlannerAgent(
+                api_key="replay" if replay else None,
+                mcp_tools_file=MCP_TOOLS_PATH,
+                plan_cache=app.state.plan_cache,
+                fallback_model=os.environ.get("PLANNER_FALLBACK_MODEL") or None,
+            )
+            if replay:
+                app.state.planner.backends = [app.state.trace.planner_backend()]
+        with span("factory_init"):
+            app.state.agent_factory = AgentFactory(
+                config_path=MCP_CONFIG_PATH,
+                pool=app.state.mcp_pool,
+                broker_socket=MCP_BROKER_SOCKET,
+                parallel_tool_calls=PARALLEL_TOOL_CALLS,
+                trace=app.state.trace,
+            )
+    # HITL tool calls wait here for /approvals decisions instead of blocking on input()
+    app.state.approvals = ApprovalBroker()
+    # Results of read-only tools listed under `result_cache_ttls` are shared across requests
+    app.state.tool_cache = ToolResultCache()
+    # Tool results over MAX_TOOL_RESULT_BYTES go to disk; the model and responses get a preview
+    app.state.spill_store = SpillStore(
+        directory=os.environ.get("SPILL_DIR"),
+        max_result_bytes=int(os.environ.get("MAX_TOOL_RESULT_BYTES", 64 * 1024)),
+        ttl_seconds=float(os.environ.get("SPILL_TTL_SECONDS", 3600)),
+    )
+    # Caps concurrent chat runs; the overflow waits in a bounded queue, beyond that 429/503
+    app.state.admission = AdmissionController(
+        max_in_flight=int(os.environ.get("MAX_IN_FLIGHT_REQUESTS", 16)),
+        max_queued=int(os.environ.get("MAX_QUEUED_REQUESTS", 64)),
+        queue_timeout=float(os.environ.get("ADMISSION_TIMEOUT_SECONDS", 30)),
+    )
+    # Multi-turn sessions keep their agent and MCP sessions open until idle or evicted
+    app.state.sessions = SessionStore(
+        max_sessions=int(os.environ.get("MAX_CHAT_SESSIONS", 64)),
+        idle_timeout=float(os.environ.get("SESSION_IDLE_TIMEOUT_SECONDS", 900)),
+        on_close=app.state.approvals.end_session,
+    )
+    # not bound to `startup`: pooled sessions opened here outlive it
+    warm_started = time.perf_counter()
+    with contextlib.suppress(FileNotFoundError):
+        await app.state.agent_factory.warm_pool()
+    startup.record("pool_warm", time.perf_counter() - warm_started)
+    app.state.startup = startup_report(
+        startup, planner_context_precompiled=app.state.planner.context_precompiled
+    )
+    if os.environ.get("STARTUP_REPORT"):
+        print(json.dumps(app.state.startup, indent=2))
+    yield
+    await app.state.sessions.aclose()
+    await app.state.mcp_pool.aclose()
+    await app.state.agent_factory.aclose()
+    if app.state.trace is not None:
+        await app.state.trace.aclose()
+    app.state.plan_cache.close()
+    app.state.spill_store.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(AdmissionRejectedError)
+async def admission_rejected(request: Request, exc: AdmissionRejectedError):
+    detail = "Too many requests queued." if exc.status_code == 429 else "Timed out waiting for capacity."
+    return JSONResponse(
+        {"detail": detail, "reason": exc.reason},
+        status_code=exc.status_code,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _agent_spec_payload(agent_spec) -> dict:
+    return {
+        "tools_required": [
+            {"server": tool.server, "tools": tool.tools} for tool in agent_spec.tools_requiring_approval
+        ]
+        if agent_spec.tools_requiring_approval
+        else [],
+        "prompt": agent_spec.prompt,
+        "shortlisted_servers": agent_spec.shortlisted_servers,
+        "subtasks": [
+            {"id": task.id, "mcp_servers": task.mcp_servers, "depends_on": task.depends_on}
+            for task in agent_spec.subtasks
+        ],
+    }
+
+
+async def _agent_run_events(app: FastAPI, agent_spec, hitl_hooks: list, toolkits: dict | None = None):
+    """Run the agent for `agent_spec` and yield plain-dict events as they arrive.
+
+    Plans with sub-tasks first yield `subtask` events while the sub-agents run. Ends
+    with a single `status` event. If the consumer stops iterating (e.g. the client
+    disconnected), the agent stream is closed and its MCP sessions are released.
+    """
+    if agent_spec.subtasks:
+        # independent sub-agents run concurrently; the main agent then merges their results
+        graph = TaskGraphRun(app.state.agent_factory, agent_spec, hitl_hooks)
+        async with contextlib.aclosing(graph.events()) as subtask_events:
+            async for event in subtask_events:
+                yield event
+        agent_spec = agent_spec.model_copy(update={"prompt": graph.merged_prompt()})
 
     async with contextlib.AsyncExitStack() as stack:
-        # Updated to match main.py pattern - no config_path parameter
-        agent_factory = AgentFactory(
-            debug=debug, config_path="/Users/mrityunjay/Code/2025/jarvis_playground/mcp/mcp_config.json"
+        # Sessions are leased from the shared pool and returned when the stack closes
+        agent_factory = app.state.agent_factory
+        custom_agent = await agent_factory.create_agent_from_spec(
+            agent_spec, stack, tool_hooks=hitl_hooks, toolkits=toolkits
         )
-        custom_agent = await agent_factory.create_agent_from_spec(agent_spec, stack, tool_hooks=hitl_hooks)
+        async with contextlib.aclosing(_agent_stream_events(custom_agent, agent_spec.prompt)) as events:
+            async for event in events:
+                yield event
 
-        # Collect all events instead of streaming
-        stream = await custom_agent.arun(agent_spec.prompt, stream=True, stream_intermediate_steps=True)
+
+async def _agent_stream_events(agent, prompt: str):
+    """One `agent.arun` as `content` and `tool_call` events, ending with a `status` event."""
+    status = "completed"
+    error_message = None
+    run_started = time.perf_counter()
+    first_token = True
+    stream = await agent.arun(prompt, stream=True, stream_intermediate_steps=True)
+    try:
         async for event in stream:
             if getattr(event, "event", None) == "RunResponseContent":
                 content = getattr(event, "content", "")
                 if content:
-                    response_content += content
+                    if first_token:
+                        record_phase("time_to_first_token", time.perf_counter() - run_started)
+                        first_token = False
+                    yield {"event": "content", "content": content}
 
             elif getattr(event, "event", None) == "ToolCallCompleted":
                 tool = getattr(event, "tool", None)
                 if tool:
-                    tool_info = {
+                    yield {
+                        "event": "tool_call",
                         "name": getattr(tool, "name", "unknown"),
                         "result": getattr(tool, "result", ""),
                         "error": getattr(tool, "tool_call_error", False),
                     }
-                    tool_calls.append(tool_info)
                     if getattr(tool, "tool_call_error", False):
                         status = "error"
                         error_message = f"Tool failed: {getattr(tool, 'result', 'error')}"
@@ -65,25 +233,578 @@ async def chat(request: Request):
                 status = "cancelled"
                 error_message = getattr(event, "agent_message", "Run cancelled.")
                 break
+    finally:
+        await stream.aclose()
+
+    yield {"event": "status", "status": status, "error": error_message}
+
+
+async def _session_turn_events(app: FastAPI, chat_session: ChatSession, prompt: str):
+    """One turn on a kept session's agent. The first turn also runs the plan's sub-tasks."""
+    async with chat_session.lock:
+        if chat_session.closed:
+            yield {"event": "status", "status": "error", "error": "Session expired, start a new one."}
+            return
+        if chat_session.turns == 0 and chat_session.agent_spec.subtasks:
+            graph = TaskGraphRun(app.state.agent_factory, chat_session.agent_spec, chat_session.tool_hooks)
+            async with contextlib.aclosing(graph.events()) as subtask_events:
+                async for event in subtask_events:
+                    yield event
+            prompt = graph.merged_prompt()
+        chat_session.turns += 1
+        try:
+            async with contextlib.aclosing(_agent_stream_events(chat_session.agent, prompt)) as events:
+                async for event in events:
+                    yield event
+        finally:
+            chat_session.touch()
+
+
+def _build_tool_hooks(app: FastAPI, agent_spec, session_id: str, debug: bool = False) -> list:
+    """HITL approval, result cache (not while tracing), spill and timing hooks, outermost first."""
+    hooks = build_hitl_hooks(
+        agent_spec.tools_requiring_approval, debug=debug, broker=app.state.approvals, session_id=session_id
+    )
+    registry = app.state.agent_factory.load_mcp_registry()
+    # sub-agents run with these hooks too, so their servers' tools must map as well
+    tool_to_server = tool_servers(app.state.planner.mcp_tools, agent_spec.all_mcp_servers())
+    if app.state.trace is None:
+        # a traced run makes every call, so replaying it with a cold cache finds them all recorded
+        hooks.append(build_result_cache_hook(app.state.tool_cache, registry, tool_to_server))
+    # inside the cache, so cached entries are the bounded previews
+    hooks.append(build_spill_hook(app.state.spill_store, registry, tool_to_server))
+    # innermost hook, so tool latency excludes time spent waiting for approval
+    hooks.append(build_timing_hook())
+    return hooks
+
+
+async def _run_agent_events(
+    app: FastAPI,
+    agent_spec,
+    session_id: str,
+    timings: Timings,
+    debug: bool = False,
+    with_timings=False,
+    toolkits: dict | None = None,
+    chat_session: ChatSession | None = None,
+    prompt: str | None = None,
+):
+    """`_agent_run_events` merged with `approval_required` events for `session_id`.
+
+    The run happens in its own task so approval requests can be yielded while the
+    agent is parked waiting on them. Spans are collected into `timings`; the final
+    `status` event carries them when `with_timings` is set. With `chat_session` the
+    turn runs `prompt` on the session's existing agent instead of building one.
+    """
+    broker: ApprovalBroker = app.state.approvals
+    if chat_session is None:
+        hitl_hooks = _build_tool_hooks(app, agent_spec, session_id, debug)
+        run_events = _agent_run_events(app, agent_spec, hitl_hooks, toolkits)
+    else:
+        run_events = _session_turn_events(app, chat_session, prompt)
+    # bounded, so a client that reads slowly holds the agent back instead of growing the buffer
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_EVENTS)
+    failure: list[BaseException] = []
+    approval_puts: set[asyncio.Task] = set()
+
+    async def produce():
+        bind_timings(timings)
+        try:
+            async with contextlib.aclosing(run_events) as events:
+                async for event in events:
+                    await queue.put(event)
+        except Exception as e:
+            failure.append(e)
+        # only reached when not cancelled, i.e. while the consumer is still reading
+        await queue.put(None)
+
+    def on_approval(event):
+        # the broker notifies synchronously, so a full buffer is waited on in a task
+        task = asyncio.ensure_future(queue.put(event))
+        approval_puts.add(task)
+        task.add_done_callback(approval_puts.discard)
+
+    subscription = broker.subscribe(session_id, on_approval)
+    producer = asyncio.create_task(produce())
+    try:
+        while (event := await queue.get()) is not None:
+            if event["event"] == "status":
+                with use_timings(timings):
+                    record_phase("total", time.perf_counter() - timings.started)
+                CHAT_REQUESTS.inc(status=event["status"])
+                if timings.trace is not None:
+                    timings.trace.write("status", status=event["status"], error=event.get("error"))
+                if with_timings:
+                    event["timings"] = timings.to_dict()
+            yield event
+    finally:
+        broker.unsubscribe(session_id, subscription)
+        for task in list(approval_puts):
+            task.cancel()
+        producer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await producer
+    if failure:
+        CHAT_REQUESTS.inc(status="failed")
+        if timings.trace is not None:
+            timings.trace.write("status", status="failed", error=str(failure[0]))
+        raise failure[0]
+
+
+async def _collect_run(events, on_approval=None) -> dict:
+    """Fold run events into the fields of a /chat response. `on_approval` sees approval requests."""
+    content_parts = []
+    tool_calls = []
+    subtasks = []
+    result = {"status": "completed", "error": None}
+    async for event in events:
+        if event["event"] == "content":
+            content_parts.append(event["content"])
+        elif event["event"] == "tool_call":
+            tool_calls.append({k: event[k] for k in ("name", "result", "error")})
+        elif event["event"] == "subtask" and event["status"] != "started":
+            subtasks.append({k: v for k, v in event.items() if k != "event"})
+        elif event["event"] == "approval_required" and on_approval is not None:
+            on_approval(event)
+        elif event["event"] == "status":
+            result = {k: v for k, v in event.items() if k != "event"}
+    return {
+        "status": result["status"],
+        "content": "".join(content_parts),
+        "tool_calls": tool_calls,
+        "subtasks": subtasks,
+        **{k: v for k, v in result.items() if k != "status"},
+    }
+
+
+class ChatRequest(BaseModel):
+    query: str
+    debug: bool = False
+    session_id: str | None = None
+    # include the per-phase `timings` block in the response
+    timings: bool = False
+    # keep the agent and its MCP sessions for follow-up turns under the returned session_id
+    keep_session: bool = False
+    # plan a follow-up from scratch even if the session's servers look sufficient
+    replan: bool = False
+    # speculatively connect likely servers during planning; defaults to SPECULATIVE_PREWARM
+    prewarm: bool | None = None
+
+
+async def _parse_chat_request(request: Request) -> ChatRequest:
+    body = await request.json()
+    if not body.get("query"):
+        raise HTTPException(status_code=400, detail="Missing 'query' in request.")
+    try:
+        return ChatRequest.model_validate(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors()) from e
+
+
+@contextlib.asynccontextmanager
+async def _approval_session(app: FastAPI, session_id: str | None):
+    """Yield the session id for HITL approvals of a run without a kept session.
+
+    Its approvals are forgotten after the run, or for a client-supplied id after the last
+    run still using it.
+    """
+    broker: ApprovalBroker = app.state.approvals
+    session_id = session_id or uuid.uuid4().hex
+    try:
+        yield session_id
+    finally:
+        if not broker.has_listeners(session_id):
+            broker.end_session(session_id)
+
+
+async def _open_session(
+    app: FastAPI,
+    session_id: str,
+    agent_spec,
+    debug: bool,
+    previous: ChatSession | None = None,
+    prewarm: SpeculativePrewarm | None = None,
+) -> ChatSession:
+    """Build the agent for `agent_spec` on its own exit stack and store it as a session."""
+    hooks = _build_tool_hooks(app, agent_spec, session_id, debug)
+    stack = contextlib.AsyncExitStack()
+    try:
+        toolkits = await prewarm.adopt(agent_spec, stack) if prewarm is not None else None
+        # kept sessions hold their MCP sessions between turns, so they are capped by MAX_CHAT_SESSIONS
+        # rather than taking leases the pool needs for /chat
+        agent = await app.state.agent_factory.create_agent_from_spec(
+            agent_spec,
+            stack,
+            tool_hooks=hooks,
+            toolkits=toolkits,
+            history_runs=SESSION_HISTORY_RUNS,
+            pooled=False,
+        )
+    except BaseException:
+        await stack.aclose()
+        raise
+    if previous is not None:
+        # a replanned session keeps its conversation
+        agent.memory = previous.agent.memory
+        agent.session_id = previous.agent.session_id
+    chat_session = ChatSession(session_id, agent_spec, agent, stack, hooks)
+    await app.state.sessions.put(chat_session)
+    return chat_session
+
+
+async def _resolve_turn(app: FastAPI, chat_request: ChatRequest, timings: Timings):
+    """Return (agent_spec, chat_session or None, prompt, prewarm or None) for a chat request.
+
+    A follow-up on a live session skips the planner and runs the query as is, unless the
+    local tool index matches servers the session doesn't have (or `replan` is set). A
+    returned prewarm holds sessions opened during planning; `_turn_events` adopts and closes it.
+    """
+    sessions: SessionStore = app.state.sessions
+    existing = sessions.get(chat_request.session_id) if chat_request.session_id else None
+    if existing is not None and not chat_request.replan:
+        missing = existing.missing_servers(app.state.planner.match_servers(chat_request.query))
+        if not missing:
+            return existing.agent_spec, existing, chat_request.query, None
+        if chat_request.debug:
+            print(f"[API] Session {existing.id} lacks {missing}, replanning")
+    with use_timings(timings):
+        prewarm = None
+        if SPECULATIVE_PREWARM if chat_request.prewarm is None else chat_request.prewarm:
+            predicted = app.state.planner.match_servers(chat_request.query, top_k=PREWARM_MAX_SERVERS)
+            kept = existing is not None or chat_request.keep_session
+            prewarm = SpeculativePrewarm(
+                app.state.agent_factory, predicted, chat_request.debug, pooled=not kept
+            )
+        try:
+            agent_spec = await app.state.planner.arun(chat_request.query)
+            if existing is None and not chat_request.keep_session:
+                return agent_spec, None, agent_spec.prompt, prewarm
+            session_id = existing.id if existing is not None else chat_request.session_id or uuid.uuid4().hex
+            chat_session = await _open_session(
+                app, session_id, agent_spec, chat_request.debug, existing, prewarm
+            )
+        except BaseException:
+            if prewarm is not None:
+                await prewarm.aclose()
+            raise
+    return agent_spec, chat_session, agent_spec.prompt, None
+
+
+@contextlib.asynccontextmanager
+async def _turn_events(
+    app: FastAPI,
+    chat_request: ChatRequest,
+    agent_spec,
+    chat_session,
+    prompt,
+    timings,
+    with_timings=False,
+    prewarm: SpeculativePrewarm | None = None,
+):
+    """Yield (session_id, events) for a resolved turn."""
+    if chat_session is not None:
+        async with contextlib.aclosing(
+            _run_agent_events(
+                app,
+                agent_spec,
+                chat_session.id,
+                timings,
+                chat_request.debug,
+                with_timings,
+                chat_session=chat_session,
+                prompt=prompt,
+            )
+        ) as events:
+            yield chat_session.id, events
+        return
+    try:
+        toolkits = await prewarm.adopt(agent_spec) if prewarm is not None else None
+        async with (
+            _approval_session(app, chat_request.session_id) as session_id,
+            contextlib.aclosing(
+                _run_agent_events(
+                    app, agent_spec, session_id, timings, chat_request.debug, with_timings, toolkits
+                )
+            ) as events,
+        ):
+            yield session_id, events
+    finally:
+        if prewarm is not None:
+            await prewarm.aclose()
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    chat_request = await _parse_chat_request(request)
+    async with request.app.state.admission.admit():
+        return await _chat(request, chat_request)
+
+
+def _new_timings(app: FastAPI, query: str) -> Timings:
+    """Timings for a run of `query`, which also records or replays it when a trace is configured."""
+    trace = app.state.trace
+    return Timings(trace=trace.start_run(query) if trace is not None else None)
+
+
+async def _chat(request: Request, chat_request: ChatRequest) -> JSONResponse:
+    timings = _new_timings(request.app, chat_request.query)
+
+    # --- Run planner agent as in main.py (or reuse a live session), without blocking the event loop ---
+    agent_spec, chat_session, prompt, prewarm = await _resolve_turn(request.app, chat_request, timings)
+
+    # Collect response content instead of streaming
+    async with _turn_events(
+        request.app, chat_request, agent_spec, chat_session, prompt, timings, prewarm=prewarm
+    ) as (session_id, events):
+        result = await _collect_run(events)
 
     # Return structured JSON response
-    return JSONResponse(
-        {
-            "status": status,
-            "content": response_content,
-            "tool_calls": tool_calls,
-            "error": error_message,
-            "agent_spec": {
-                "tools_required": [
-                    {"server": tool.server, "tools": tool.tools} 
-                    for tool in agent_spec.tools_requiring_approval
-                ]
-                if agent_spec.tools_requiring_approval
-                else [],
-                "prompt": agent_spec.prompt,
-            },
+    response = {
+        **result,
+        "agent_spec": _agent_spec_payload(agent_spec),
+        "session_id": session_id,
+    }
+    if chat_session is not None:
+        response["turn"] = chat_session.turns
+    if chat_request.timings:
+        response["timings"] = timings.to_dict()
+    return JSONResponse(response)
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    """Same as /chat, but sends each event as one NDJSON line the moment it happens.
+
+    Event order: `agent_spec`, then any number of `subtask`, `content`, `tool_call` and
+    `approval_required`, then `status`. Starlette cancels the generator when the client
+    disconnects, which unwinds the run and denies its pending approvals.
+    """
+    chat_request = await _parse_chat_request(request)
+    # the slot is held until the stream ends, not just until the response starts
+    release = await request.app.state.admission.acquire()
+    timings = _new_timings(request.app, chat_request.query)
+    try:
+        agent_spec, chat_session, prompt, prewarm = await _resolve_turn(request.app, chat_request, timings)
+    except BaseException:
+        release()
+        raise
+
+    async def cleanup():
+        release()
+        if prewarm is not None:
+            await prewarm.aclose()
+
+    async def ndjson():
+        try:
+            async with _turn_events(
+                request.app,
+                chat_request,
+                agent_spec,
+                chat_session,
+                prompt,
+                timings,
+                chat_request.timings,
+                prewarm,
+            ) as (sid, events):
+                payload = {
+                    "event": "agent_spec",
+                    "agent_spec": _agent_spec_payload(agent_spec),
+                    "session_id": sid,
+                }
+                if chat_session is not None:
+                    payload["turn"] = chat_session.turns + 1
+                yield json.dumps(payload) + "\n"
+                async for event in events:
+                    yield json.dumps(event, default=str) + "\n"
+        finally:
+            release()
+
+    # the background task covers a client that disconnects before the stream starts
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", background=BackgroundTask(cleanup))
+
+
+class ChatBatchRequest(BaseModel):
+    queries: list[str] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+    debug: bool = False
+    timings: bool = False
+    # planner calls in flight at once
+    planning_concurrency: int = Field(8, ge=1, le=64)
+    # groups of queries executing at once, each holding its own MCP sessions
+    workers: int = Field(4, ge=1, le=32)
+
+
+async def _batch_events(app: FastAPI, batch: ChatBatchRequest):
+    """Plan every query, then run them grouped by `mcp_servers`; yield each result as it finishes.
+
+    Queries that plan to the same servers share one set of opened sessions. Large groups are
+    split so every worker has something to do. Each item fails on its own: a planner or
+    agent error becomes a `failed` result and the rest of the batch carries on.
+    """
+    batch_id = uuid.uuid4().hex
+    started = time.perf_counter()
+    factory: AgentFactory = app.state.agent_factory
+    out: asyncio.Queue = asyncio.Queue()
+    timings = [_new_timings(app, query) for query in batch.queries]
+    plan_slots = asyncio.Semaphore(batch.planning_concurrency)
+    counts = {"completed": 0, "failed": 0}
+
+    def emit(index: int, result: dict, agent_spec=None):
+        counts["completed" if result["status"] == "completed" else "failed"] += 1
+        payload = _agent_spec_payload(agent_spec) if agent_spec is not None else None
+        out.put_nowait(
+            {
+                "event": "result",
+                "index": index,
+                "query": batch.queries[index],
+                **result,
+                "agent_spec": payload,
+            }
+        )
+
+    async def plan(index: int):
+        async with plan_slots:
+            with use_timings(timings[index]):
+                return await app.state.planner.arun(batch.queries[index])
+
+    async def run_item(index: int, agent_spec, toolkits: dict):
+        session_id = f"{batch_id}-{index}"
+        try:
+            async with contextlib.aclosing(
+                _run_agent_events(
+                    app, agent_spec, session_id, timings[index], batch.debug, batch.timings, toolkits
+                )
+            ) as events:
+                result = await _collect_run(events, lambda e: out.put_nowait({**e, "index": index}))
+        except Exception as e:
+            result = {"status": "failed", "error": str(e)}
+        finally:
+            app.state.approvals.end_session(session_id)
+        emit(index, result, agent_spec)
+
+    async def run():
+        plans = await asyncio.gather(*(plan(i) for i in range(len(batch.queries))), return_exceptions=True)
+        groups: dict[tuple[str, ...], list[int]] = {}
+        for index, agent_spec in enumerate(plans):
+            if isinstance(agent_spec, Exception):
+                emit(index, {"status": "failed", "error": str(agent_spec)})
+            elif isinstance(agent_spec, BaseException):
+                raise agent_spec
+            else:
+                # the agent orders its tools itself; any order of the same servers can share sessions
+                groups.setdefault(tuple(sorted(agent_spec.mcp_servers)), []).append(index)
+        work: asyncio.Queue = asyncio.Queue()
+        for servers, indices in groups.items():
+            size = math.ceil(len(indices) / batch.workers)
+            for start in range(0, len(indices), size):
+                work.put_nowait((servers, indices[start : start + size]))
+
+        async def worker():
+            while not work.empty():
+                servers, indices = work.get_nowait()
+                async with contextlib.AsyncExitStack() as stack:
+                    try:
+                        toolkits = await factory.connect_servers(list(servers), stack)
+                    except Exception:
+                        # unknown servers etc.; each item reports the error from the factory
+                        toolkits = {}
+                    for index in indices:
+                        await run_item(index, plans[index], toolkits)
+
+        await asyncio.gather(*(worker() for _ in range(min(batch.workers, work.qsize()))))
+
+    runner = asyncio.create_task(run())
+    runner.add_done_callback(lambda _: out.put_nowait(None))
+    try:
+        while (event := await out.get()) is not None:
+            yield event
+        await runner
+        yield {
+            "event": "batch_complete",
+            "total": len(batch.queries),
+            **counts,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
         }
-    )
+    finally:
+        runner.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await runner
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: Request):
+    """Run many queries in one request and stream one NDJSON `result` line per query as it finishes.
+
+    Lines are `result` (with the query's `index`), `approval_required` (with `index`) and a
+    final `batch_complete`. The whole batch takes one admission slot.
+    """
+    try:
+        batch = ChatBatchRequest.model_validate(await request.json())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors()) from e
+    release = await request.app.state.admission.acquire()
+
+    async def ndjson():
+        try:
+            async with contextlib.aclosing(_batch_events(request.app, batch)) as events:
+                async for event in events:
+                    yield json.dumps(event, default=str) + "\n"
+        finally:
+            release()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", background=BackgroundTask(release))
+
+
+@app.get("/approvals")
+def list_approvals(request: Request, session_id: str):
+    """Tool calls of `session_id` currently waiting for a human decision."""
+    return {"approvals": request.app.state.approvals.pending(session_id)}
+
+
+def _resolve_approval(request: Request, session_id: str, approval_id: str, approved: bool):
+    # an id from another session is treated as unknown, so ids can't be probed across sessions
+    if not request.app.state.approvals.resolve(session_id, approval_id, approved):
+        raise HTTPException(status_code=404, detail=f"No pending approval '{approval_id}' in this session.")
+    return {"id": approval_id, "approved": approved}
+
+
+@app.post("/approvals/{approval_id}/approve")
+def approve(request: Request, approval_id: str, session_id: str):
+    return _resolve_approval(request, session_id, approval_id, True)
+
+
+@app.post("/approvals/{approval_id}/deny")
+def deny(request: Request, approval_id: str, session_id: str):
+    return _resolve_approval(request, session_id, approval_id, False)
+
+
+@app.get("/tool-results/{handle}")
+def tool_result(request: Request, handle: str):
+    """Stream the full payload of a tool result that was replaced by a preview."""
+    try:
+        chunks = request.app.state.spill_store.iter_chunks(handle)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No stored tool result '{handle}'.") from None
+    return StreamingResponse(chunks, media_type="text/plain; charset=utf-8")
+
+
+@app.get("/sessions")
+def list_sessions(request: Request):
+    """Sessions kept open with `keep_session`, most recently used last."""
+    return {**request.app.state.sessions.stats(), "sessions": request.app.state.sessions.summaries()}
+
+
+@app.delete("/sessions/{session_id}")
+async def end_session(request: Request, session_id: str):
+    """Close a kept session, releasing its MCP sessions and pending approvals."""
+    if not await request.app.state.sessions.remove(session_id):
+        raise HTTPException(status_code=404, detail=f"No session '{session_id}'.")
+    return {"id": session_id, "closed": True}
+
+
+@app.get("/metrics")
+def metrics(request: Request):
+    """Prometheus text exposition of latencies, admission queue depth and rejections."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 # Optional: root or healthcheck
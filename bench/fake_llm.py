@@ -0,0 +1,172 @@
+# Fake LLM backends for benchmarks: a canned planner client and a scripted OpenAI-compatible chat server.
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class _CannedResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _CannedModels:
+    def __init__(self, spec_json: str, latency_ms: float):
+        self._spec_json = spec_json
+        self._latency_ms = latency_ms
+
+    def generate_content(self, **_) -> _CannedResponse:
+        time.sleep(self._latency_ms / 1000)
+        return _CannedResponse(self._spec_json)
+
+
+class _AsyncCannedModels(_CannedModels):
+    async def generate_content(self, **_) -> _CannedResponse:
+        await asyncio.sleep(self._latency_ms / 1000)
+        return _CannedResponse(self._spec_json)
+
+
+class _AsyncCannedClient:
+    def __init__(self, spec_json: str, latency_ms: float):
+        self.models = _AsyncCannedModels(spec_json, latency_ms)
+
+
+class StubPlannerClient:
+    """Drop-in for `genai.Client` on a PlannerAgent: every query plans to the same AgentSpec JSON."""
+
+    def __init__(self, spec_json: str, latency_ms: float = 0.0):
+        self.models = _CannedModels(spec_json, latency_ms)
+        self.aio = _AsyncCannedClient(spec_json, latency_ms)
+
+
+def _dummy_arguments(schema: dict[str, Any]) -> dict[str, Any]:
+    """Fill the required properties of a tool's JSON schema with placeholder values."""
+    placeholders = {
+        "string": "bench",
+        "integer": 1,
+        "number": 1.0,
+        "boolean": True,
+        "array": [],
+        "object": {},
+    }
+    props = schema.get("properties", {})
+    return {k: placeholders.get(props.get(k, {}).get("type"), "bench") for k in schema.get("required", [])}
+
+
+class ScriptedChat:
+    """Chat completions that call tools on the first turn and answer once tool results are in.
+
+    The first turn calls up to `tool_calls` of the offered tools (cycling through them if
+    there are fewer); any turn that follows a tool result answers with `reply_words` words.
+    """
+
+    def __init__(self, tool_calls: int = 2, reply_words: int = 20, latency_ms: float = 0.0):
+        self.tool_calls = tool_calls
+        self.reply_words = reply_words
+        self.latency_ms = latency_ms
+        self._ids = itertools.count()
+
+    def plan_turn(self, body: dict[str, Any]) -> tuple[list[dict[str, Any]], str]:
+        """Return (tool calls, text) for the next assistant message."""
+        messages = body.get("messages", [])
+        offered = [t["function"] for t in body.get("tools") or [] if t.get("type") == "function"]
+        if offered and self.tool_calls and not any(m.get("role") == "tool" for m in messages):
+            calls = []
+            for fn in itertools.islice(itertools.cycle(offered), self.tool_calls):
+                calls.append(
+                    {
+                        "id": f"call_{next(self._ids)}",
+                        "type": "function",
+                        "function": {
+                            "name": fn["name"],
+                            "arguments": json.dumps(_dummy_arguments(fn.get("parameters") or {})),
+                        },
+                    }
+                )
+            return calls, ""
+        return [], " ".join(["done"] * self.reply_words)
+
+    def _chunk(
+        self, body: dict[str, Any], delta: dict[str, Any] | None, finish_reason: str | None = None
+    ) -> str:
+        chunk: dict[str, Any] = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "bench"),
+            "choices": [],
+        }
+        if delta is None:
+            # trailing usage-only chunk, as sent for stream_options.include_usage
+            chunk["usage"] = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        else:
+            chunk["choices"].append({"index": 0, "delta": delta, "finish_reason": finish_reason})
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    async def stream(self, body: dict[str, Any]):
+        await asyncio.sleep(self.latency_ms / 1000)
+        calls, text = self.plan_turn(body)
+        yield self._chunk(body, {"role": "assistant", "content": ""})
+        if calls:
+            for i, call in enumerate(calls):
+                yield self._chunk(body, {"tool_calls": [{"index": i, **call}]})
+            yield self._chunk(body, {}, "tool_calls")
+        else:
+            for word in text.split(" "):
+                yield self._chunk(body, {"content": word + " "})
+            yield self._chunk(body, {}, "stop")
+        yield self._chunk(body, None)
+        yield "data: [DONE]\n\n"
+
+    async def complete(self, body: dict[str, Any]) -> dict[str, Any]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        calls, text = self.plan_turn(body)
+        message: dict[str, Any] = {"role": "assistant", "content": None if calls else text}
+        if calls:
+            message["tool_calls"] = calls
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "bench"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if calls else "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+
+def build_chat_app(chat: ScriptedChat) -> FastAPI:
+    """OpenAI-compatible `/v1/chat/completions` backed by `chat`; point OPENAI_BASE_URL at it."""
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        if body.get("stream"):
+            return StreamingResponse(chat.stream(body), media_type="text/event-stream")
+        return JSONResponse(await chat.complete(body))
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Scripted OpenAI-compatible chat server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8300)
+    parser.add_argument("--tool-calls", type=int, default=2, help="Tool calls issued on the first turn")
+    parser.add_argument("--reply-words", type=int, default=20, help="Words in the final answer")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay before each completion")
+    args = parser.parse_args()
+
+    chat = ScriptedChat(args.tool_calls, args.reply_words, args.latency_ms)
+    uvicorn.run(build_chat_app(chat), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
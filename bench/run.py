@@ -0,0 +1,391 @@
+# Offline benchmark for the /chat orchestration path.
+#
+# Starts stand-in MCP servers (stdio, SSE, streamable HTTP), a scripted OpenAI-compatible
+# chat model and api.main with a canned planner, drives POST /chat at the requested
+# concurrency and reports throughput, latency percentiles, MCP connect cost and the
+# server's RSS / file-descriptor growth. No network access or API keys are needed.
+#
+#   python -m bench.run --requests 200 --concurrency 8 --mcp-latency-ms 20
+#
+# With --replay the workload is a trace recorded with TRACE_RECORD_PATH (see core.trace):
+# api.main serves its recorded plans, model responses and tool results at their recorded
+# latencies, and the recorded queries are sent round-robin at any concurrency.
+#
+#   python -m bench.run --replay traces/prod.jsonl --requests 500 --concurrency 32
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+STUB_SERVER = REPO_ROOT / "bench" / "stub_mcp_server.py"
+# transport name -> mcp_config.json "type"
+TRANSPORTS = {"stdio": "stdio", "sse": "sse", "streamable-http": "streamable_http"}
+_METRIC_LINE = re.compile(
+    r'^jarvis_mcp_connect_seconds_(sum|count)\{server="([^"]*)",outcome="([^"]*)"\} (\S+)$'
+)
+
+
+def _wait_for_port(port: int, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args} exited with code {proc.returncode}")
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return
+        time.sleep(0.1)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def _proc_stats(pid: int) -> dict[str, int]:
+    """RSS (kB), open file descriptors and child processes of `pid`, from /proc (Linux only)."""
+    stats = {"rss_kb": 0, "fds": 0, "children": 0}
+    with contextlib.suppress(OSError):
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                stats["rss_kb"] = int(line.split()[1])
+        stats["fds"] = len(os.listdir(f"/proc/{pid}/fd"))
+        stats["children"] = len(Path(f"/proc/{pid}/task/{pid}/children").read_text().split())
+    return stats
+
+
+def _connect_stats(metrics_text: str) -> dict[str, dict[str, float]]:
+    """{server: {"count", "seconds"}} of successful MCP connects from a /metrics scrape."""
+    out: dict[str, dict[str, float]] = {}
+    for line in metrics_text.splitlines():
+        m = _METRIC_LINE.match(line)
+        if m and m.group(3) == "ok":
+            key = "seconds" if m.group(1) == "sum" else "count"
+            out.setdefault(m.group(2), {"count": 0.0, "seconds": 0.0})[key] = float(m.group(4))
+    return out
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+class BenchEnvironment:
+    """Owns the stub servers, the fake chat model and the API server for one run."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.workdir = Path(tempfile.mkdtemp(prefix="jarvis-bench-"))
+        self.procs: list[subprocess.Popen] = []
+        self.api_port = args.base_port
+        self.api_proc: subprocess.Popen | None = None
+
+    def _spawn(self, *argv: str, env: dict[str, str] | None = None) -> subprocess.Popen:
+        proc = subprocess.Popen(
+            [sys.executable, *argv],
+            cwd=REPO_ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=None if self.args.verbose else subprocess.DEVNULL,
+        )
+        self.procs.append(proc)
+        return proc
+
+    def _stub_args(self, name: str, transport: str, port: int | None = None) -> list[str]:
+        argv = [
+            str(STUB_SERVER),
+            "--name",
+            name,
+            "--transport",
+            transport,
+            "--latency-ms",
+            str(self.args.mcp_latency_ms),
+            "--payload-bytes",
+            str(self.args.payload_bytes),
+        ]
+        return argv + ["--port", str(port)] if port is not None else argv
+
+    def start(self):
+        args = self.args
+        servers: dict[str, dict[str, Any]] = {}
+        port = self.api_port
+        for transport in args.transports:
+            name = "stub_" + transport.replace("-", "_")
+            conf: dict[str, Any] = {
+                "type": TRANSPORTS[transport],
+                "pool_max_sessions": args.pool_max_sessions,
+            }
+            if transport == "stdio":
+                conf.update(command=sys.executable, args=self._stub_args(name, transport))
+            else:
+                port += 1
+                proc = self._spawn(*self._stub_args(name, transport, port))
+                _wait_for_port(port, proc)
+                path = "/sse" if transport == "sse" else "/mcp"
+                conf["url"] = f"http://127.0.0.1:{port}{path}"
+            servers[name] = conf
+
+        port += 1
+        chat_port = port
+        proc = self._spawn(
+            "-m",
+            "bench.fake_llm",
+            "--port",
+            str(chat_port),
+            "--tool-calls",
+            str(args.tool_calls),
+            "--latency-ms",
+            str(args.model_latency_ms),
+        )
+        _wait_for_port(chat_port, proc)
+
+        config_path = self.workdir / "mcp_config.json"
+        config_path.write_text(json.dumps({"mcpServers": servers}, indent=2))
+        tools_path = self.workdir / "mcp_tools.json"
+        tools_path.write_text(
+            json.dumps(
+                {
+                    name: [
+                        [f"{name}_echo", "Echo the given text back."],
+                        [f"{name}_payload", "Return a payload."],
+                    ]
+                    for name in servers
+                }
+            )
+        )
+        spec = {
+            "name": "bench_agent",
+            "instructions": "you are a helpful agent who exercises the benchmark tools",
+            "mcp_servers": list(servers),
+            "prompt": "1. Call the available tools. 2. Summarise the results.",
+            "tools_requiring_approval": [],
+        }
+        env = {
+            **os.environ,
+            "MCP_CONFIG_PATH": str(config_path),
+            "MCP_TOOLS_PATH": str(tools_path),
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{chat_port}/v1",
+            "OPENAI_API_KEY": "bench",
+            "GOOGLE_API_KEY": "bench",
+            "BENCH_AGENT_SPEC": json.dumps(spec),
+            "BENCH_PLANNER_LATENCY_MS": str(args.planner_latency_ms),
+        }
+        env.pop("PLAN_CACHE_PATH", None)
+        self.api_proc = self._spawn("-m", "bench.serve", "--port", str(self.api_port), env=env)
+        _wait_for_port(self.api_port, self.api_proc, timeout=60.0)
+
+    def start_replay(self):
+        """api.main on the real registry and tool map, with every backend replayed from the trace."""
+        args = self.args
+        env = {
+            **os.environ,
+            "TRACE_REPLAY_PATH": str(Path(args.replay).resolve()),
+            "TRACE_REPLAY_LATENCY_SCALE": str(args.latency_scale),
+        }
+        if args.mcp_config:
+            env["MCP_CONFIG_PATH"] = str(Path(args.mcp_config).resolve())
+        if args.mcp_tools:
+            env["MCP_TOOLS_PATH"] = str(Path(args.mcp_tools).resolve())
+        env.pop("TRACE_RECORD_PATH", None)
+        env.pop("PLAN_CACHE_PATH", None)
+        self.api_proc = self._spawn(
+            "-m", "uvicorn", "api.main:app", "--port", str(self.api_port), "--log-level", "warning", env=env
+        )
+        _wait_for_port(self.api_port, self.api_proc, timeout=60.0)
+
+    def stop(self):
+        for proc in reversed(self.procs):
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+async def _chat(client: httpx.AsyncClient, query: str) -> tuple[float, str, dict[str, float]]:
+    """One /chat call: (seconds, outcome, phases_ms)."""
+    start = time.perf_counter()
+    try:
+        resp = await client.post("/chat", json={"query": query, "timings": True})
+        elapsed = time.perf_counter() - start
+        body = resp.json()
+    except (httpx.HTTPError, ValueError) as e:
+        return time.perf_counter() - start, type(e).__name__, {}
+    outcome = body.get("status", "unknown") if resp.status_code == 200 else f"http_{resp.status_code}"
+    return elapsed, outcome, (body.get("timings") or {}).get("phases_ms", {})
+
+
+async def _drive(
+    base_url: str, requests: int, concurrency: int, prefix: str, queries: list[str] | None = None
+) -> list[tuple[float, str, dict]]:
+    """Send `requests` /chat calls, cycling through `queries` if given."""
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+
+        async def one(i: int):
+            async with sem:
+                if queries:
+                    return await _chat(client, queries[i % len(queries)])
+                # distinct queries, so the plan cache does not hide the planner
+                return await _chat(client, f"{prefix} query {i}")
+
+        return await asyncio.gather(*(one(i) for i in range(requests)))
+
+
+def _report(results, wall: float, before: dict, after: dict, connects_before: dict, connects_after: dict):
+    latencies = sorted(r[0] for r in results)
+    outcomes: dict[str, int] = {}
+    phases: dict[str, float] = {}
+    for _, outcome, phases_ms in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        for phase, ms in phases_ms.items():
+            phases[phase] = phases.get(phase, 0.0) + ms
+    connects = {}
+    for server, stats in connects_after.items():
+        prev = connects_before.get(server, {"count": 0.0, "seconds": 0.0})
+        count = stats["count"] - prev["count"]
+        seconds = stats["seconds"] - prev["seconds"]
+        connects[server] = {
+            "count": int(count),
+            "mean_ms": round(seconds / count * 1000, 2) if count else 0.0,
+        }
+    n = len(results)
+    return {
+        "requests": n,
+        "outcomes": outcomes,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(n / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 2),
+            "p95": round(_percentile(latencies, 95) * 1000, 2),
+            "p99": round(_percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "mean_phases_ms": {phase: round(total / n, 2) for phase, total in sorted(phases.items())},
+        "mcp_connects": connects,
+        "server": {
+            "rss_kb": {
+                "before": before["rss_kb"],
+                "after": after["rss_kb"],
+                "growth": after["rss_kb"] - before["rss_kb"],
+            },
+            "fds": {"before": before["fds"], "after": after["fds"], "growth": after["fds"] - before["fds"]},
+            "children": {"before": before["children"], "after": after["children"]},
+        },
+    }
+
+
+def _print_report(report: dict[str, Any]):
+    lat = report["latency_ms"]
+    print(f"requests      {report['requests']}  {report['outcomes']}")
+    print(f"throughput    {report['throughput_rps']} req/s over {report['wall_seconds']}s")
+    print(f"latency ms    p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}")
+    for phase, ms in report["mean_phases_ms"].items():
+        print(f"  {phase:<22}{ms} ms/request")
+    for server, stats in report["mcp_connects"].items():
+        print(f"mcp connect   {server}: {stats['count']} x {stats['mean_ms']} ms")
+    server = report["server"]
+    print(
+        f"rss kB        {server['rss_kb']['before']} -> {server['rss_kb']['after']} ({server['rss_kb']['growth']:+})"
+    )
+    print(
+        f"open fds      {server['fds']['before']} -> {server['fds']['after']} ({server['fds']['growth']:+})"
+    )
+    print(f"children      {server['children']['before']} -> {server['children']['after']}")
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    env = BenchEnvironment(args)
+    queries = None
+    if args.replay:
+        from core.trace import TraceReplay
+
+        queries = TraceReplay(args.replay).queries()
+        if not queries:
+            raise SystemExit(f"No recorded runs in {args.replay}")
+        env.start_replay()
+    else:
+        env.start()
+    try:
+        base_url = f"http://127.0.0.1:{env.api_port}"
+        pid = env.api_proc.pid
+        if args.warmup:
+            await _drive(base_url, args.warmup, args.concurrency, "warmup", queries)
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            connects_before = _connect_stats((await client.get("/metrics")).text)
+        before = _proc_stats(pid)
+        start = time.perf_counter()
+        results = await _drive(base_url, args.requests, args.concurrency, "bench", queries)
+        wall = time.perf_counter() - start
+        after = _proc_stats(pid)
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            connects_after = _connect_stats((await client.get("/metrics")).text)
+        return _report(results, wall, before, after, connects_before, connects_after)
+    finally:
+        env.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /chat against local stand-in backends")
+    parser.add_argument("--requests", type=int, default=50, help="Measured /chat requests")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=4, help="Unmeasured requests sent first")
+    parser.add_argument(
+        "--transports",
+        default="stdio,sse,streamable-http",
+        type=lambda s: [t for t in s.split(",") if t],
+        help="Comma-separated stub MCP servers to mount (stdio, sse, streamable-http)",
+    )
+    parser.add_argument("--mcp-latency-ms", type=float, default=0.0, help="Delay per stub tool call")
+    parser.add_argument(
+        "--payload-bytes", type=int, default=1024, help="Size of the stub payload tool result"
+    )
+    parser.add_argument("--planner-latency-ms", type=float, default=0.0, help="Simulated planner latency")
+    parser.add_argument(
+        "--model-latency-ms", type=float, default=0.0, help="Simulated chat model latency per turn"
+    )
+    parser.add_argument(
+        "--tool-calls", type=int, default=2, help="Tool calls the scripted model makes per run"
+    )
+    parser.add_argument(
+        "--pool-max-sessions", type=int, default=4, help="pool_max_sessions for every stub server"
+    )
+    parser.add_argument(
+        "--replay", metavar="TRACE", help="Replay the queries and backends recorded in TRACE instead"
+    )
+    parser.add_argument(
+        "--latency-scale", type=float, default=1.0, help="With --replay: factor on recorded latencies"
+    )
+    parser.add_argument("--mcp-config", metavar="PATH", help="With --replay: MCP registry (MCP_CONFIG_PATH)")
+    parser.add_argument(
+        "--mcp-tools", metavar="PATH", help="With --replay: planner tool map (MCP_TOOLS_PATH)"
+    )
+    parser.add_argument("--base-port", type=int, default=8400, help="API port; stubs use the ports after it")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show the stub and server logs")
+    args = parser.parse_args()
+    for transport in args.transports:
+        if transport not in TRANSPORTS:
+            parser.error(f"unknown transport '{transport}'")
+
+    report = asyncio.run(run(args))
+    _print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
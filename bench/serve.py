@@ -0,0 +1,40 @@
+# The real api.main app with the planner's Gemini client swapped for a canned one.
+#
+# Configured through the environment (bench/run.py sets all of these):
+#   MCP_CONFIG_PATH, MCP_TOOLS_PATH   stub server registry and tool map
+#   OPENAI_BASE_URL, OPENAI_API_KEY   the scripted chat server from bench/fake_llm.py
+#   GOOGLE_API_KEY                    any value; the planner refuses to start without one
+#   BENCH_AGENT_SPEC                  AgentSpec JSON returned for every query
+#   BENCH_PLANNER_LATENCY_MS          simulated planner latency
+import argparse
+import contextlib
+import os
+
+import uvicorn
+
+from api.main import app, lifespan
+from bench.fake_llm import StubPlannerClient
+
+
+@contextlib.asynccontextmanager
+async def bench_lifespan(app):
+    async with lifespan(app):
+        app.state.planner.client = StubPlannerClient(
+            os.environ["BENCH_AGENT_SPEC"], float(os.environ.get("BENCH_PLANNER_LATENCY_MS", 0))
+        )
+        yield
+
+
+app.router.lifespan_context = bench_lifespan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve api.main against fake model backends")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8400)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Stand-in MCP server for benchmarks: fixed latency, fixed payload size, no external calls.
+import argparse
+import asyncio
+
+from mcp.server.fastmcp import FastMCP
+
+
+def build_server(
+    name: str, latency_ms: float = 0.0, payload_bytes: int = 1024, host: str = "127.0.0.1", port: int = 8000
+) -> FastMCP:
+    """A FastMCP server exposing `<name>_echo` and `<name>_payload`.
+
+    Tool names carry the server name so several stubs can be mounted on one agent
+    without their functions colliding.
+    """
+    server = FastMCP(name, host=host, port=port, log_level="WARNING")
+    payload = ("x" * 63 + "\n") * (payload_bytes // 64) + "x" * (payload_bytes % 64)
+
+    @server.tool(name=f"{name}_echo", description=f"Echo the given text back from {name}.")
+    async def echo(text: str) -> str:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        return text
+
+    @server.tool(name=f"{name}_payload", description=f"Return a fixed-size text payload from {name}.")
+    async def get_payload() -> str:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        return payload
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in MCP server for benchmarks")
+    parser.add_argument("--name", default="stub", help="Server name, also used as the tool name prefix")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default="stdio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="Listen port for sse/streamable-http")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every tool call")
+    parser.add_argument("--payload-bytes", type=int, default=1024, help="Size of the payload tool result")
+    args = parser.parse_args()
+
+    server = build_server(args.name, args.latency_ms, args.payload_bytes, args.host, args.port)
+    server.run(transport=args.transport)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import asyncio
+import contextlib
+from collections.abc import Callable
+
+from core.metrics import REQUESTS_IN_FLIGHT, REQUESTS_QUEUED, REQUESTS_REJECTED
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request can't be admitted; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Global cap on concurrent chat runs with a bounded wait queue.
+
+    Up to `max_in_flight` requests run at once. Up to `max_queued` more wait for a slot,
+    each for at most `queue_timeout` seconds (503). Anything beyond that is turned away
+    immediately (429).
+    """
+
+    def __init__(self, max_in_flight: int = 16, max_queued: int = 64, queue_timeout: float = 30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    def _reject(self, status_code: int, reason: str) -> AdmissionRejectedError:
+        self.rejected += 1
+        REQUESTS_REJECTED.inc(reason=reason)
+        return AdmissionRejectedError(status_code, reason, retry_after=max(1, round(self.queue_timeout / 10)))
+
+    async def acquire(self) -> Callable[[], None]:
+        """Wait for a slot. Returns its release function, which is safe to call more than once."""
+        if not self._slots.locked():
+            # free slot: take it without yielding, so the queue check below sees it as taken
+            await self._slots.acquire()
+            return self._admitted()
+        if self.queued >= self.max_queued:
+            raise self._reject(429, "queue_full")
+        self.queued += 1
+        REQUESTS_QUEUED.set(self.queued)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except TimeoutError:
+            raise self._reject(503, "queue_timeout") from None
+        finally:
+            self.queued -= 1
+            REQUESTS_QUEUED.set(self.queued)
+        return self._admitted()
+
+    def _admitted(self) -> Callable[[], None]:
+        self.in_flight += 1
+        REQUESTS_IN_FLIGHT.set(self.in_flight)
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+                REQUESTS_IN_FLIGHT.set(self.in_flight)
+                self._slots.release()
+
+        return release
+
+    @contextlib.asynccontextmanager
+    async def admit(self):
+        release = await self.acquire()
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+        }
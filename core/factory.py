@@ -1,22 +1,77 @@
+import asyncio
 import json
+import os
 from contextlib import AsyncExitStack
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-# from agno import tools #noqa
-from agno.agent import Agent
-from agno.models.google import Gemini  # noqa
-from agno.models.openai import OpenAIChat  # noqa
-from agno.tools.mcp import MCPTools, SSEClientParams, StreamableHTTPClientParams
+from core.mcp_pool import MCPSessionPool, PooledSession, config_hash
+from core.metrics import MCP_SLOT_WAITING, span
 
-from mcp import StdioServerParameters
+# agno, the model SDKs and mcp take seconds to import; they are imported where first used
+if TYPE_CHECKING:
+    from agno.agent import Agent
+    from agno.tools.mcp import MCPTools
+
+    from core.lazy_mcp import LazyMCPTools
+    from core.mcp_broker import BrokerClient
+    from core.trace import TraceRecorder, TraceReplay
 
 
 class AgentFactory:
-    def __init__(self, config_path: str = "mcp/mcp_config.json", debug: bool = False):
-        """Initialize the AgentFactory with the path to the MCP configuration file."""
+    def __init__(
+        self,
+        config_path: str = "mcp/mcp_config.json",
+        debug: bool = False,
+        pool: MCPSessionPool | None = None,
+        tool_schemas_path: str | None = None,
+        connect_timeout: float = 60.0,
+        slot_timeout: float | None = None,
+        broker_socket: str | None = None,
+        parallel_tool_calls: bool = False,
+        trace: "TraceRecorder | TraceReplay | None" = None,
+    ):
+        """Initialize the AgentFactory with the path to the MCP configuration file.
+
+        When a `pool` is given, MCP sessions are borrowed from it and returned when the
+        caller's AsyncExitStack closes, instead of being spawned and torn down per agent.
+
+        Servers with cached schemas in `tool_schemas_path` (written by
+        scripts/discover_tools.py, next to the config by default) are registered
+        without connecting; their session opens on the first tool call.
+
+        Waiting for a `max_concurrent_sessions` / `max_concurrent_calls` slot gives up after
+        `slot_timeout` seconds (or `slot_timeout_seconds` on the server), by default the
+        pool's `acquire_timeout`.
+
+        With `broker_socket`, stdio servers are reached through the shared MCP broker
+        listening there (`python -m core.mcp_broker`) instead of being spawned by this process.
+
+        With `parallel_tool_calls`, the tool calls an agent makes in one turn are spread over
+        idle pooled sessions of their server, at most `max_parallel_tool_calls` (default 4)
+        per server at a time.
+
+        With a `trace` (core.trace) agents record their model and tool traffic to it, or, for a
+        TraceReplay, are served that traffic from it instead of OpenAI and the MCP servers.
+        """
         self.config_path = config_path
         self._mcp_registry = None
         self.debug = debug
+        self.pool = pool
+        self.tool_schemas_path = tool_schemas_path or os.path.join(
+            os.path.dirname(config_path), ".mcp_tools_cache.json"
+        )
+        self._tool_schemas = None
+        self.connect_timeout = connect_timeout
+        if slot_timeout is None:
+            slot_timeout = pool.acquire_timeout if pool is not None else 60.0
+        self.slot_timeout = slot_timeout
+        # server -> {"sessions" | "calls": semaphore}, from max_concurrent_* in the registry
+        self._server_limits: dict[str, dict[str, asyncio.Semaphore]] = {}
+        self.broker_socket = broker_socket
+        # one multiplexed connection per broker socket, shared by every agent
+        self._broker_clients: dict[str, BrokerClient] = {}
+        self.parallel_tool_calls = parallel_tool_calls
+        self.trace = trace
 
     def _debug_log(self, msg):
         if self.debug:
@@ -25,7 +80,7 @@ class AgentFactory:
     def load_mcp_registry(self) -> dict[str, Any]:
         """Load and cache the MCP registry from config file"""
         if self._mcp_registry is None:
-            with open(self.config_path) as f:
+            with span("registry_load"), open(self.config_path) as f:
                 data = json.load(f)
             if "mcpServers" not in data:
                 raise ValueError("MCP Config missing top-level 'mcpServers' key")
@@ -35,14 +90,63 @@ class AgentFactory:
     def reload_config(self) -> None:
         """Force reload of the configuration file"""
         self._mcp_registry = None
+        self._tool_schemas = None
+        self._server_limits = {}
         self.load_mcp_registry()
 
-    async def _connect_mcp_tools(self, name: str, conf: dict[str, Any], stack: AsyncExitStack):
-        """Return an *opened* MCPTools instance for the given server."""
+    def load_tool_schemas(self) -> dict[str, Any]:
+        """Load and cache per-server tool schemas from the discovery cache, if present"""
+        if self._tool_schemas is None:
+            try:
+                with open(self.tool_schemas_path) as f:
+                    self._tool_schemas = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._tool_schemas = {}
+        return self._tool_schemas
+
+    def _lazy_tools(
+        self, name: str, conf: dict[str, Any], stack: AsyncExitStack, pooled: bool = True
+    ) -> "LazyMCPTools | None":
+        """Return a LazyMCPTools for `name` if fresh cached schemas exist for its current config."""
+        if not conf.get("lazy_connect", True):
+            return None
+        entry = self.load_tool_schemas().get(name)
+        if not entry or "schemas" not in entry or entry.get("hash") != config_hash(conf):
+            return None
+        self._debug_log(f"Registering {name} lazily from cached schemas")
+        from core.lazy_mcp import LazyMCPTools
+
+        return LazyMCPTools(
+            name,
+            schemas=entry["schemas"],
+            descriptions=dict(entry.get("tools", [])),
+            connect=lambda: self._connect_mcp_tools(name, conf, stack, pooled),
+        )
+
+    def build_mcp_tools(self, name: str, conf: dict[str, Any]) -> "MCPTools":
+        """Return an *unopened* MCPTools instance for the given server."""
+        from agno.tools.mcp import MCPTools, SSEClientParams, StreamableHTTPClientParams
+
+        from mcp import StdioServerParameters
+
+        replay_session = self.trace.mcp_session(name) if self.trace is not None else None
+        if replay_session is not None:
+            return MCPTools(session=replay_session)
+
         stype = conf.get("type", "stdio")
-        self._debug_log(f"Connecting {name} via {stype}")
+        if stype == "stdio" and self.broker_socket:
+            # the broker owns the server process; this worker only forwards requests to it
+            stype = "broker"
+
+        if stype == "broker":
+            from core.mcp_broker import BrokerSession
+
+            session = BrokerSession(
+                self._broker_client(conf.get("socket") or self.broker_socket), conf.get("server", name)
+            )
+            tools_ctx = MCPTools(session=session)
 
-        if stype == "stdio":
+        elif stype == "stdio":
             params = StdioServerParameters(
                 command=conf["command"],
                 args=conf.get("args", []),
@@ -73,9 +177,154 @@ class AgentFactory:
             )
         else:
             raise ValueError(f"Unsupported MCP server type: {stype}")
+        return tools_ctx
 
-        # open context manager inside the shared AsyncExitStack
-        return await stack.enter_async_context(tools_ctx)
+    def _broker_client(self, socket_path: str | None) -> "BrokerClient":
+        from core.mcp_broker import DEFAULT_SOCKET_PATH, BrokerClient
+
+        socket_path = socket_path or DEFAULT_SOCKET_PATH
+        if socket_path not in self._broker_clients:
+            self._broker_clients[socket_path] = BrokerClient(socket_path)
+        return self._broker_clients[socket_path]
+
+    async def aclose(self) -> None:
+        """Close the connections to MCP brokers. Sessions are closed by their callers' stacks."""
+        for client in self._broker_clients.values():
+            await client.aclose()
+        self._broker_clients = {}
+
+    def _server_limit(self, name: str, conf: dict[str, Any], kind: str) -> asyncio.Semaphore | None:
+        """Shared semaphore for `max_concurrent_sessions` / `max_concurrent_calls` of a server, if set."""
+        limit = conf.get(f"max_concurrent_{kind}")
+        if not limit:
+            return None
+        limits = self._server_limits.setdefault(name, {})
+        if kind not in limits:
+            limits[kind] = asyncio.Semaphore(limit)
+        return limits[kind]
+
+    async def _wait_for_slot(self, slot: asyncio.Semaphore, name: str, conf: dict[str, Any], kind: str):
+        timeout = conf.get("slot_timeout_seconds", self.slot_timeout)
+        if slot.locked():
+            self._debug_log(f"Waiting for a free {kind} slot on {name}")
+        MCP_SLOT_WAITING.inc(server=name, limit=kind)
+        try:
+            await asyncio.wait_for(slot.acquire(), timeout)
+        except TimeoutError:
+            raise TimeoutError(
+                f"No max_concurrent_{kind} slot free on MCP server '{name}' within {timeout}s"
+            ) from None
+        finally:
+            MCP_SLOT_WAITING.dec(server=name, limit=kind)
+
+    async def _connect_mcp_tools(
+        self, name: str, conf: dict[str, Any], stack: AsyncExitStack, pooled: bool = True
+    ):
+        """Return an *opened* MCPTools instance for the given server."""
+        slot = self._server_limit(name, conf, "sessions")
+        if slot is None:
+            return await self._open_mcp_tools(name, conf, stack, pooled)
+
+        # the slot is held for as long as the caller's stack keeps the session
+        await self._wait_for_slot(slot, name, conf, "sessions")
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                slot.release()
+
+        stack.callback(release)
+        try:
+            return await self._open_mcp_tools(name, conf, stack, pooled)
+        except BaseException:
+            release()
+            raise
+
+    async def _open_mcp_tools(self, name: str, conf: dict[str, Any], stack: AsyncExitStack, pooled: bool):
+        self._debug_log(f"Connecting {name} via {conf.get('type', 'stdio')}")
+        if self.pool is not None and pooled:
+            # lease is returned to the pool when the stack unwinds
+            return await stack.enter_async_context(
+                self.pool.lease(name, conf, lambda: self.build_mcp_tools(name, conf))
+            )
+
+        # the session is opened and closed by its own task, so any task may connect it;
+        # closing is registered on the shared AsyncExitStack
+        session = PooledSession((name, config_hash(conf)), self.build_mcp_tools(name, conf))
+        await session.open(conf.get("connect_timeout_seconds", self.connect_timeout))
+        stack.push_async_callback(session.close)
+        return session.tools
+
+    def _call_limit_hook(self, slots: dict[str, tuple[str, dict[str, Any], asyncio.Semaphore]]):
+        """Tool hook that holds the server's `max_concurrent_calls` slot around each call."""
+
+        async def call_limit_hook(function_name: str, function_call, arguments: dict, **_):
+            if function_name not in slots:
+                return await function_call(**arguments)
+            name, conf, slot = slots[function_name]
+            try:
+                await self._wait_for_slot(slot, name, conf, "calls")
+            except TimeoutError as e:
+                return f"Error: {e}"
+            try:
+                return await function_call(**arguments)
+            finally:
+                slot.release()
+
+        return call_limit_hook
+
+    def _parallel_hook(self, tools_by_name: dict[str, Any]):
+        from core.parallel_tools import DEFAULT_MAX_PARALLEL, ServerFanout, build_parallel_hook
+
+        mcp_registry = self.load_mcp_registry()
+        fanouts = {}
+        for mcp_name, toolkit in tools_by_name.items():
+            conf = mcp_registry[mcp_name]
+            fanout = ServerFanout(
+                mcp_name,
+                conf,
+                max_parallel=conf.get("max_parallel_tool_calls", DEFAULT_MAX_PARALLEL),
+                pool=self.pool,
+                session_slot=self._server_limit(mcp_name, conf, "sessions"),
+            )
+            fanouts.update(dict.fromkeys(toolkit.functions, fanout))
+        return build_parallel_hook(fanouts)
+
+    async def warm_pool(self) -> None:
+        """Pre-open the configured minimum number of pooled sessions per server."""
+        if self.pool is not None:
+            await self.pool.warm(self.load_mcp_registry(), self.build_mcp_tools)
+
+    async def connect_servers(
+        self, mcp_names: list[str], stack: AsyncExitStack, pooled: bool = True
+    ) -> dict[str, Any]:
+        """Open (or lazily register) a toolkit per server; servers that fail are left out.
+
+        With `pooled=False` the sessions are opened for `stack` alone instead of leased from the pool.
+        """
+        mcp_registry = self.load_mcp_registry()
+        # Lazy servers cost nothing here; the rest connect concurrently, each with its own timeout
+        tools_by_name: dict[str, Any] = {}
+        for mcp_name in mcp_names:
+            lazy = self._lazy_tools(mcp_name, mcp_registry[mcp_name], stack, pooled)
+            if lazy is not None:
+                tools_by_name[mcp_name] = lazy
+        eager = [mcp_name for mcp_name in mcp_names if mcp_name not in tools_by_name]
+        results = await asyncio.gather(
+            *(self._connect_mcp_tools(mcp_name, mcp_registry[mcp_name], stack, pooled) for mcp_name in eager),
+            return_exceptions=True,
+        )
+        for mcp_name, result in zip(eager, results, strict=True):
+            if isinstance(result, Exception):
+                # one broken server should not take the whole agent down
+                print(f"[AgentFactory] Skipping MCP server '{mcp_name}': {result}")
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            tools_by_name[mcp_name] = result
+        return tools_by_name
 
     async def create_agent_from_spec(
         self,
@@ -83,27 +332,63 @@ class AgentFactory:
         stack: AsyncExitStack,
         *,
         tool_hooks: list | None = None,
-    ) -> Agent:
-        """Create an agent from specification with MCP servers"""
+        toolkits: dict[str, Any] | None = None,
+        history_runs: int = 0,
+        pooled: bool = True,
+    ) -> "Agent":
+        """Create an agent from specification with MCP servers
+
+        `toolkits` (from `connect_servers`) lets several agents that run one after another
+        reuse already opened sessions; servers missing from it are connected as usual.
+        With `history_runs` the agent replays that many earlier runs on every new one.
+        Agents kept across requests pass `pooled=False`, so their sessions don't tie up the pool.
+        """
         if not getattr(agent_spec, "instructions", None):
             raise ValueError("Invalid AgentSpec passed to factory")
         mcp_registry = self.load_mcp_registry()
-        mcp_tools = []
-        for mcp_name in getattr(agent_spec, "mcp_servers", []) or []:
+        mcp_names = list(getattr(agent_spec, "mcp_servers", []) or [])
+        for mcp_name in mcp_names:
             if mcp_name not in mcp_registry:
                 raise ValueError(f"MCP server '{mcp_name}' not found in registry")
-            mcp_tools.append(await self._connect_mcp_tools(mcp_name, mcp_registry[mcp_name], stack))
-
-        agent = Agent(
-            name=agent_spec.name,
-            instructions=agent_spec.instructions,
-            # model=Gemini(id="gemini-2.5-flash"),
-            model=OpenAIChat(id="gpt-4.1"),
-            # tools=mcp_tools + [ReasoningTools(add_instructions=True)],
-            tools=mcp_tools,
-            tool_hooks=tool_hooks or [],
-            markdown=True,
-        )
+
+        tools_by_name = {name: toolkit for name, toolkit in (toolkits or {}).items() if name in mcp_names}
+        missing = [mcp_name for mcp_name in mcp_names if mcp_name not in tools_by_name]
+        tools_by_name.update(await self.connect_servers(missing, stack, pooled))
+        mcp_tools = [tools_by_name[mcp_name] for mcp_name in mcp_names if mcp_name in tools_by_name]
+
+        call_slots = {}
+        for mcp_name, toolkit in tools_by_name.items():
+            slot = self._server_limit(mcp_name, mcp_registry[mcp_name], "calls")
+            if slot is not None:
+                call_slots.update(dict.fromkeys(toolkit.functions, (mcp_name, mcp_registry[mcp_name], slot)))
+        tool_hooks = list(tool_hooks or [])
+        if call_slots:
+            # innermost, so a call only takes a slot once approvals and caches have let it through
+            tool_hooks.append(self._call_limit_hook(call_slots))
+        trace_hook = self.trace.instrument_tools(tools_by_name) if self.trace is not None else None
+        if trace_hook is not None:
+            # outside the parallel hook, which may run the call on another session
+            tool_hooks.append(trace_hook)
+        if self.parallel_tool_calls:
+            # after every other hook, since it picks the session the call runs on
+            tool_hooks.append(self._parallel_hook(tools_by_name))
+
+        with span("agent_build"):
+            from agno.agent import Agent
+            from agno.models.openai import OpenAIChat
+
+            agent = Agent(
+                name=agent_spec.name,
+                instructions=agent_spec.instructions,
+                # model=Gemini(id="gemini-2.5-flash"),
+                model=OpenAIChat(id="gpt-4.1", **(self.trace.model_kwargs() if self.trace else {})),
+                # tools=mcp_tools + [ReasoningTools(add_instructions=True)],
+                tools=mcp_tools,
+                tool_hooks=tool_hooks,
+                markdown=True,
+                add_history_to_messages=history_runs > 0,
+                num_history_runs=history_runs or 3,
+            )
 
         self._debug_log(f"Created Agno agent '{agent.name}' with tools {agent.tools}")
         self._debug_log(f"Instructions: {agent.instructions}")
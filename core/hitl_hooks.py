@@ -1,16 +1,154 @@
-from agno.exceptions import StopAgentRun
+import asyncio
+import time
+import uuid
+from collections.abc import Callable
+from typing import Any
 
 from core.models import ToolApprovalSpec
 
 
-def build_hitl_hooks(tools_requiring_approval: list[ToolApprovalSpec], debug=False):
+class PendingApproval:
+    """A tool call parked until someone approves or denies it."""
+
+    def __init__(self, session_id: str, function_name: str, arguments: dict, timeout: float):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.function_name = function_name
+        self.arguments = arguments
+        self.created_at = time.time()
+        self.expires_at = self.created_at + timeout
+        self.future: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "tool": self.function_name,
+            "arguments": self.arguments,
+            "created_at": self.created_at,
+            "expires_at": self.expires_at,
+        }
+
+
+class ApprovalBroker:
+    """Parks HITL tool calls on asyncio futures instead of blocking on input().
+
+    Pending approvals can be listed and resolved from anywhere on the event loop (the
+    API endpoints), and the listeners of a session's running requests are told about new
+    ones (the streaming channel). Each request subscribes its own listener, so concurrent
+    requests on one session id all see them. Approvals granted in a session are remembered
+    for that session only.
+    """
+
+    def __init__(self, timeout: float = 300.0, debug: bool = False):
+        self.timeout = timeout
+        self.debug = debug
+        self._pending: dict[str, PendingApproval] = {}
+        self._session_approvals: dict[str, set[str]] = {}
+        # session_id -> {subscription token: listener}
+        self._listeners: dict[str, dict[str, Callable[[dict[str, Any]], None]]] = {}
+
+    def _debug_log(self, msg):
+        if self.debug:
+            print(f"[ApprovalBroker] {msg}")
+
+    def is_approved(self, session_id: str, function_name: str) -> bool:
+        return function_name in self._session_approvals.get(session_id, ())
+
+    async def request(
+        self, session_id: str, function_name: str, arguments: dict, timeout: float | None = None
+    ) -> bool:
+        """Wait for a decision on this tool call. Times out as a denial."""
+        pending = PendingApproval(session_id, function_name, arguments, timeout or self.timeout)
+        self._pending[pending.id] = pending
+        self._debug_log(f"Waiting for approval {pending.id}: {function_name}")
+        for listener in list(self._listeners.get(session_id, {}).values()):
+            listener({"event": "approval_required", "approval": pending.to_dict()})
+        try:
+            approved = await asyncio.wait_for(pending.future, timeout or self.timeout)
+        except TimeoutError:
+            self._debug_log(f"Approval {pending.id} timed out")
+            approved = False
+        finally:
+            self._pending.pop(pending.id, None)
+        if approved:
+            self._session_approvals.setdefault(session_id, set()).add(function_name)
+        return approved
+
+    def resolve(self, session_id: str, approval_id: str, approved: bool) -> bool:
+        """Approve or deny a pending call of the session. Returns False if the session has no such call."""
+        pending = self._pending.get(approval_id)
+        if pending is None or pending.session_id != session_id or pending.future.done():
+            return False
+        pending.future.set_result(approved)
+        self._debug_log(f"Approval {approval_id} {'approved' if approved else 'denied'}")
+        return True
+
+    def pending(self, session_id: str) -> list[dict[str, Any]]:
+        return [p.to_dict() for p in self._pending.values() if p.session_id == session_id]
+
+    def subscribe(self, session_id: str, listener: Callable[[dict[str, Any]], None]) -> str:
+        """Send the session's new approvals to `listener`; returns the token to unsubscribe with."""
+        token = uuid.uuid4().hex
+        self._listeners.setdefault(session_id, {})[token] = listener
+        return token
+
+    def unsubscribe(self, session_id: str, token: str) -> None:
+        listeners = self._listeners.get(session_id, {})
+        listeners.pop(token, None)
+        if not listeners:
+            self._listeners.pop(session_id, None)
+
+    def has_listeners(self, session_id: str) -> bool:
+        """Whether a request on the session is still running."""
+        return bool(self._listeners.get(session_id))
+
+    def end_session(self, session_id: str) -> None:
+        """Deny anything still pending for the session and forget its approvals."""
+        for pending in list(self._pending.values()):
+            if pending.session_id == session_id and not pending.future.done():
+                pending.future.set_result(False)
+        self._session_approvals.pop(session_id, None)
+        self._listeners.pop(session_id, None)
+
+
+def build_hitl_hooks(
+    tools_requiring_approval: list[ToolApprovalSpec],
+    debug=False,
+    broker: ApprovalBroker | None = None,
+    session_id: str | None = None,
+):
+    """Build the HITL tool hook.
+
+    Without a broker the user is asked on the console (read in a worker thread so the
+    event loop keeps running). With a broker the call waits for an approval scoped to
+    `session_id`.
+    """
     approval_tools = {tool for spec in tools_requiring_approval for tool in spec.tools}
     session_approvals = set()
+    session_id = session_id or uuid.uuid4().hex
+    # the calls of one turn can run concurrently; approvals are still asked one at a time
+    approval_lock = asyncio.Lock()
+    denials = 0
 
     def _log(msg: str):
         if debug:
             print(f"[HITL]: {msg}")
 
+    async def _approve(function_name: str, arguments: dict) -> bool:
+        if broker is not None:
+            return await broker.request(session_id, function_name, arguments)
+        answer = await asyncio.to_thread(input, f"HITL: Approve {function_name}? (y/n): ")
+        if answer.lower().startswith("y"):
+            session_approvals.add(function_name)
+            return True
+        return False
+
+    def _already_approved(function_name: str) -> bool:
+        if broker is not None:
+            return broker.is_approved(session_id, function_name)
+        return function_name in session_approvals
+
     # Agno tool‑hook -> wraps every tool call
     async def hitl_hook(
         function_name: str,
@@ -18,16 +156,30 @@ def build_hitl_hooks(tools_requiring_approval: list[ToolApprovalSpec], debug=Fal
         arguments: dict,
         **_,
     ):
-        if function_name in approval_tools and function_name not in session_approvals:
-            _log(f"Tool about to be called: {function_name}")
-            if not input(f"HITL: Approve {function_name}? (y/n): ").lower().startswith("y"):
+        nonlocal denials
+        if function_name in approval_tools and not _already_approved(function_name):
+            seen_denials = denials
+            async with approval_lock:
+                # a call queued behind a denial is denied with it (the run stops anyway);
+                # one queued behind an approval of the same tool goes through
+                if denials != seen_denials:
+                    approved = False
+                elif _already_approved(function_name):
+                    approved = True
+                else:
+                    _log(f"Tool about to be called: {function_name}")
+                    approved = await _approve(function_name, arguments)
+                    if not approved:
+                        denials += 1
+            if not approved:
                 _log(f"Denied tool call {function_name}")
+                from agno.exceptions import StopAgentRun
+
                 raise StopAgentRun(
                     "Tool call cancelled by user",
                     agent_message="Stopping execution as permission was not granted.",
                 )
             _log(f"Approved tool call {function_name}")
-            session_approvals.add(function_name)
 
         # execute tool
         return await function_call(**arguments)
@@ -0,0 +1,65 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+from agno.tools import Toolkit
+from agno.tools.function import Function
+
+if TYPE_CHECKING:
+    from agno.tools.mcp import MCPTools
+
+
+class LazyMCPTools(Toolkit):
+    """Toolkit that registers an MCP server's tools from cached schemas and connects on first use.
+
+    The agent sees the full tool list up front; the server process or HTTP session is only
+    opened when one of its tools is actually called, via the `connect` callback.
+    """
+
+    def __init__(
+        self,
+        server: str,
+        schemas: dict[str, dict[str, Any]],
+        descriptions: dict[str, str],
+        connect: Callable[[], Awaitable["MCPTools"]],
+        **kwargs,
+    ):
+        super().__init__(name=f"LazyMCPTools[{server}]", **kwargs)
+        self.server = server
+        self._connect = connect
+        self._tools: MCPTools | None = None
+        self._lock = asyncio.Lock()
+
+        for tool_name, schema in schemas.items():
+            self.functions[tool_name] = Function(
+                name=tool_name,
+                description=descriptions.get(tool_name, ""),
+                parameters=schema,
+                entrypoint=partial(self._call_tool, tool_name=tool_name),
+                skip_entrypoint_processing=True,
+            )
+
+    @property
+    def connected(self) -> bool:
+        return self._tools is not None
+
+    async def connect(self) -> None:
+        """Open the session now instead of on the first tool call."""
+        await self._ensure_connected()
+
+    async def _ensure_connected(self) -> "MCPTools":
+        async with self._lock:
+            if self._tools is None:
+                self._tools = await self._connect()
+            return self._tools
+
+    async def _call_tool(self, agent, tool_name: str, **kwargs) -> str:
+        try:
+            tools = await self._ensure_connected()
+        except Exception as e:
+            return f"Error: could not connect to MCP server '{self.server}': {e}"
+        function = tools.functions.get(tool_name)
+        if function is None or function.entrypoint is None:
+            return f"Error: tool '{tool_name}' is no longer provided by MCP server '{self.server}'"
+        return await function.entrypoint(agent=agent, **kwargs)
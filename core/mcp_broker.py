@@ -0,0 +1,349 @@
+"""Shared MCP broker: one process owns the MCP servers of a host, API workers reach them over a Unix socket.
+
+    python -m core.mcp_broker --config mcp/mcp_config.json --socket /tmp/jarvis-mcp-broker.sock
+
+Workers started with MCP_BROKER_SOCKET (or servers configured with "type": "broker") send their
+MCP requests here instead of spawning their own server processes. The wire format is one JSON
+object per line in each direction:
+
+    request   {"id": 7, "server": "filesystem", "method": "call_tool", "params": {"name": ..., "arguments": {...}}}
+    response  {"id": 7, "result": {...}}   or   {"id": 7, "error": "..."}
+
+Many requests may be in flight on one connection; responses come back in completion order and
+are matched to their request by id.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import signal
+import socket
+import tempfile
+from typing import TYPE_CHECKING, Any
+
+from core.mcp_pool import MCPSessionPool
+
+if TYPE_CHECKING:
+    from mcp.types import CallToolResult, ListToolsResult
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "jarvis-mcp-broker.sock")
+# a single message carries a whole tool result
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+class BrokerError(RuntimeError):
+    """An MCP request the broker answered with an error."""
+
+
+class MCPBroker:
+    """Serves the MCP servers of a registry to many clients over a Unix domain socket.
+
+    Upstream sessions come from an MCPSessionPool, so `pool_max_sessions` caps the server
+    processes of the whole host rather than of each worker, and `max_concurrent_calls` caps
+    a server's calls across all workers. Each call holds a pooled session for its duration;
+    calls beyond the cap wait in the pool. A client with `max_in_flight` requests running
+    is not read from until one finishes, which pushes back on it through the socket buffer.
+    """
+
+    def __init__(
+        self,
+        registry: dict[str, Any],
+        socket_path: str = DEFAULT_SOCKET_PATH,
+        pool: MCPSessionPool | None = None,
+        max_in_flight: int = 64,
+        debug: bool = False,
+    ):
+        from core.factory import AgentFactory
+
+        # a broker entry here would have the broker call itself
+        self.registry = {name: conf for name, conf in registry.items() if conf.get("type") != "broker"}
+        self.socket_path = socket_path
+        self.pool = pool or MCPSessionPool(debug=debug)
+        self.max_in_flight = max_in_flight
+        self.debug = debug
+        self.factory = AgentFactory(debug=debug)
+        self.clients = 0
+        self.requests = 0
+        self.errors = 0
+        self._tool_lists: dict[str, dict[str, Any]] = {}
+        self._call_slots: dict[str, asyncio.Semaphore] = {
+            name: asyncio.Semaphore(conf["max_concurrent_calls"])
+            for name, conf in self.registry.items()
+            if conf.get("max_concurrent_calls")
+        }
+        self._server: asyncio.Server | None = None
+        self._connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    def _debug_log(self, msg):
+        if self.debug:
+            print(f"[MCPBroker] {msg}")
+
+    async def start(self):
+        """Listen on `socket_path` and open the `pool_min_sessions` of every server."""
+        if os.path.exists(self.socket_path):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # left behind by a broker that didn't shut down cleanly
+                os.unlink(self.socket_path)
+            else:
+                writer.close()
+                raise RuntimeError(f"An MCP broker is already listening on {self.socket_path}")
+        # bound under a 0177 umask, so the socket is owner-only from the moment it exists
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            sock.bind(self.socket_path)
+        except BaseException:
+            sock.close()
+            raise
+        finally:
+            os.umask(umask)
+        self._server = await asyncio.start_unix_server(self._serve_client, sock=sock, limit=MAX_MESSAGE_BYTES)
+        await self.pool.warm(self.registry, self.factory.build_mcp_tools)
+        print(f"[MCPBroker] Serving {len(self.registry)} MCP servers on {self.socket_path}")
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients += 1
+        self._connections[asyncio.current_task()] = writer
+        self._debug_log(f"Client connected ({self.clients} open)")
+        slots = asyncio.Semaphore(self.max_in_flight)
+        write_lock = asyncio.Lock()
+        tasks: set[asyncio.Task] = set()
+        try:
+            while True:
+                # stop reading while the client is at its cap; its writes then block on the socket
+                await slots.acquire()
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError) as e:
+                    self._debug_log(f"Dropping client: {e}")
+                    break
+                if not line:
+                    break
+                task = asyncio.create_task(self._handle(line, writer, write_lock, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+            self.clients -= 1
+            self._connections.pop(asyncio.current_task(), None)
+            self._debug_log(f"Client disconnected ({self.clients} open)")
+
+    async def _handle(
+        self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock, slots: asyncio.Semaphore
+    ):
+        try:
+            request_id = None
+            try:
+                request = json.loads(line)
+                request_id = request.get("id")
+                response = {"id": request_id, "result": await self._dispatch(request)}
+            except Exception as e:
+                self.errors += 1
+                response = {"id": request_id, "error": f"{type(e).__name__}: {e}"}
+            payload = json.dumps(response).encode() + b"\n"
+            async with write_lock:
+                writer.write(payload)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            slots.release()
+
+    async def _dispatch(self, request: dict[str, Any]) -> Any:
+        self.requests += 1
+        method = request.get("method")
+        if method == "ping":
+            return {}
+        if method == "stats":
+            return self.stats()
+        server = request.get("server")
+        conf = self.registry.get(server)
+        if conf is None:
+            raise ValueError(f"MCP server '{server}' is not configured on the broker")
+        if method == "list_tools":
+            if server not in self._tool_lists:
+                self._tool_lists[server] = await self._call(server, conf, "list_tools", {})
+            return self._tool_lists[server]
+        if method == "call_tool":
+            slot = self._call_slots.get(server)
+            if slot is None:
+                return await self._call(server, conf, method, request.get("params") or {})
+            async with slot:
+                return await self._call(server, conf, method, request.get("params") or {})
+        raise ValueError(f"Unknown broker method: {method}")
+
+    async def _call(self, server: str, conf: dict[str, Any], method: str, params: dict[str, Any]) -> Any:
+        build = lambda: self.factory.build_mcp_tools(server, conf)  # noqa: E731
+        async with self.pool.lease(server, conf, build) as tools:
+            if method == "list_tools":
+                result = await tools.session.list_tools()
+            else:
+                self._debug_log(f"Calling {server}.{params.get('name')}")
+                result = await tools.session.call_tool(params["name"], params.get("arguments") or {})
+        return result.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "clients": self.clients,
+            "requests": self.requests,
+            "errors": self.errors,
+            "pool": self.pool.stats(),
+        }
+
+    async def aclose(self):
+        if self._server is not None:
+            self._server.close()
+        # closing a client's socket ends its read loop, which cancels its running requests
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self.pool.aclose()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.socket_path)
+
+
+class BrokerClient:
+    """One worker's connection to the broker, shared by every agent in the process.
+
+    Requests are tagged with an id and run concurrently over the one socket; a reader task
+    hands each response to the request with that id. At most `max_in_flight` requests are
+    outstanding at once, further callers wait. A dropped connection fails the outstanding
+    requests and is reopened by the next one.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, max_in_flight: int = 64):
+        self.socket_path = socket_path
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+
+    async def _connection(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                try:
+                    reader, self._writer = await asyncio.open_unix_connection(
+                        self.socket_path, limit=MAX_MESSAGE_BYTES
+                    )
+                except OSError as e:
+                    raise ConnectionError(f"No MCP broker is listening on {self.socket_path}: {e}") from e
+                self._reader_task = asyncio.create_task(
+                    self._read_responses(reader, self._writer), name="mcp-broker-reader"
+                )
+            return self._writer
+
+    async def _read_responses(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        error: Exception = ConnectionError(f"MCP broker at {self.socket_path} closed the connection")
+        try:
+            while line := await reader.readline():
+                response = json.loads(line)
+                future = self._pending.pop(response.get("id"), None)
+                if future is None or future.done():
+                    # the caller gave up on it
+                    continue
+                if "error" in response:
+                    future.set_exception(BrokerError(response["error"]))
+                else:
+                    future.set_result(response.get("result"))
+        except Exception as e:
+            error = ConnectionError(f"Lost the connection to the MCP broker at {self.socket_path}: {e}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+
+    async def request(self, server: str | None, method: str, params: dict[str, Any] | None = None) -> Any:
+        async with self._slots:
+            writer = await self._connection()
+            request_id = next(self._ids)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[request_id] = future
+            message = {"id": request_id, "server": server, "method": method, "params": params or {}}
+            try:
+                async with self._write_lock:
+                    writer.write(json.dumps(message).encode() + b"\n")
+                    await writer.drain()
+                return await future
+            finally:
+                self._pending.pop(request_id, None)
+
+    async def aclose(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+class BrokerSession:
+    """Stands in for the mcp ClientSession of `server`, so MCPTools(session=...) works through the broker."""
+
+    def __init__(self, client: BrokerClient, server: str):
+        self.client = client
+        self.server = server
+
+    async def initialize(self) -> None:
+        # the broker has initialized its own upstream session
+        return None
+
+    async def send_ping(self) -> None:
+        await self.client.request(self.server, "ping")
+
+    async def list_tools(self) -> "ListToolsResult":
+        from mcp.types import ListToolsResult
+
+        return ListToolsResult.model_validate(await self.client.request(self.server, "list_tools"))
+
+    async def call_tool(self, name: str, arguments: dict[str, Any] | None = None, **_) -> "CallToolResult":
+        from mcp.types import CallToolResult
+
+        result = await self.client.request(self.server, "call_tool", {"name": name, "arguments": arguments})
+        return CallToolResult.model_validate(result)
+
+
+async def serve(args: argparse.Namespace) -> None:
+    with open(args.config) as f:
+        registry = json.load(f)["mcpServers"]
+    broker = MCPBroker(registry, args.socket, max_in_flight=args.max_in_flight, debug=args.debug)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await broker.start()
+    try:
+        await stop.wait()
+    finally:
+        print("[MCPBroker] Shutting down")
+        await broker.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Share one set of MCP servers between API workers")
+    parser.add_argument("--config", default="mcp/mcp_config.json", help="MCP server registry")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Unix socket to listen on")
+    parser.add_argument(
+        "--max-in-flight", type=int, default=64, help="Requests one client may have running at once"
+    )
+    parser.add_argument("--debug", action="store_true", help="Log connections and tool calls")
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
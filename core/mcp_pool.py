@@ -0,0 +1,418 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+from core.metrics import MCP_CONNECT_SECONDS, MCP_LEASE_WAIT_SECONDS, current_trace, record_phase
+
+if TYPE_CHECKING:
+    from agno.tools.mcp import MCPTools
+
+# strong references to sessions still shutting down after a timed out or cancelled connect
+_background_tasks: set[asyncio.Task] = set()
+
+
+# the keys baked into an opened session (its server and transport timeouts); tuning keys (pool_*,
+# limits, cache TTLs, connect/slot timeouts) are left out so changing them keeps pooled sessions
+CONNECTION_KEYS = (
+    "type",
+    "command",
+    "args",
+    "env",
+    "url",
+    "headers",
+    "socket",
+    "server",
+    "timeout",
+    "sse_read_timeout",
+)
+
+
+def config_hash(conf: dict[str, Any]) -> str:
+    """Stable fingerprint of the connection-defining keys of a single MCP server config entry."""
+    connection = {key: conf[key] for key in CONNECTION_KEYS if key in conf}
+    return hashlib.sha256(json.dumps(connection, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class PooledSession:
+    """An opened MCPTools instance owned by a dedicated background task.
+
+    MCP transports are built on anyio task groups, which must be exited from the
+    task that entered them. Opening and closing happens inside `_run` so a session
+    can be borrowed by any request task and still be torn down cleanly.
+    """
+
+    def __init__(self, key: tuple[str, str], tools: "MCPTools"):
+        self.key = key
+        self.tools = tools
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: BaseException | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def name(self) -> str:
+        return self.key[0]
+
+    @property
+    def alive(self) -> bool:
+        return (
+            self._task is not None
+            and not self._task.done()
+            and self._error is None
+            and self.tools.session is not None
+        )
+
+    async def _run(self):
+        try:
+            async with self.tools:
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            # MCPTools leaves a half-opened transport behind when __aenter__ fails;
+            # close it here, in the task that opened it
+            with contextlib.suppress(BaseException):
+                await self.tools.__aexit__(None, None, None)
+            self._ready.set()
+
+    async def open(self, timeout: float | None = None):
+        started = time.perf_counter()
+        self._task = asyncio.create_task(self._run(), name=f"mcp-session-{self.name}")
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except BaseException as e:
+            # timed out, or the caller was cancelled (a discarded prewarm, a client disconnect):
+            # tear the transport down in the background so the caller isn't held up further
+            self._closing.set()
+            self._task.cancel()
+            _background_tasks.add(self._task)
+            self._task.add_done_callback(_background_tasks.discard)
+            seconds = time.perf_counter() - started
+            record_phase("mcp_connect", seconds, MCP_CONNECT_SECONDS, outcome="error", server=self.name)
+            if isinstance(e, TimeoutError):
+                raise TimeoutError(
+                    f"Timed out connecting MCP server '{self.name}' after {timeout}s"
+                ) from None
+            raise
+        seconds = time.perf_counter() - started
+        outcome = "error" if self._error else "ok"
+        # only real opens count as connects; waiting for a pooled session is mcp_lease_wait
+        record_phase("mcp_connect", seconds, MCP_CONNECT_SECONDS, outcome=outcome, server=self.name)
+        trace = current_trace()
+        if trace is not None:
+            trace.write("mcp_open", server=self.name, ms=round(seconds * 1000, 2), outcome=outcome)
+        if self._error is not None:
+            raise RuntimeError(f"Failed to connect MCP server '{self.name}': {self._error}") from self._error
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.tools.session.send_ping(), timeout)  # type: ignore[union-attr]
+        except Exception:
+            return False
+        self.last_checked = time.monotonic()
+        return True
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None:
+            with contextlib.suppress(BaseException):
+                await self._task
+
+
+class _ServerSlot:
+    """Per (server, config hash) bookkeeping: idle sessions and the open count."""
+
+    def __init__(self, min_sessions: int, max_sessions: int, idle_timeout: float):
+        self.min_sessions = min_sessions
+        self.max_sessions = max(1, max_sessions)
+        self.idle_timeout = idle_timeout
+        self.idle: deque[PooledSession] = deque()
+        self.opened = 0
+        self.available = asyncio.Condition()
+
+
+class MCPSessionPool:
+    """Process-wide pool of opened MCP sessions shared across agent runs.
+
+    Sessions are keyed by server name and a hash of its config entry, so editing
+    `mcp_config.json` never hands out a session started with stale settings. Once a
+    server's new config is first used, the idle sessions of its old one are closed and
+    its leased ones are closed when they come back.
+    Per-server limits can be set in the config with `pool_min_sessions`,
+    `pool_max_sessions` and `pool_idle_timeout_seconds`; the constructor values
+    are the defaults.
+    """
+
+    def __init__(
+        self,
+        min_sessions: int = 0,
+        max_sessions: int = 4,
+        idle_timeout: float = 300.0,
+        health_check_interval: float = 30.0,
+        health_check_timeout: float = 5.0,
+        connect_timeout: float = 60.0,
+        acquire_timeout: float = 60.0,
+        debug: bool = False,
+    ):
+        self.min_sessions = min_sessions
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout
+        self.debug = debug
+        self._slots: dict[tuple[str, str], _ServerSlot] = {}
+        # server -> config hash of its newest slot; slots under any other hash are draining
+        self._current: dict[str, str] = {}
+        self._maintenance_task: asyncio.Task | None = None
+        self._closed = False
+
+    def _debug_log(self, msg):
+        if self.debug:
+            print(f"[MCPSessionPool] {msg}")
+
+    def _slot(self, name: str, conf: dict[str, Any]) -> tuple[tuple[str, str], _ServerSlot]:
+        key = (name, config_hash(conf))
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = _ServerSlot(
+                min_sessions=conf.get("pool_min_sessions", self.min_sessions),
+                max_sessions=conf.get("pool_max_sessions", self.max_sessions),
+                idle_timeout=conf.get("pool_idle_timeout_seconds", self.idle_timeout),
+            )
+            self._slots[key] = slot
+            self._retire_previous(key)
+        return key, slot
+
+    def _stale(self, key: tuple[str, str]) -> bool:
+        return self._current.get(key[0], key[1]) != key[1]
+
+    def _retire_previous(self, key: tuple[str, str]):
+        """Make `key` the server's current config and close the idle sessions of its older ones."""
+        name = key[0]
+        self._current[name] = key[1]
+        for old_key, slot in list(self._slots.items()):
+            if old_key[0] != name or old_key == key or not slot.idle:
+                continue
+            self._debug_log(f"Config of {name} changed, closing {len(slot.idle)} idle sessions")
+            idle, slot.idle = list(slot.idle), deque()
+            task = asyncio.create_task(self._discard_all(slot, idle))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+    async def _discard_all(self, slot: _ServerSlot, sessions: list[PooledSession]):
+        for pooled in sessions:
+            await self._discard(slot, pooled)
+
+    def _ensure_maintenance(self):
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.create_task(
+                self._maintenance_loop(), name="mcp-pool-maintenance"
+            )
+
+    async def _open(
+        self, key: tuple[str, str], conf: dict[str, Any], build: Callable[[], "MCPTools"]
+    ) -> PooledSession:
+        pooled = PooledSession(key, build())
+        timeout = conf.get("connect_timeout_seconds", self.connect_timeout)
+        self._debug_log(f"Opening session for {key[0]} ({key[1]})")
+        await pooled.open(timeout)
+        return pooled
+
+    async def acquire(
+        self, name: str, conf: dict[str, Any], build: Callable[[], "MCPTools"]
+    ) -> PooledSession:
+        """Borrow a live session for `name`, opening a new one if the pool has room."""
+        if self._closed:
+            raise RuntimeError("MCPSessionPool is closed")
+        self._ensure_maintenance()
+        key, slot = self._slot(name, conf)
+        deadline = time.monotonic() + self.acquire_timeout
+        started = time.perf_counter()
+
+        def waited(outcome: str = "ok"):
+            seconds = time.perf_counter() - started
+            record_phase("mcp_lease_wait", seconds, MCP_LEASE_WAIT_SECONDS, outcome=outcome, server=name)
+
+        while True:
+            async with slot.available:
+                while not slot.idle and slot.opened >= slot.max_sessions:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        waited("error")
+                        raise TimeoutError(
+                            f"No MCP session available for '{name}' within {self.acquire_timeout}s"
+                        )
+                    with contextlib.suppress(TimeoutError):
+                        await asyncio.wait_for(slot.available.wait(), remaining)
+                pooled = slot.idle.popleft() if slot.idle else None
+                if pooled is None:
+                    slot.opened += 1
+
+            if pooled is None:
+                waited()
+                try:
+                    pooled = await self._open(key, conf, build)
+                except BaseException:
+                    await self._forget(slot)
+                    raise
+                return pooled
+
+            if await self._healthy(pooled):
+                self._debug_log(f"Reusing session for {name}")
+                waited()
+                return pooled
+
+            # Dead or unresponsive: drop it and loop to reconnect
+            self._debug_log(f"Session for {name} failed health check, reconnecting")
+            await self._discard(slot, pooled)
+
+    async def try_acquire(self, name: str, conf: dict[str, Any]) -> PooledSession | None:
+        """Borrow an idle session for `name` if one is open; never opens one or waits for one."""
+        if self._closed:
+            return None
+        _, slot = self._slot(name, conf)
+        while True:
+            async with slot.available:
+                if not slot.idle:
+                    return None
+                pooled = slot.idle.popleft()
+            if await self._healthy(pooled):
+                return pooled
+            await self._discard(slot, pooled)
+
+    async def _healthy(self, pooled: PooledSession) -> bool:
+        stale = time.monotonic() - pooled.last_checked > self.health_check_interval
+        return pooled.alive and (not stale or await pooled.ping(self.health_check_timeout))
+
+    async def release(self, pooled: PooledSession, *, healthy: bool = True):
+        """Return a borrowed session. Unhealthy sessions are re-checked on next acquire."""
+        slot = self._slots.get(pooled.key)
+        if slot is None or self._closed or not pooled.alive or self._stale(pooled.key):
+            if slot is not None:
+                await self._discard(slot, pooled)
+            else:
+                await pooled.close()
+            return
+        pooled.last_used = time.monotonic()
+        if not healthy:
+            pooled.last_checked = 0.0
+        async with slot.available:
+            slot.idle.append(pooled)
+            slot.available.notify()
+
+    @contextlib.asynccontextmanager
+    async def lease(self, name: str, conf: dict[str, Any], build: Callable[[], "MCPTools"]):
+        """Async context manager yielding an opened MCPTools, returned to the pool on exit."""
+        pooled = await self.acquire(name, conf, build)
+        healthy = True
+        try:
+            yield pooled.tools
+        except BaseException:
+            healthy = False
+            raise
+        finally:
+            await self.release(pooled, healthy=healthy)
+
+    async def warm(self, registry: dict[str, Any], build: Callable[[str, dict[str, Any]], "MCPTools"]):
+        """Open `pool_min_sessions` sessions for every configured server up front."""
+        for name, conf in registry.items():
+            key, slot = self._slot(name, conf)
+            await self._top_up(key, slot, conf, lambda n=name, c=conf: build(n, c))
+
+    async def _top_up(
+        self, key: tuple[str, str], slot: _ServerSlot, conf: dict[str, Any], build: Callable[[], "MCPTools"]
+    ):
+        while slot.opened < slot.min_sessions and not self._closed:
+            slot.opened += 1
+            try:
+                pooled = await self._open(key, conf, build)
+            except Exception as e:
+                await self._forget(slot)
+                self._debug_log(f"Warm-up failed for {key[0]}: {e}")
+                return
+            await self.release(pooled)
+
+    async def _forget(self, slot: _ServerSlot):
+        async with slot.available:
+            slot.opened -= 1
+            slot.available.notify()
+
+    async def _discard(self, slot: _ServerSlot, pooled: PooledSession):
+        await pooled.close()
+        await self._forget(slot)
+
+    async def _maintenance_loop(self):
+        interval = max(1.0, min(self.health_check_interval, self.idle_timeout) / 2)
+        while not self._closed:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for key, slot in list(self._slots.items()):
+                if self._stale(key) and slot.opened == 0:
+                    # every session of an old config is closed; a switch back starts afresh
+                    del self._slots[key]
+                    continue
+                async with slot.available:
+                    keep: deque[PooledSession] = deque()
+                    evict: list[PooledSession] = []
+                    for pooled in slot.idle:
+                        expired = now - pooled.last_used > slot.idle_timeout
+                        if (
+                            not pooled.alive
+                            or self._stale(key)
+                            or (expired and slot.opened - len(evict) > slot.min_sessions)
+                        ):
+                            evict.append(pooled)
+                        else:
+                            keep.append(pooled)
+                    slot.idle = keep
+                for pooled in evict:
+                    self._debug_log(f"Evicting idle session for {pooled.name}")
+                    await self._discard(slot, pooled)
+
+                # Ping long-idle sessions so failures surface before a request borrows them
+                for pooled in list(slot.idle):
+                    if now - pooled.last_checked > self.health_check_interval and not await pooled.ping(
+                        self.health_check_timeout
+                    ):
+                        async with slot.available:
+                            if pooled not in slot.idle:
+                                continue
+                            slot.idle.remove(pooled)
+                        self._debug_log(f"Dropping unhealthy session for {pooled.name}")
+                        await self._discard(slot, pooled)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        out: dict[str, dict[str, int]] = {}
+        for (name, _), slot in self._slots.items():
+            s = out.setdefault(name, {"open": 0, "idle": 0, "in_use": 0})
+            s["open"] += slot.opened
+            s["idle"] += len(slot.idle)
+            s["in_use"] += slot.opened - len(slot.idle)
+        return out
+
+    async def aclose(self):
+        """Close every idle session and stop maintenance. Leased sessions close on release."""
+        self._closed = True
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            with contextlib.suppress(BaseException):
+                await self._maintenance_task
+        for slot in self._slots.values():
+            while slot.idle:
+                await self._discard(slot, slot.idle.popleft())
+        # sessions whose connect was abandoned are still shutting down
+        if _background_tasks:
+            await asyncio.wait(list(_background_tasks), timeout=self.health_check_timeout)
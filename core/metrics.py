@@ -0,0 +1,272 @@
+import contextlib
+import contextvars
+import sys
+import time
+from typing import Any
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _label_str(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in zip(labelnames, values, strict=True)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(_escape(labels.get(n, "")) for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[tuple(_escape(labels.get(n, "")) for n in self.labelnames)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(_escape(labels.get(n, "")) for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values -> (per-bucket counts, sum, count)
+        self._values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(_escape(labels.get(n, "")) for n in self.labelnames)
+        counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self._values[key] = (counts, total + value, n + 1)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, n) in self._values.items():
+            for bound, count in [*zip(self.buckets, counts, strict=True), ("+Inf", n)]:
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {n}")
+        return lines
+
+
+class MetricsRegistry:
+    """Minimal Prometheus text-format registry; enough for a single-process /metrics endpoint."""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+PHASE_SECONDS = REGISTRY.histogram(
+    "jarvis_phase_seconds", "Latency of each request phase", ("phase", "outcome")
+)
+MCP_CONNECT_SECONDS = REGISTRY.histogram(
+    "jarvis_mcp_connect_seconds", "Time to open an MCP server session", ("server", "outcome")
+)
+MCP_LEASE_WAIT_SECONDS = REGISTRY.histogram(
+    "jarvis_mcp_lease_wait_seconds",
+    "Time spent getting a pooled MCP session, excluding any connect",
+    ("server", "outcome"),
+)
+TOOL_CALL_SECONDS = REGISTRY.histogram(
+    "jarvis_tool_call_seconds", "Latency of individual tool calls", ("tool", "outcome")
+)
+CHAT_REQUESTS = REGISTRY.counter("jarvis_chat_requests_total", "Chat runs by final status", ("status",))
+TOOL_CACHE_EVENTS = REGISTRY.counter(
+    "jarvis_tool_cache_events_total", "Tool result cache hits, misses and invalidations", ("event",)
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("jarvis_requests_in_flight", "Chat requests currently admitted")
+REQUESTS_QUEUED = REGISTRY.gauge("jarvis_requests_queued", "Chat requests waiting for admission")
+REQUESTS_REJECTED = REGISTRY.counter(
+    "jarvis_requests_rejected_total", "Chat requests turned away by admission control", ("reason",)
+)
+PLANNER_BACKEND_SECONDS = REGISTRY.histogram(
+    "jarvis_planner_backend_seconds", "Latency of each planner backend call", ("backend", "outcome")
+)
+PLANNER_HEDGES = REGISTRY.counter(
+    "jarvis_planner_hedges_total", "Planner requests also sent to a backup backend", ("backend",)
+)
+PREWARM_SERVERS = REGISTRY.counter(
+    "jarvis_prewarm_servers_total",
+    "Servers connected while planning: hit (in the plan), wasted (not in it) or missed (not predicted)",
+    ("outcome",),
+)
+TOOL_RESULT_SPILLS = REGISTRY.counter(
+    "jarvis_tool_result_spills_total", "Oversized tool results written to the spill store", ("server",)
+)
+PARALLEL_TOOL_CALLS = REGISTRY.counter(
+    "jarvis_parallel_tool_calls_total",
+    "Tool calls in parallel mode by where they ran: the agent's session, a pooled one, or pipelined",
+    ("server", "route"),
+)
+MCP_SLOT_WAITING = REGISTRY.gauge(
+    "jarvis_mcp_slot_waiting", "Sessions or tool calls waiting on a per-server limit", ("server", "limit")
+)
+
+
+class Timings:
+    """Timing spans collected for one run, returned as the optional `timings` block.
+
+    `trace` is the run's record in a trace file (see core.trace); spans are written to it as well.
+    """
+
+    def __init__(self, trace=None):
+        self.started = time.perf_counter()
+        self.spans: list[dict[str, Any]] = []
+        self.trace = trace
+
+    def record(self, phase: str, seconds: float, **labels):
+        self.spans.append({"phase": phase, "ms": round(seconds * 1000, 2), **labels})
+        if self.trace is not None:
+            self.trace.write("span", **self.spans[-1])
+
+    def to_dict(self) -> dict[str, Any]:
+        phases: dict[str, float] = {}
+        for s in self.spans:
+            phases[s["phase"]] = round(phases.get(s["phase"], 0.0) + s["ms"], 2)
+        return {"phases_ms": phases, "spans": self.spans}
+
+
+# dependencies that dominate cold start; they are imported on first use, not at startup
+HEAVY_MODULES = ("agno.agent", "agno.models.openai", "agno.tools.mcp", "google.genai", "openai", "mcp")
+
+
+def startup_report(timings: Timings, **extra) -> dict[str, Any]:
+    """Startup phases from `timings`, time since it started and which HEAVY_MODULES are imported."""
+    return {
+        "ready_ms": round((time.perf_counter() - timings.started) * 1000, 2),
+        **timings.to_dict(),
+        "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        **extra,
+    }
+
+
+_current_timings: contextvars.ContextVar[Timings | None] = contextvars.ContextVar(
+    "jarvis_timings", default=None
+)
+
+
+def current_timings() -> Timings | None:
+    return _current_timings.get()
+
+
+def current_trace():
+    """The trace of the run in this context, if it is being recorded or replayed."""
+    timings = _current_timings.get()
+    return timings.trace if timings is not None else None
+
+
+@contextlib.contextmanager
+def use_timings(timings: Timings):
+    """Make `timings` the collector for spans recorded in this context (and tasks it starts)."""
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def bind_timings(timings: Timings | None):
+    """Set the collector for the rest of the current task without resetting it."""
+    _current_timings.set(timings)
+
+
+@contextlib.contextmanager
+def span(phase: str, histogram: Histogram | None = None, **labels):
+    """Time the block into PHASE_SECONDS, an optional labelled histogram and the current Timings."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        record_phase(phase, time.perf_counter() - start, histogram, outcome=outcome, **labels)
+
+
+def record_phase(
+    phase: str, seconds: float, histogram: Histogram | None = None, outcome: str = "ok", **labels
+):
+    """Record an already measured duration the same way `span` does."""
+    PHASE_SECONDS.observe(seconds, phase=phase, outcome=outcome)
+    if histogram is not None:
+        histogram.observe(seconds, outcome=outcome, **labels)
+    timings = current_timings()
+    if timings is not None:
+        timings.record(phase, seconds, outcome=outcome, **labels)
+
+
+def build_timing_hook():
+    """Agno tool hook that times each tool call. Put it last so it wraps only the call itself."""
+
+    async def timing_hook(function_name: str, function_call, arguments: dict, **_):
+        with span("tool_call", TOOL_CALL_SECONDS, tool=function_name):
+            return await function_call(**arguments)
+
+    return timing_hook
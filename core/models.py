@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from pydantic.json_schema import SkipJsonSchema
 
 
 class ToolApprovalSpec(BaseModel):
@@ -6,9 +7,29 @@ class ToolApprovalSpec(BaseModel):
     tools: list[str]
 
 
+class SubTaskSpec(BaseModel):
+    id: str
+    instructions: str
+    mcp_servers: list[str]
+    prompt: str
+    # ids of sub-tasks whose output this one needs; tasks without dependencies start at once
+    depends_on: list[str] = []
+
+
 class AgentSpec(BaseModel):
     name: str
     instructions: str
     mcp_servers: list[str]
     prompt: str
     tools_requiring_approval: list[ToolApprovalSpec] = []
+    # Optional DAG of sub-agents; when present the main agent runs last and merges their results
+    subtasks: list[SubTaskSpec] = []
+    # Filled in by the planner, not the model: servers offered in the prompt (None = full map)
+    shortlisted_servers: SkipJsonSchema[list[str] | None] = None
+
+    def all_mcp_servers(self) -> list[str]:
+        """Servers of the main agent and of every sub-task, each once."""
+        servers = list(self.mcp_servers)
+        for task in self.subtasks:
+            servers.extend(server for server in task.mcp_servers if server not in servers)
+        return servers
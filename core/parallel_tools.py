@@ -0,0 +1,85 @@
+import asyncio
+from typing import Any
+
+from core.mcp_pool import MCPSessionPool
+from core.metrics import PARALLEL_TOOL_CALLS
+
+DEFAULT_MAX_PARALLEL = 4
+
+
+class ServerFanout:
+    """Spreads one agent's concurrent calls to an MCP server over the sessions available to it.
+
+    At most `max_parallel` calls run at once. A call uses the agent's own session when no
+    other call is on it. Otherwise it borrows an idle session of the server from `pool`,
+    if there is one, and gives it back as soon as the call returns. Failing that, the
+    call is pipelined over the agent's session next to the others.
+    """
+
+    def __init__(
+        self,
+        server: str,
+        conf: dict[str, Any],
+        max_parallel: int = DEFAULT_MAX_PARALLEL,
+        pool: MCPSessionPool | None = None,
+        session_slot: asyncio.Semaphore | None = None,
+    ):
+        self.server = server
+        self.conf = conf
+        self.pool = pool
+        # the server's max_concurrent_sessions; a borrowed session counts against it too
+        self.session_slot = session_slot
+        self._slots = asyncio.Semaphore(max(1, max_parallel))
+        self._on_own = 0
+
+    async def call(self, agent, function_name: str, function_call, arguments: dict) -> Any:
+        async with self._slots:
+            if self._on_own:
+                borrowed = await self._borrow()
+                if borrowed is not None:
+                    return await self._call_borrowed(borrowed, agent, function_name, arguments)
+            PARALLEL_TOOL_CALLS.inc(server=self.server, route="pipelined" if self._on_own else "own")
+            self._on_own += 1
+            try:
+                return await function_call(**arguments)
+            finally:
+                self._on_own -= 1
+
+    async def _borrow(self):
+        if self.pool is None or (self.session_slot is not None and self.session_slot.locked()):
+            return None
+        if self.session_slot is not None:
+            # not locked, so this returns at once
+            await self.session_slot.acquire()
+        pooled = await self.pool.try_acquire(self.server, self.conf)
+        if pooled is None and self.session_slot is not None:
+            self.session_slot.release()
+        return pooled
+
+    async def _call_borrowed(self, pooled, agent, function_name: str, arguments: dict) -> Any:
+        PARALLEL_TOOL_CALLS.inc(server=self.server, route="pooled")
+        healthy = True
+        try:
+            function = pooled.tools.functions.get(function_name)
+            if function is None or function.entrypoint is None:
+                return f"Error: tool '{function_name}' is no longer provided by MCP server '{self.server}'"
+            return await function.entrypoint(agent=agent, **arguments)
+        except BaseException:
+            healthy = False
+            raise
+        finally:
+            await self.pool.release(pooled, healthy=healthy)
+            if self.session_slot is not None:
+                self.session_slot.release()
+
+
+def build_parallel_hook(fanouts: dict[str, ServerFanout]):
+    """Agno tool hook that runs each call through the ServerFanout of the tool's server."""
+
+    async def parallel_hook(agent, function_name: str, function_call, arguments: dict, **_):
+        fanout = fanouts.get(function_name)
+        if fanout is None:
+            return await function_call(**arguments)
+        return await fanout.call(agent, function_name, function_call, arguments)
+
+    return parallel_hook
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from core.models import AgentSpec
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation so trivial variants share a plan."""
+    query = re.sub(r"\s+", " ", query.strip().casefold())
+    return query.rstrip(" .!?")
+
+
+def tool_map_fingerprint(tool_map: dict[str, Any], model: str) -> str:
+    """Hash of the loaded tool map and planner model; any change produces a new cache namespace."""
+    payload = json.dumps({"model": model, "tools": tool_map}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class PlanCache:
+    """Two-tier cache of validated AgentSpecs: an in-memory LRU and an optional SQLite file.
+
+    Entries are keyed by the normalized query and a fingerprint of the tool map and
+    model, so a changed tool map or model simply misses; stale entries age out via the TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float | None = 24 * 3600,
+        db_path: str | None = None,
+        debug: bool = False,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.debug = debug
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[tuple[str, str], tuple[float, AgentSpec]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                "query TEXT NOT NULL, fingerprint TEXT NOT NULL, spec TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (query, fingerprint))"
+            )
+            self._db.commit()
+
+    def _debug_log(self, msg):
+        if self.debug:
+            print(f"[PlanCache] {msg}")
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def get(self, query: str, fingerprint: str) -> AgentSpec | None:
+        key = (normalize_query(query), fingerprint)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._memory[key]
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT spec, created_at FROM plans WHERE query = ? AND fingerprint = ?", key
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    entry = (row[1], AgentSpec.model_validate_json(row[0]))
+                    self._store_memory(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+        self._debug_log(f"Hit for '{key[0]}'")
+        # hand out a copy so callers can't mutate the cached plan
+        return entry[1].model_copy(deep=True)
+
+    def put(self, query: str, fingerprint: str, spec: AgentSpec) -> None:
+        key = (normalize_query(query), fingerprint)
+        created_at = time.time()
+        with self._lock:
+            self._store_memory(key, (created_at, spec.model_copy(deep=True)))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO plans (query, fingerprint, spec, created_at) VALUES (?, ?, ?, ?)",
+                    (*key, spec.model_dump_json(), created_at),
+                )
+                if self.ttl_seconds is not None:
+                    # expired rows of any fingerprint are no longer servable
+                    self._db.execute(
+                        "DELETE FROM plans WHERE created_at < ?", (created_at - self.ttl_seconds,)
+                    )
+                self._db.commit()
+
+    def _store_memory(self, key: tuple[str, str], entry: tuple[float, AgentSpec]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM plans")
+                self._db.commit()
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._memory)}
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,10 +1,26 @@
+import contextlib
+import hashlib
 import json
 import os
+import time
 
-from google import genai
 from pydantic import ValidationError
 
+from core.metrics import current_trace, span
 from core.models import AgentSpec
+from core.plan_cache import PlanCache, tool_map_fingerprint
+from core.planner_backends import (
+    GeminiPlannerBackend,
+    HedgePolicy,
+    OpenAIPlannerBackend,
+    fallback_generate,
+    hedged_generate,
+)
+from core.task_graph import validate_subtasks
+from core.tool_index import ToolIndex
+
+# bump when the layout of the precompiled planner context changes
+CONTEXT_FORMAT = 2
 
 
 class PlannerAgent:
@@ -14,20 +30,134 @@ class PlannerAgent:
         model: str = "gemini-2.5-flash",
         mcp_tools_file: str = "/Users/mrityunjay/Code/2025/jarvis_playground/mcp/mcp_tools.json",
         debug: bool = False,
+        plan_cache: PlanCache | None = None,
+        retrieval_top_k_servers: int | None = 3,
+        retrieval_top_k_tools: int = 8,
+        retrieval_min_score: float = 1.0,
+        retrieval_fallback_full_map: bool = True,
+        context_path: str | None = "",
+        fallback_model: str | None = None,
+        hedge_policy: HedgePolicy | None = None,
     ):
+        """`retrieval_*` control the prompt shortlist: only the `retrieval_top_k_servers` servers
+        that best match the query (BM25 over tool names and descriptions) are rendered, with
+        descriptions for their `retrieval_top_k_tools` best tools. If no server scores above
+        `retrieval_min_score` the full tool map is used, or just server and tool names when
+        `retrieval_fallback_full_map` is False. Set `retrieval_top_k_servers=None` to disable.
+
+        Everything derived from the tool map (parsed map, BM25 index, rendered prompt) is
+        precompiled to `context_path`, by default `.planner_context.json` next to the tool map,
+        and loaded from it in one read while the tool map is unchanged. `None` disables it.
+        The Gemini client is only created on the first planner call.
+
+        With `fallback_model` (an OpenAI model) a plan that Gemini hasn't returned within the
+        `hedge_policy` delay (its recent p95 by default) is also requested from that model.
+        The first valid AgentSpec wins and the other request is cancelled. The fallback
+        model is also used when Gemini fails. The sync `run` only falls back on failure.
+        """
         self.MODEL = model
         self.debug = debug
+        self.plan_cache = plan_cache
+        self.mcp_tools_file = mcp_tools_file
+        self.retrieval_top_k_servers = retrieval_top_k_servers
+        self.retrieval_top_k_tools = retrieval_top_k_tools
+        self.retrieval_min_score = retrieval_min_score
+        self.retrieval_fallback_full_map = retrieval_fallback_full_map
+        if context_path == "":
+            context_path = os.path.join(os.path.dirname(mcp_tools_file), ".planner_context.json")
+        self.context_path = context_path
 
         if not api_key:
             api_key = os.environ.get("GOOGLE_API_KEY")
         if not api_key:
             raise ValueError("API Key not provided for Gemini")
-        self.client = genai.Client(api_key=api_key)
+        self._gemini = GeminiPlannerBackend(api_key, model)
+        # asked in order; later backends are the hedge / fallback for earlier ones
+        self.backends = [self._gemini]
+        if fallback_model:
+            self.backends.append(OpenAIPlannerBackend(fallback_model))
+        self.hedge_policy = hedge_policy or HedgePolicy()
+        self._load_tool_map()
+
+    @property
+    def client(self):
+        return self._gemini.client
+
+    @client.setter
+    def client(self, client):
+        self._gemini.client = client
 
-        self.mcp_tools, self.mcp_servers = self.__get_mcp_servers(mcp_tools_file)
-        tool_map_str = self._build_tool_map_string(self.mcp_tools)
+    def backend_stats(self) -> dict[str, dict]:
+        """Recent latency percentiles and outcome counts of every planner backend."""
+        return {backend.name: backend.stats.to_dict() for backend in self.backends}
 
-        self.SYSTEM_PROMPT = f"""
+    def _load_tool_map(self):
+        """(Re)load mcp_tools.json and everything derived from it, from the precompiled context if fresh."""
+        self._tool_map_mtime = self.__get_mtime(self.mcp_tools_file)
+        with span("planner_context"):
+            raw = self.__read_bytes(self.mcp_tools_file)
+            key = hashlib.sha256((raw or b"") + f"\0{self.MODEL}\0{CONTEXT_FORMAT}".encode()).hexdigest()
+            context = self._read_context(key)
+            # for the startup report: whether the precompiled context was usable
+            self.context_precompiled = context is not None
+            if context is None:
+                mcp_tools = self.__parse_tool_map(raw)
+                context = {
+                    "key": key,
+                    "mcp_tools": mcp_tools,
+                    "tool_map_fingerprint": tool_map_fingerprint(mcp_tools, self.MODEL),
+                    "tool_index": ToolIndex(mcp_tools),
+                    "system_prompt": self._render_system_prompt(self._build_tool_map_string(mcp_tools)),
+                }
+                if raw is not None:
+                    self._write_context(context)
+        self.mcp_tools = context["mcp_tools"]
+        self.mcp_servers = list(self.mcp_tools.keys())
+        self.tool_map_fingerprint = context["tool_map_fingerprint"]
+        self.tool_index = context["tool_index"]
+        self.SYSTEM_PROMPT = context["system_prompt"]
+
+    def _read_context(self, key: str) -> dict | None:
+        # plain JSON, so a tampered context file can at worst skew the shortlist, never run code
+        if self.context_path is None:
+            return None
+        try:
+            with open(self.context_path, "rb") as f:
+                context = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self._debug_log(f"Ignoring unreadable planner context {self.context_path}: {e}")
+            return None
+        if not isinstance(context, dict) or context.get("key") != key:
+            self._debug_log("Planner context is stale, rebuilding")
+            return None
+        try:
+            context["tool_index"] = ToolIndex.from_dict(context["tool_index"])
+        except (KeyError, TypeError, ValueError) as e:
+            self._debug_log(f"Ignoring malformed planner context {self.context_path}: {e}")
+            return None
+        self._debug_log(f"Loaded precompiled planner context from {self.context_path}")
+        return context
+
+    def _write_context(self, context: dict):
+        if self.context_path is None:
+            return
+        tmp_path = f"{self.context_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({**context, "tool_index": context["tool_index"].to_dict()}, f)
+            # atomic, so a concurrently starting process never reads a partial file
+            os.replace(tmp_path, self.context_path)
+            self._debug_log(f"Wrote planner context to {self.context_path}")
+        except OSError as e:
+            self._debug_log(f"Could not write planner context {self.context_path}: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _render_system_prompt(tool_map_str: str) -> str:
+        return f"""
         You are an expert in intent analysis and agent configuration. Your task is to:
 
         1. Analyze the user's query to fully understand their goals and requirements.
@@ -42,12 +172,22 @@ class PlannerAgent:
               "tools_requiring_approval": [
                 {{"server": "gmail", "tools": ["send_email", "delete_draft"]}},
                 {{"server": "filesystem", "tools": ["delete_file"]}}
+              ],
+              "subtasks": [
+                {{"id": "calendar", "instructions": "you are a helpful agent who ...", "mcp_servers": ["google-calendar"], "prompt": "1. ...", "depends_on": []}},
+                {{"id": "research", "instructions": "you are a helpful agent who ...", "mcp_servers": ["exa"], "prompt": "1. ...", "depends_on": ["calendar"]}}
               ]
               }}
             }}
 
             If no tools need approval, output [] (an empty list).
 
+            `subtasks` is optional. Use it only when the query splits into parts that can be worked on
+            by separate agents, and list in `depends_on` the ids whose results a sub-task needs; sub-tasks
+            without dependencies run at the same time. The top-level agent then runs last: its prompt should
+            combine the sub-task results (which are appended to it) into the final answer, and its
+            `mcp_servers` should only hold servers needed for that last step. For simple queries output [].
+
         The available MCP servers and their tools are:
         {tool_map_str}
 
@@ -72,20 +212,42 @@ class PlannerAgent:
         if self.debug:
             print(f"[PlannerAgent] {msg}")
 
-    def __get_mcp_servers(self, mcp_tools_file: str):
+    def _refresh_tool_map(self):
+        """Reload the tool map if the file changed on disk since it was last read."""
+        if self.__get_mtime(self.mcp_tools_file) != self._tool_map_mtime:
+            self._debug_log(f"{self.mcp_tools_file} changed, reloading tool map")
+            self._load_tool_map()
+
+    @staticmethod
+    def __get_mtime(path: str) -> float | None:
         try:
-            with open(mcp_tools_file) as f:
-                mcp_tools = json.load(f)
-            servers = list(mcp_tools.keys())
-            return mcp_tools, servers
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error reading MCP servers from {mcp_tools_file}: {e}")
-            return {}, []
-        except Exception as e:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    @staticmethod
+    def __read_bytes(path: str) -> bytes | None:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError as e:
+            print(f"Error reading MCP servers from {path}: {e}")
+            return None
+        except OSError as e:
             print(f"Unexpected error reading MCP servers: {e}")
-            return {}, []
+            return None
+
+    def __parse_tool_map(self, raw: bytes | None) -> dict:
+        if raw is None:
+            return {}
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError as e:
+            print(f"Error reading MCP servers from {self.mcp_tools_file}: {e}")
+            return {}
 
-    def _build_tool_map_string(self, tool_map: dict):
+    @staticmethod
+    def _build_tool_map_string(tool_map: dict):
         out = []
         for server, tools in tool_map.items():
             out.append(f"{server}:")
@@ -93,30 +255,138 @@ class PlannerAgent:
                 out.append(f"  - {t}: {desc}")
         return "\n".join(out)
 
-    def run(self, user_input: str):
+    def _build_compact_tool_map_string(self, shortlist: dict[str, list[str]]):
+        """Every tool name of the shortlisted servers, with descriptions only for the best matches."""
+        out = []
+        for server, tools in self.mcp_tools.items():
+            if server not in shortlist:
+                continue
+            described = set(shortlist[server])
+            out.append(f"{server}:")
+            others = []
+            for t, desc in tools:
+                if t in described:
+                    out.append(f"  - {t}: {desc.split('. ')[0][:200]}")
+                else:
+                    others.append(t)
+            if others:
+                out.append(f"  - other tools: {', '.join(others)}")
+        return "\n".join(out)
+
+    def _system_prompt_for(self, user_input: str) -> tuple[str, list[str] | None]:
+        """Return the system prompt for this query and the shortlisted servers (None = full map)."""
+        if self.retrieval_top_k_servers is None:
+            return self.SYSTEM_PROMPT, None
+        shortlist = self.tool_index.shortlist(
+            user_input, self.retrieval_top_k_servers, self.retrieval_top_k_tools, self.retrieval_min_score
+        )
+        if not shortlist:
+            if self.retrieval_fallback_full_map:
+                self._debug_log("No servers matched the query, using the full tool map")
+                return self.SYSTEM_PROMPT, None
+            shortlist = {server: [] for server in self.mcp_tools}
+        self._debug_log(f"Shortlisted servers: {list(shortlist)}")
+        return self._render_system_prompt(self._build_compact_tool_map_string(shortlist)), list(shortlist)
+
+    def match_servers(self, user_input: str, top_k: int = 1) -> list[str]:
+        """The `top_k` servers the local index ranks best for `user_input`; empty when retrieval is off."""
+        if self.retrieval_top_k_servers is None:
+            return []
+        self._refresh_tool_map()
+        shortlist = self.tool_index.shortlist(
+            user_input, top_k, self.retrieval_top_k_tools, self.retrieval_min_score
+        )
+        return list(shortlist)
+
+    def _cached_plan(self, user_input: str) -> AgentSpec | None:
+        if self.plan_cache is None:
+            return None
+        self._refresh_tool_map()
+        cached = self.plan_cache.get(user_input, self.tool_map_fingerprint)
+        if cached is not None:
+            self._debug_log(f"Plan cache hit for input: {user_input}")
+        return cached
+
+    def _parse_spec(self, text: str | None, shortlist: list[str] | None = None) -> AgentSpec:
+        if text is None:
+            raise RuntimeError("No response text received from model.")
         try:
-            self._debug_log(f"Running planner with input: {user_input}")
-            response = self.client.models.generate_content(
-                model=self.MODEL,
-                contents=user_input,
-                config={
-                    "system_instruction": self.SYSTEM_PROMPT,
-                    "response_mime_type": "application/json",
-                    "response_schema": AgentSpec,
-                },
-            )
-            if response.text is None:
-                raise RuntimeError("No response text received from model.")
-            data = json.loads(response.text)
-            spec = AgentSpec.model_validate(data)
-            self._debug_log("Planner produced AgentSpec")
-            self._debug_log(f"Name: {spec.name}")
-            self._debug_log(f"Instructions: {spec.instructions}")
-            self._debug_log(f"MCP Servers: {spec.mcp_servers}")
-            self._debug_log(f"Tools requiring approval: {spec.tools_requiring_approval=}")
-            self._debug_log(f"Prompt to runner: {spec.prompt}")
-            return spec
+            spec = AgentSpec.model_validate(json.loads(text))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Response is not valid JSON: {e}") from e
         except ValidationError as e:
             raise ValueError(f"AgentSpec validation failed: {e}") from e
+        # a broken sub-task graph is a bad plan like any other, so the next backend gets a go
+        validate_subtasks(spec.subtasks)
+        spec.shortlisted_servers = shortlist
+        return spec
+
+    def _trace_plan(self, user_input: str, source: str, spec: AgentSpec, started: float):
+        """Write the plan to the run's trace, if it is being recorded."""
+        trace = current_trace()
+        if trace is not None:
+            trace.write(
+                "plan",
+                query=user_input,
+                source=source,
+                shortlist=spec.shortlisted_servers,
+                ms=round((time.perf_counter() - started) * 1000, 2),
+                spec=spec.model_dump(mode="json"),
+            )
+
+    def _accept(self, user_input: str, backend, spec: AgentSpec, started: float) -> AgentSpec:
+        self._trace_plan(user_input, backend.name, spec, started)
+        self._debug_log(f"Planner produced AgentSpec via {backend.name}")
+        self._debug_log(f"Name: {spec.name}")
+        self._debug_log(f"Instructions: {spec.instructions}")
+        self._debug_log(f"MCP Servers: {spec.mcp_servers}")
+        self._debug_log(f"Tools requiring approval: {spec.tools_requiring_approval=}")
+        self._debug_log(f"Prompt to runner: {spec.prompt}")
+        if self.plan_cache is not None:
+            self.plan_cache.put(user_input, self.tool_map_fingerprint, spec)
+        return spec
+
+    def run(self, user_input: str):
+        started = time.perf_counter()
+        cached = self._cached_plan(user_input)
+        if cached is not None:
+            self._trace_plan(user_input, "cache", cached, started)
+            return cached
+        system_prompt, shortlist = self._system_prompt_for(user_input)
+        try:
+            self._debug_log(f"Running planner with input: {user_input}")
+            with span("planner"):
+                backend, spec = fallback_generate(
+                    self.backends, system_prompt, user_input, lambda text: self._parse_spec(text, shortlist)
+                )
+        except ValueError:
+            # the model answered, but with no usable plan
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to generate agent specification: {e}") from e
+        return self._accept(user_input, backend, spec, started)
+
+    async def arun(self, user_input: str):
+        """Async variant of `run` with hedging across backends; does not block the event loop."""
+        started = time.perf_counter()
+        cached = self._cached_plan(user_input)
+        if cached is not None:
+            self._trace_plan(user_input, "cache", cached, started)
+            return cached
+        system_prompt, shortlist = self._system_prompt_for(user_input)
+        try:
+            self._debug_log(f"Running planner (async) with input: {user_input}")
+            with span("planner"):
+                backend, spec = await hedged_generate(
+                    self.backends,
+                    self.hedge_policy,
+                    system_prompt,
+                    user_input,
+                    lambda text: self._parse_spec(text, shortlist),
+                )
+        except ValueError:
+            # the model answered, but with no usable plan
+            raise
         except Exception as e:
             raise RuntimeError(f"Failed to generate agent specification: {e}") from e
+        return self._accept(user_input, backend, spec, started)
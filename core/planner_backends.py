@@ -0,0 +1,252 @@
+import abc
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any
+
+from core.metrics import PLANNER_BACKEND_SECONDS, PLANNER_HEDGES
+from core.models import AgentSpec
+
+
+class LatencyStats:
+    """Latencies of a backend's most recent successful calls, plus outcome counts."""
+
+    def __init__(self, window: int = 200):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.outcomes: dict[str, int] = {}
+
+    def record(self, seconds: float, outcome: str):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if outcome == "ok":
+            self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+    def to_dict(self) -> dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "samples": len(self.samples),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            **self.outcomes,
+        }
+
+
+class PlannerBackend(abc.ABC):
+    """A model the planner can ask for an AgentSpec. Subclasses return the raw JSON text."""
+
+    name = "backend"
+
+    def __init__(self):
+        self.stats = LatencyStats()
+
+    @abc.abstractmethod
+    def generate(self, system_prompt: str, user_input: str) -> str: ...
+
+    @abc.abstractmethod
+    async def agenerate(self, system_prompt: str, user_input: str) -> str: ...
+
+    def observe(self, seconds: float, outcome: str):
+        self.stats.record(seconds, outcome)
+        PLANNER_BACKEND_SECONDS.observe(seconds, backend=self.name, outcome=outcome)
+
+
+class GeminiPlannerBackend(PlannerBackend):
+    """Gemini through google-genai, with the AgentSpec as the response schema."""
+
+    def __init__(self, api_key: str, model: str = "gemini-2.5-flash"):
+        super().__init__()
+        self.name = f"gemini:{model}"
+        self.model = model
+        self._api_key = api_key
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # google-genai takes over a second to import, so it waits for the first planner call
+            from google import genai
+
+            self._client = genai.Client(api_key=self._api_key)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def _config(self, system_prompt: str) -> dict:
+        return {
+            "system_instruction": system_prompt,
+            "response_mime_type": "application/json",
+            "response_schema": AgentSpec,
+        }
+
+    def generate(self, system_prompt: str, user_input: str) -> str:
+        response = self.client.models.generate_content(
+            model=self.model, contents=user_input, config=self._config(system_prompt)
+        )
+        return response.text
+
+    async def agenerate(self, system_prompt: str, user_input: str) -> str:
+        response = await self.client.aio.models.generate_content(
+            model=self.model, contents=user_input, config=self._config(system_prompt)
+        )
+        return response.text
+
+
+class OpenAIPlannerBackend(PlannerBackend):
+    """An OpenAI chat model in JSON mode; the system prompt already spells out the schema."""
+
+    def __init__(self, model: str = "gpt-4.1", api_key: str | None = None):
+        super().__init__()
+        self.name = f"openai:{model}"
+        self.model = model
+        self._api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self._client = None
+        self._async_client = None
+
+    def _request(self, system_prompt: str, user_input: str) -> dict:
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input},
+            ],
+            "response_format": {"type": "json_object"},
+        }
+
+    def generate(self, system_prompt: str, user_input: str) -> str:
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI(api_key=self._api_key)
+        response = self._client.chat.completions.create(**self._request(system_prompt, user_input))
+        return response.choices[0].message.content
+
+    async def agenerate(self, system_prompt: str, user_input: str) -> str:
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+
+            self._async_client = AsyncOpenAI(api_key=self._api_key)
+        response = await self._async_client.chat.completions.create(
+            **self._request(system_prompt, user_input)
+        )
+        return response.choices[0].message.content
+
+
+class HedgePolicy:
+    """How long to wait on one backend before also asking the next.
+
+    The delay is the `percentile` latency of the waiting backend's recent successful
+    calls, clamped to [`min_delay`, `max_delay`]. Until it has `min_samples` of them,
+    `initial_delay` is used. `percentile=None` turns hedging off: the next backend is
+    then only asked after the previous one failed.
+    """
+
+    def __init__(
+        self,
+        percentile: float | None = 0.95,
+        min_delay: float = 0.5,
+        max_delay: float = 15.0,
+        initial_delay: float = 5.0,
+        min_samples: int = 20,
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+
+    def delay(self, backend: PlannerBackend) -> float | None:
+        if self.percentile is None:
+            return None
+        if len(backend.stats.samples) < self.min_samples:
+            return self.initial_delay
+        return min(self.max_delay, max(self.min_delay, backend.stats.percentile(self.percentile)))
+
+
+def _planner_error(errors: list[tuple[PlannerBackend, Exception]]) -> Exception:
+    """ValueError when every backend returned an invalid plan, RuntimeError otherwise."""
+    message = "; ".join(f"{backend.name}: {e}" for backend, e in errors) or "no planner backends configured"
+    if errors and all(isinstance(e, ValueError) for _, e in errors):
+        return ValueError(message)
+    return RuntimeError(message)
+
+
+def fallback_generate(
+    backends: list[PlannerBackend], system_prompt: str, user_input: str, parse
+) -> tuple[PlannerBackend, Any]:
+    """Blocking variant of `hedged_generate`: each backend is only asked after the previous one failed."""
+    errors: list[tuple[PlannerBackend, Exception]] = []
+    for backend in backends:
+        start = time.perf_counter()
+        try:
+            spec = parse(backend.generate(system_prompt, user_input))
+        except Exception as e:
+            backend.observe(time.perf_counter() - start, "error")
+            errors.append((backend, e))
+            continue
+        backend.observe(time.perf_counter() - start, "ok")
+        return backend, spec
+    raise _planner_error(errors)
+
+
+async def _attempt(backend: PlannerBackend, system_prompt: str, user_input: str, parse) -> tuple:
+    start = time.perf_counter()
+    try:
+        spec = parse(await backend.agenerate(system_prompt, user_input))
+    except asyncio.CancelledError:
+        backend.observe(time.perf_counter() - start, "cancelled")
+        raise
+    except Exception:
+        backend.observe(time.perf_counter() - start, "error")
+        raise
+    backend.observe(time.perf_counter() - start, "ok")
+    return backend, spec
+
+
+async def hedged_generate(
+    backends: list[PlannerBackend], policy: HedgePolicy, system_prompt: str, user_input: str, parse
+) -> tuple[PlannerBackend, Any]:
+    """Ask `backends` in order, starting the next one when the hedge delay passes or all running
+    ones have failed. Returns the first (backend, parse(text)) that succeeds and cancels the rest.
+    If none succeeds, raises with every backend's error: ValueError if each returned an invalid
+    plan, RuntimeError otherwise.
+    """
+    pending: set[asyncio.Task] = set()
+    started: dict[asyncio.Task, PlannerBackend] = {}
+    errors: list[tuple[PlannerBackend, Exception]] = []
+    remaining = list(backends)
+    waiting_on: PlannerBackend | None = None
+    try:
+        while remaining or pending:
+            if remaining and (not pending or waiting_on is None):
+                if pending:
+                    PLANNER_HEDGES.inc(backend=remaining[0].name)
+                waiting_on = remaining.pop(0)
+                task = asyncio.create_task(_attempt(waiting_on, system_prompt, user_input, parse))
+                started[task] = waiting_on
+                pending.add(task)
+            timeout = policy.delay(waiting_on) if remaining else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # hedge: the latest backend is slower than usual, start the next one as well
+                waiting_on = None
+                continue
+            for task in done:
+                try:
+                    return task.result()
+                except Exception as e:
+                    errors.append((started[task], e))
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    raise _planner_error(errors)
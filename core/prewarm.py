@@ -0,0 +1,79 @@
+import asyncio
+import contextlib
+from typing import Any
+
+from core.metrics import PREWARM_SERVERS
+
+
+class SpeculativePrewarm:
+    """Connects the servers a query will probably need while the planner is still running.
+
+    `servers` is the prediction, typically `PlannerAgent.match_servers` on the raw query.
+    Each one is connected on its own exit stack, so once the plan is known `adopt` can
+    hand the servers it uses to the agent and close the rest right away. Lazily
+    registered servers are opened as well, since that is where the time goes. With
+    `pooled=False` the servers get sessions of their own, for an agent that will keep them.
+    """
+
+    def __init__(self, factory, servers: list[str], debug: bool = False, pooled: bool = True):
+        registry = factory.load_mcp_registry()
+        self.factory = factory
+        self.pooled = pooled
+        self.servers = [name for name in servers if name in registry]
+        self.debug = debug
+        self._stacks: dict[str, contextlib.AsyncExitStack] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        for name in self.servers:
+            self._stacks[name] = contextlib.AsyncExitStack()
+            self._tasks[name] = asyncio.create_task(self._warm(name), name=f"prewarm-{name}")
+        self._debug_log(f"Pre-warming {self.servers}")
+
+    def _debug_log(self, msg):
+        if self.debug:
+            print(f"[SpeculativePrewarm] {msg}")
+
+    async def _warm(self, name: str) -> Any | None:
+        from core.lazy_mcp import LazyMCPTools
+
+        toolkit = (await self.factory.connect_servers([name], self._stacks[name], self.pooled)).get(name)
+        if isinstance(toolkit, LazyMCPTools):
+            await toolkit.connect()
+        return toolkit
+
+    async def _discard(self, name: str):
+        task = self._tasks.pop(name)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await self._stacks.pop(name).aclose()
+
+    async def adopt(self, agent_spec, stack: contextlib.AsyncExitStack | None = None) -> dict[str, Any]:
+        """Toolkits of the warmed servers that `agent_spec` uses; every other warmed server is closed.
+
+        With `stack` the adopted sessions are released when it closes; otherwise `aclose` does it.
+        """
+        used = set(agent_spec.mcp_servers)
+        toolkits: dict[str, Any] = {}
+        for name in list(self._tasks):
+            if name not in used:
+                PREWARM_SERVERS.inc(outcome="wasted")
+                await self._discard(name)
+                continue
+            PREWARM_SERVERS.inc(outcome="hit")
+            # the connect may still be running; it is needed now either way
+            (toolkit,) = await asyncio.gather(self._tasks.pop(name), return_exceptions=True)
+            if stack is not None:
+                stack.push_async_callback(self._stacks.pop(name).aclose)
+            if toolkit is not None and not isinstance(toolkit, BaseException):
+                toolkits[name] = toolkit
+        missed = used.difference(self.servers)
+        if missed:
+            PREWARM_SERVERS.inc(len(missed), outcome="missed")
+        self._debug_log(f"Adopted {list(toolkits)} for plan servers {sorted(used)}")
+        return toolkits
+
+    async def aclose(self):
+        """Stop pending connects and release every session not handed to a caller's stack."""
+        for name in list(self._tasks):
+            await self._discard(name)
+        for name in list(self._stacks):
+            await self._stacks.pop(name).aclose()
@@ -0,0 +1,163 @@
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+from core.models import AgentSpec
+
+if TYPE_CHECKING:
+    from agno.agent import Agent
+
+
+class ChatSession:
+    """A built agent kept alive between turns, together with the MCP sessions it holds open."""
+
+    def __init__(
+        self,
+        session_id: str,
+        agent_spec: AgentSpec,
+        agent: "Agent",
+        stack: contextlib.AsyncExitStack,
+        tool_hooks: list | None = None,
+    ):
+        self.id = session_id
+        self.agent_spec = agent_spec
+        self.agent = agent
+        self.stack = stack
+        # the hooks the agent was built with, reused for sub-agents of the first turn
+        self.tool_hooks = tool_hooks or []
+        self.closed = False
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self.turns = 0
+        # one turn at a time; the agent's history and tool state are not safe to share
+        self.lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def missing_servers(self, servers: list[str]) -> list[str]:
+        return [s for s in servers if s not in self.agent_spec.mcp_servers]
+
+    async def close(self):
+        self.closed = True
+        await self.stack.aclose()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.agent_spec.name,
+            "mcp_servers": self.agent_spec.mcp_servers,
+            "turns": self.turns,
+            "created_at": self.created_at,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+        }
+
+
+class SessionStore:
+    """Bounded LRU of ChatSessions with idle-timeout eviction.
+
+    Idle sessions are closed by a background loop after `idle_timeout` seconds; when the
+    store is full the least recently used idle session is closed to make room. Sessions
+    in the middle of a turn are never evicted. `on_close` is called with the id of every
+    session that is closed, e.g. to drop its HITL approvals.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 64,
+        idle_timeout: float = 900.0,
+        on_close: Callable[[str], None] | None = None,
+        debug: bool = False,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.on_close = on_close
+        self.debug = debug
+        self.evictions = 0
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        self._reaper: asyncio.Task | None = None
+
+    def _debug_log(self, msg):
+        if self.debug:
+            print(f"[SessionStore] {msg}")
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_loop(), name="session-reaper")
+
+    def get(self, session_id: str) -> ChatSession | None:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            session.touch()
+        return session
+
+    async def put(self, session: ChatSession) -> None:
+        """Store `session`, closing any session it replaces and evicting LRU sessions over the cap."""
+        self._ensure_reaper()
+        previous = self._sessions.pop(session.id, None)
+        self._sessions[session.id] = session
+        if previous is not None and previous is not session:
+            # a replaced session may still be finishing a turn
+            async with previous.lock:
+                await previous.close()
+        while len(self._sessions) > self.max_sessions:
+            victim = next((s for s in self._sessions.values() if not s.busy and s is not session), None)
+            if victim is None:
+                break
+            self._debug_log(f"Evicting least recently used session {victim.id}")
+            self.evictions += 1
+            await self._close(victim)
+
+    async def remove(self, session_id: str) -> bool:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        await self._close(session)
+        return True
+
+    async def _close(self, session: ChatSession):
+        if self._sessions.get(session.id) is session:
+            del self._sessions[session.id]
+        try:
+            await session.close()
+        except Exception as e:
+            self._debug_log(f"Error closing session {session.id}: {e}")
+        if self.on_close is not None:
+            self.on_close(session.id)
+
+    async def _reap_loop(self):
+        interval = max(1.0, self.idle_timeout / 4)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for session in list(self._sessions.values()):
+                if not session.busy and now - session.last_used > self.idle_timeout:
+                    self._debug_log(f"Closing idle session {session.id}")
+                    self.evictions += 1
+                    await self._close(session)
+
+    def summaries(self) -> list[dict[str, Any]]:
+        return [session.to_dict() for session in self._sessions.values()]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "evictions": self.evictions,
+        }
+
+    async def aclose(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reaper
+        for session in list(self._sessions.values()):
+            await self._close(session)
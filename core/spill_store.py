@@ -0,0 +1,177 @@
+import asyncio
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from collections.abc import Iterator
+from typing import Any
+
+from core.metrics import TOOL_RESULT_SPILLS
+
+
+class SpilledResult:
+    """Metadata of one tool result written to the spill store."""
+
+    def __init__(self, handle: str, path: str, size: int, tool: str):
+        self.handle = handle
+        self.path = path
+        self.size = size
+        self.tool = tool
+        self.created = time.monotonic()
+
+
+class SpillStore:
+    """Temporary on-disk store for tool results too large to keep in memory.
+
+    Each result is written to its own file and read back through mmap, so serving it
+    never loads the whole payload. Files are removed after `ttl_seconds`, and the oldest
+    ones go first once the store holds more than `max_total_bytes`. A store created
+    without `directory` uses a private temp dir, deleted by `close` or at interpreter exit.
+    `spill` runs in worker threads while the loop serves reads, so the index is locked.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        max_result_bytes: int = 64 * 1024,
+        preview_chars: int = 4096,
+        ttl_seconds: float = 3600.0,
+        max_total_bytes: int = 1024**3,
+        debug: bool = False,
+    ):
+        self.directory = directory or tempfile.mkdtemp(prefix="jarvis-spill-")
+        os.makedirs(self.directory, exist_ok=True)
+        self._cleanup = (
+            weakref.finalize(self, shutil.rmtree, self.directory, ignore_errors=True)
+            if directory is None
+            else None
+        )
+        self.max_result_bytes = max_result_bytes
+        self.preview_chars = preview_chars
+        self.ttl_seconds = ttl_seconds
+        self.max_total_bytes = max_total_bytes
+        self.debug = debug
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, SpilledResult] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _debug_log(self, msg):
+        if self.debug:
+            print(f"[SpillStore] {msg}")
+
+    def spill(self, tool: str, data: bytes) -> SpilledResult:
+        """Write `data` to a new file and return its entry. Blocking; call it off the event loop."""
+        handle = uuid.uuid4().hex
+        path = os.path.join(self.directory, f"{handle}.txt")
+        with open(path, "wb") as f:
+            f.write(data)
+        entry = SpilledResult(handle, path, len(data), tool)
+        with self._lock:
+            self._entries[handle] = entry
+            self.total_bytes += entry.size
+            self._evict(keep=handle)
+        self._debug_log(f"Spilled {entry.size} bytes from {tool} to {path}")
+        return entry
+
+    def _evict(self, keep: str | None = None):
+        # caller holds the lock
+        now = time.monotonic()
+        for entry in list(self._entries.values()):
+            if entry.handle == keep:
+                continue
+            if now - entry.created <= self.ttl_seconds and self.total_bytes <= self.max_total_bytes:
+                break
+            self._remove(entry)
+
+    def _remove(self, entry: SpilledResult):
+        # caller holds the lock; an entry already evicted by another caller is left alone
+        if self._entries.pop(entry.handle, None) is None:
+            return
+        self.total_bytes -= entry.size
+        # an open reader keeps its mmap valid after the unlink
+        try:
+            os.remove(entry.path)
+        except OSError as e:
+            self._debug_log(f"Could not remove {entry.path}: {e}")
+
+    def _live(self, handle: str) -> SpilledResult | None:
+        # caller holds the lock
+        entry = self._entries.get(handle)
+        if entry is not None and time.monotonic() - entry.created > self.ttl_seconds:
+            self._remove(entry)
+            return None
+        return entry
+
+    def get(self, handle: str) -> SpilledResult | None:
+        with self._lock:
+            return self._live(handle)
+
+    def iter_chunks(self, handle: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Iterator over the stored bytes of `handle` in chunks, read through mmap. KeyError if unknown."""
+        with self._lock:
+            entry = self._live(handle)
+            if entry is None:
+                raise KeyError(handle)
+            # opened before the first chunk is requested, so a later eviction can't pull the file away
+            f = open(entry.path, "rb")  # noqa: SIM115
+        view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        def chunks():
+            try:
+                for offset in range(0, len(view), chunk_size):
+                    yield view[offset : offset + chunk_size]
+            finally:
+                view.close()
+                f.close()
+
+        return chunks()
+
+    def preview(self, text: str, entry: SpilledResult) -> str:
+        return (
+            f"{text[: self.preview_chars]}\n\n"
+            f"[Result truncated: showing the first {self.preview_chars} characters of {entry.size} bytes. "
+            f"The full result is stored under spill handle {entry.handle}.]"
+        )
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"results": len(self._entries), "bytes": self.total_bytes}
+
+    def close(self):
+        with self._lock:
+            for entry in list(self._entries.values()):
+                self._remove(entry)
+        if self._cleanup is not None:
+            self._cleanup()
+
+
+def build_spill_hook(store: SpillStore, mcp_registry: dict[str, Any], tool_to_server: dict[str, str]):
+    """Agno tool hook that replaces results larger than the limit with a preview and a spill handle.
+
+    The limit is `store.max_result_bytes`, or `max_result_bytes` on the tool's server in
+    mcp_config.json. The model and the API only ever see the preview; the full payload
+    stays on disk. Place it inside the result cache hook so the cache keeps previews.
+    """
+
+    async def spill_hook(function_name: str, function_call, arguments: dict, **_):
+        result = await function_call(**arguments)
+        if not isinstance(result, str):
+            return result
+        server = tool_to_server.get(function_name)
+        limit = mcp_registry.get(server, {}).get("max_result_bytes", store.max_result_bytes)
+        # utf-8 needs at most 4 bytes per character, so short results skip the encode
+        if len(result) * 4 <= limit:
+            return result
+        data = result.encode()
+        if len(data) <= limit:
+            return result
+        entry = await asyncio.to_thread(store.spill, function_name, data)
+        TOOL_RESULT_SPILLS.inc(server=server or "")
+        return store.preview(result, entry)
+
+    return spill_hook
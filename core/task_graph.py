@@ -0,0 +1,124 @@
+import asyncio
+import contextlib
+
+from core.metrics import span
+from core.models import AgentSpec, SubTaskSpec
+
+
+def validate_subtasks(subtasks: list[SubTaskSpec]) -> None:
+    """Raise ValueError for duplicate ids, unknown dependencies or cycles."""
+    ids = [task.id for task in subtasks]
+    if len(ids) != len(set(ids)):
+        raise ValueError(f"Duplicate sub-task ids in plan: {ids}")
+    known = set(ids)
+    for task in subtasks:
+        unknown = [dep for dep in task.depends_on if dep not in known]
+        if unknown:
+            raise ValueError(f"Sub-task '{task.id}' depends on unknown sub-tasks {unknown}")
+    # Kahn's algorithm: whatever never becomes ready is on a cycle
+    pending = {task.id: set(task.depends_on) for task in subtasks}
+    ready = [tid for tid, deps in pending.items() if not deps]
+    while ready:
+        done = ready.pop()
+        del pending[done]
+        for tid, deps in pending.items():
+            if done in deps:
+                deps.discard(done)
+                if not deps:
+                    ready.append(tid)
+    if pending:
+        raise ValueError(f"Sub-tasks {sorted(pending)} form a dependency cycle")
+
+
+class TaskGraphRun:
+    """Runs the sub-tasks of an AgentSpec as a DAG of sub-agents built by `AgentFactory`.
+
+    Each sub-task starts as soon as everything it depends on has finished, so independent
+    branches run at the same time and the wall-clock cost is the critical path. Upstream
+    outputs are appended to the downstream prompt. A failed sub-task skips its dependents.
+    Each sub-agent holds its MCP sessions only while it runs.
+    """
+
+    def __init__(self, factory, agent_spec: AgentSpec, tool_hooks: list | None = None, debug: bool = False):
+        validate_subtasks(agent_spec.subtasks)
+        self.factory = factory
+        self.agent_spec = agent_spec
+        self.tool_hooks = tool_hooks
+        self.debug = debug
+        self.outputs: dict[str, str] = {}
+        self.errors: dict[str, str] = {}
+
+    def _debug_log(self, msg):
+        if self.debug:
+            print(f"[TaskGraph] {msg}")
+
+    def _sub_spec(self, task: SubTaskSpec) -> AgentSpec:
+        upstream = "\n\n".join(f"### {dep}\n{self.outputs[dep]}" for dep in task.depends_on)
+        prompt = task.prompt
+        if upstream:
+            prompt += f"\n\nResults of the steps this one depends on:\n\n{upstream}"
+        return AgentSpec(
+            name=f"{self.agent_spec.name}/{task.id}",
+            instructions=task.instructions,
+            mcp_servers=task.mcp_servers,
+            prompt=prompt,
+            # approvals the planner asked for still apply to the sub-agents using those servers
+            tools_requiring_approval=[
+                a for a in self.agent_spec.tools_requiring_approval if a.server in task.mcp_servers
+            ],
+        )
+
+    async def _run_task(self, task: SubTaskSpec, done: dict[str, asyncio.Event], queue: asyncio.Queue):
+        try:
+            for dep in task.depends_on:
+                await done[dep].wait()
+            failed = [dep for dep in task.depends_on if dep in self.errors]
+            if failed:
+                raise RuntimeError(f"skipped because {failed} failed")
+            spec = self._sub_spec(task)
+            queue.put_nowait({"event": "subtask", "id": task.id, "status": "started"})
+            self._debug_log(f"Starting sub-task {task.id}")
+            with span("subtask", task=task.id):
+                async with contextlib.AsyncExitStack() as stack:
+                    agent = await self.factory.create_agent_from_spec(spec, stack, tool_hooks=self.tool_hooks)
+                    response = await agent.arun(spec.prompt)
+            content = str(response.content or "")
+            if response.is_cancelled:
+                raise RuntimeError(content or "run cancelled")
+            self.outputs[task.id] = content
+            queue.put_nowait({"event": "subtask", "id": task.id, "status": "completed", "content": content})
+        except Exception as e:
+            self._debug_log(f"Sub-task {task.id} failed: {e}")
+            self.errors[task.id] = str(e)
+            queue.put_nowait({"event": "subtask", "id": task.id, "status": "failed", "error": str(e)})
+        finally:
+            done[task.id].set()
+            queue.put_nowait(None)
+
+    async def events(self):
+        """Run every sub-task and yield `subtask` events (started / completed / failed) as they happen."""
+        queue: asyncio.Queue = asyncio.Queue()
+        done = {task.id: asyncio.Event() for task in self.agent_spec.subtasks}
+        tasks = [asyncio.create_task(self._run_task(task, done, queue)) for task in self.agent_spec.subtasks]
+        remaining = len(tasks)
+        try:
+            while remaining:
+                event = await queue.get()
+                if event is None:
+                    remaining -= 1
+                    continue
+                yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def merged_prompt(self) -> str:
+        """The top-level prompt with every sub-task's result (or failure) appended."""
+        sections = []
+        for task in self.agent_spec.subtasks:
+            if task.id in self.outputs:
+                sections.append(f"### {task.id}\n{self.outputs[task.id]}")
+            else:
+                sections.append(f"### {task.id}\n(failed: {self.errors.get(task.id, 'did not run')})")
+        return f"{self.agent_spec.prompt}\n\nResults of the sub-tasks:\n\n" + "\n\n".join(sections)
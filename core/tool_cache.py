@@ -0,0 +1,142 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any
+
+from core.metrics import TOOL_CACHE_EVENTS
+
+
+def canonical_arguments(arguments: dict[str, Any]) -> str:
+    """Stable string form of tool arguments, so key order and spacing don't split cache entries."""
+    return json.dumps(arguments or {}, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def tool_servers(tool_map: dict[str, list], servers: list[str] | None = None) -> dict[str, str]:
+    """Map tool name -> server from an mcp_tools.json style map, optionally limited to `servers`."""
+    return {
+        tool: server
+        for server, tools in tool_map.items()
+        if servers is None or server in servers
+        for tool, _ in tools
+    }
+
+
+class ToolResultCache:
+    """Size-bounded LRU of MCP tool results keyed by (server, tool, canonical arguments).
+
+    Entries expire after the TTL they were stored with. Every server has a generation
+    number that `invalidate_server` bumps; a result is only stored if no invalidation
+    happened while its call was in flight, so a read racing a write can't cache stale data.
+    """
+
+    def __init__(self, max_entries: int = 512, debug: bool = False):
+        self.max_entries = max_entries
+        self.debug = debug
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[tuple[str, str, str], tuple[float, Any]] = OrderedDict()
+        self._generations: dict[str, int] = {}
+
+    def _debug_log(self, msg):
+        if self.debug:
+            print(f"[ToolResultCache] {msg}")
+
+    def generation(self, server: str) -> int:
+        return self._generations.get(server, 0)
+
+    def get(self, server: str, tool: str, arguments: dict[str, Any]) -> Any | None:
+        key = (server, tool, canonical_arguments(arguments))
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            TOOL_CACHE_EVENTS.inc(event="miss")
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        TOOL_CACHE_EVENTS.inc(event="hit")
+        self._debug_log(f"Hit for {server}/{tool}")
+        return entry[1]
+
+    def put(
+        self,
+        server: str,
+        tool: str,
+        arguments: dict[str, Any],
+        result: Any,
+        ttl_seconds: float,
+        generation: int | None = None,
+    ) -> bool:
+        """Store `result`. Returns False if the server was invalidated since `generation`."""
+        if generation is not None and generation != self.generation(server):
+            self._debug_log(f"Not caching {server}/{tool}: invalidated while the call ran")
+            return False
+        key = (server, tool, canonical_arguments(arguments))
+        self._entries[key] = (time.monotonic() + ttl_seconds, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    def invalidate_server(self, server: str) -> int:
+        """Drop every cached result of `server`. Returns how many entries were removed."""
+        self._generations[server] = self.generation(server) + 1
+        stale = [key for key in self._entries if key[0] == server]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self.invalidations += 1
+            TOOL_CACHE_EVENTS.inc(event="invalidation")
+            self._debug_log(f"Invalidated {len(stale)} cached results of {server}")
+        return len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+def build_result_cache_hook(
+    cache: ToolResultCache, mcp_registry: dict[str, Any], tool_to_server: dict[str, str]
+):
+    """Agno tool hook that serves allow-listed read-only tools from `cache`.
+
+    A server opts in with `result_cache_ttls` ({tool: seconds}) in mcp_config.json. Any
+    other tool called on that server is treated as mutating and drops the server's cached
+    results once it returns, unless it is listed in `result_cache_read_only`. Place the hook
+    after the HITL hook so approvals still apply, and before the timing hook.
+    """
+
+    async def result_cache_hook(function_name: str, function_call, arguments: dict, **_):
+        server = tool_to_server.get(function_name)
+        conf = mcp_registry.get(server, {}) if server is not None else {}
+        ttl = (conf.get("result_cache_ttls") or {}).get(function_name)
+
+        if ttl is None:
+            if server is None or function_name in conf.get("result_cache_read_only", ()):
+                return await function_call(**arguments)
+            try:
+                return await function_call(**arguments)
+            finally:
+                cache.invalidate_server(server)
+
+        cached = cache.get(server, function_name, arguments)
+        if cached is not None:
+            return cached
+        generation = cache.generation(server)
+        result = await function_call(**arguments)
+        # MCP failures come back as "Error: ..." strings; those are never cached
+        if isinstance(result, str) and not result.startswith("Error"):
+            cache.put(server, function_name, arguments, result, ttl, generation)
+        return result
+
+    return result_cache_hook
@@ -0,0 +1,141 @@
+import math
+import re
+from collections import Counter
+
+_STOPWORDS = frozenset(
+    [
+        "a",
+        "an",
+        "and",
+        "are",
+        "as",
+        "at",
+        "be",
+        "by",
+        "can",
+        "do",
+        "for",
+        "from",
+        "get",
+        "i",
+        "in",
+        "is",
+        "it",
+        "me",
+        "my",
+        "of",
+        "on",
+        "or",
+        "our",
+        "please",
+        "the",
+        "their",
+        "them",
+        "this",
+        "to",
+        "us",
+        "we",
+        "what",
+        "whats",
+        "with",
+        "you",
+        "your",
+    ]
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens with stopwords removed and a naive plural strip ("emails" -> "email")."""
+    tokens = []
+    for tok in re.findall(r"[a-z0-9]+", text.lower()):
+        if tok in _STOPWORDS:
+            continue
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+
+class ToolIndex:
+    """Local BM25 index over the servers and tools in mcp_tools.json.
+
+    One document per tool: the server name, the tool name and its description. Used by
+    the planner to shortlist servers for a query instead of prompting with the full map.
+    """
+
+    def __init__(self, tool_map: dict[str, list], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: list[tuple[str, str, str]] = []
+        self._tfs: list[Counter] = []
+        self._lens: list[int] = []
+        df: Counter = Counter()
+        for server, tools in tool_map.items():
+            for tool, desc in tools:
+                tokens = tokenize(f"{server} {tool} {desc}")
+                tf = Counter(tokens)
+                self.docs.append((server, tool, desc))
+                self._tfs.append(tf)
+                self._lens.append(len(tokens))
+                df.update(tf.keys())
+        n = len(self.docs)
+        self._avgdl = (sum(self._lens) / n) if n else 0.0
+        self._idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def to_dict(self) -> dict:
+        """The index's statistics as plain JSON-serializable data."""
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "docs": self.docs,
+            "tfs": [dict(tf) for tf in self._tfs],
+            "lens": self._lens,
+            "avgdl": self._avgdl,
+            "idf": self._idf,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ToolIndex":
+        """Rebuild an index from `to_dict` output without re-tokenizing the tool map."""
+        index = cls({}, data["k1"], data["b"])
+        index.docs = [tuple(doc) for doc in data["docs"]]
+        index._tfs = [Counter(tf) for tf in data["tfs"]]
+        index._lens = data["lens"]
+        index._avgdl = data["avgdl"]
+        index._idf = data["idf"]
+        return index
+
+    def scores(self, query: str) -> list[float]:
+        terms = set(tokenize(query))
+        out = []
+        for tf, dl in zip(self._tfs, self._lens, strict=True):
+            score = 0.0
+            for term in terms:
+                f = tf.get(term)
+                if f:
+                    norm = f + self.k1 * (1 - self.b + self.b * dl / self._avgdl)
+                    score += self._idf[term] * f * (self.k1 + 1) / norm
+            out.append(score)
+        return out
+
+    def shortlist(
+        self, query: str, top_k_servers: int, top_k_tools: int, min_score: float = 0.0
+    ) -> dict[str, list[str]]:
+        """Return {server: [best matching tools]} for the top servers scoring above `min_score`.
+
+        A server scores as its best tool. Empty if nothing in the index matches the query.
+        """
+        by_server: dict[str, list[tuple[float, str]]] = {}
+        for (server, tool, _), score in zip(self.docs, self.scores(query), strict=True):
+            by_server.setdefault(server, []).append((score, tool))
+        ranked = sorted(
+            ((max(s for s, _ in tools), server) for server, tools in by_server.items()),
+            reverse=True,
+        )
+        out: dict[str, list[str]] = {}
+        for best, server in ranked[:top_k_servers]:
+            if best <= min_score:
+                break
+            tools = sorted(by_server[server], reverse=True)
+            out[server] = [tool for score, tool in tools[:top_k_tools] if score > 0]
+        return out
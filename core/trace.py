@@ -0,0 +1,401 @@
+"""Record and replay of the planner, model and MCP traffic of chat runs.
+
+A TraceRecorder appends the timeline of every run to a JSON Lines file as it happens. A
+TraceReplay serves those recordings back through stand-in planner, model and MCP transports.
+A captured workload can then be re-run offline, at any concurrency, against another version
+of the orchestration code. Traces hold full prompts, arguments and tool results; treat them
+like the data they came from.
+
+Every record has a kind `k`. Records of a run also carry `run` and `t`, the ms since the run
+started:
+
+    run       query, ts                  a run started (ts: unix time)
+    span      phase, ms, outcome, ...    a Timings span: planner, mcp_lease_wait, mcp_connect, ...
+    plan      query, source, shortlist, ms, spec
+    model     key, status, headers, ms, chunks [[ms since the request, text], ...]
+    tool      server, tool, args, result, ms
+    mcp_open  server, ms, outcome        an MCP session was opened (the mcp_connect span of that open)
+    status    status, error
+    tools     server, tools              tool schemas of a server (not part of a run)
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any
+
+import httpx
+
+from core.metrics import current_trace
+from core.planner_backends import PlannerBackend
+
+
+def _ms_since(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def _request_key(body: bytes) -> str:
+    """Model calls are matched on their system message, which an agent sends unchanged every turn."""
+    try:
+        messages = json.loads(body).get("messages") or []
+    except (ValueError, AttributeError):
+        messages = []
+    first = messages[0].get("content") if messages else None
+    return hashlib.sha256(json.dumps(first, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class TraceFile:
+    """Append-only JSON Lines file. Each record goes out in a single O_APPEND write, so several
+    processes can share one file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()
+
+    def write(self, record: dict[str, Any]):
+        line = (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode()
+        with self._lock:
+            os.write(self._fd, line)
+
+    def close(self):
+        os.close(self._fd)
+
+
+class RunTrace:
+    """The records of one run, written the moment they happen."""
+
+    def __init__(self, file: TraceFile, query: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self._file = file
+        self.write("run", query=query, ts=round(time.time(), 3))
+
+    def write(self, kind: str, **fields):
+        self._file.write({"k": kind, "run": self.id, "t": _ms_since(self.started), **fields})
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    def __init__(self, inner, trace: RunTrace, key: str, response: httpx.Response, started: float):
+        self._inner = inner
+        self._trace = trace
+        self._key = key
+        self._response = response
+        self._started = started
+        self._chunks: list[list] = []
+        self._written = False
+
+    async def __aiter__(self):
+        async for chunk in self._inner:
+            # surrogateescape keeps a multi-byte character split across chunks intact
+            self._chunks.append([_ms_since(self._started), chunk.decode("utf-8", "surrogateescape")])
+            yield chunk
+
+    async def aclose(self):
+        await self._inner.aclose()
+        if not self._written:
+            self._written = True
+            self._trace.write(
+                "model",
+                key=self._key,
+                status=self._response.status_code,
+                headers={"content-type": self._response.headers.get("content-type", "")},
+                ms=_ms_since(self._started),
+                chunks=self._chunks,
+            )
+
+
+class _RecordingTransport(httpx.AsyncBaseTransport):
+    """Sends model requests as usual and writes each response, chunk by chunk, to the current run."""
+
+    def __init__(self):
+        self._inner = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        trace = current_trace()
+        started = time.perf_counter()
+        response = await self._inner.handle_async_request(request)
+        if not isinstance(trace, RunTrace):
+            return response
+        stream = _RecordingStream(response.stream, trace, _request_key(request.content), response, started)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=stream,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+
+def build_trace_hook(tool_to_server: dict[str, str]):
+    """Agno tool hook that writes each call with its arguments, result and latency to the current run."""
+
+    async def trace_hook(function_name: str, function_call, arguments: dict, **_):
+        trace = current_trace()
+        if trace is None:
+            return await function_call(**arguments)
+        started = time.perf_counter()
+        result = await function_call(**arguments)
+        trace.write(
+            "tool",
+            server=tool_to_server.get(function_name),
+            tool=function_name,
+            args=arguments,
+            result=result if isinstance(result, str) else str(result),
+            ms=_ms_since(started),
+        )
+        return result
+
+    return trace_hook
+
+
+class TraceRecorder:
+    """Writes the planner request and AgentSpec, model chunks and tool calls of every run to `path`.
+
+    `start_run` returns the RunTrace to put on the run's Timings; everything recorded in
+    that context, spans included, ends up in the trace.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = TraceFile(path)
+        self._servers_written: set[str] = set()
+        self._http_client: httpx.AsyncClient | None = None
+
+    def start_run(self, query: str) -> RunTrace:
+        return RunTrace(self._file, query)
+
+    def model_kwargs(self) -> dict[str, Any]:
+        """Extra OpenAIChat arguments that route the model's requests through the recorder."""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(transport=_RecordingTransport())
+        return {"http_client": self._http_client}
+
+    def mcp_session(self, server: str) -> None:
+        # recorded runs talk to the real servers
+        return None
+
+    def instrument_tools(self, tools_by_name: dict[str, Any]):
+        """Tool hook recording the calls to these toolkits; their schemas are written once per server."""
+        for server, toolkit in tools_by_name.items():
+            if server in self._servers_written:
+                continue
+            self._servers_written.add(server)
+            tools = [
+                {"name": f.name, "description": f.description, "inputSchema": f.parameters}
+                for f in toolkit.functions.values()
+            ]
+            self._file.write({"k": "tools", "server": server, "tools": tools})
+        return build_trace_hook(
+            {tool: server for server, toolkit in tools_by_name.items() for tool in toolkit.functions}
+        )
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._file.close()
+
+
+class ReplayRun:
+    """The recordings of one run, handed out in the order they were made."""
+
+    def __init__(self, query: str, recorded: dict[str, Any] | None):
+        self.query = query
+        self.plan = recorded["plan"] if recorded else None
+        self._models = deque(recorded["model"] if recorded else ())
+        self._tools = deque(recorded["tool"] if recorded else ())
+
+    def write(self, kind: str, **fields):
+        # replayed runs are not recorded again
+        pass
+
+    def next_model(self, key: str) -> dict[str, Any] | None:
+        """The next response recorded for an agent with this system message, else the next one at all."""
+        match = next((record for record in self._models if record["key"] == key), None)
+        if match is None:
+            return self._models.popleft() if self._models else None
+        self._models.remove(match)
+        return match
+
+    def next_tool(self, tool: str, args: dict) -> dict[str, Any] | None:
+        """The next recorded call of `tool` with these arguments, else with any arguments."""
+        calls = [record for record in self._tools if record["tool"] == tool]
+        match = next((record for record in calls if record["args"] == args), calls[0] if calls else None)
+        if match is not None:
+            self._tools.remove(match)
+        return match
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    def __init__(self, replay: "TraceReplay", chunks: list[list]):
+        self._replay = replay
+        self._chunks = chunks
+
+    async def __aiter__(self):
+        elapsed = 0.0
+        for at, text in self._chunks:
+            await self._replay.delay(at - elapsed)
+            elapsed = at
+            yield text.encode("utf-8", "surrogateescape")
+
+
+class _ReplayTransport(httpx.AsyncBaseTransport):
+    """Answers model requests with the responses recorded for the current run, at their recorded pace."""
+
+    def __init__(self, replay: "TraceReplay"):
+        self._replay = replay
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        trace = current_trace()
+        record = trace.next_model(_request_key(request.content)) if isinstance(trace, ReplayRun) else None
+        if record is None:
+            # 400, so the OpenAI client doesn't retry it
+            return httpx.Response(
+                400, json={"error": {"message": "No recorded model response for this request"}}
+            )
+        return httpx.Response(
+            record["status"], headers=record["headers"], stream=_ReplayStream(self._replay, record["chunks"])
+        )
+
+
+class ReplayPlannerBackend(PlannerBackend):
+    """Planner backend that returns the AgentSpec recorded for the current run's query."""
+
+    name = "replay"
+
+    def __init__(self, replay: "TraceReplay"):
+        super().__init__()
+        self.replay = replay
+
+    def _plan(self) -> dict[str, Any]:
+        trace = current_trace()
+        plan = trace.plan if isinstance(trace, ReplayRun) else None
+        if plan is None:
+            raise RuntimeError("No recorded plan for this query")
+        return plan
+
+    def generate(self, system_prompt: str, user_input: str) -> str:
+        plan = self._plan()
+        time.sleep(plan["ms"] * self.replay.latency_scale / 1000)
+        return json.dumps(plan["spec"])
+
+    async def agenerate(self, system_prompt: str, user_input: str) -> str:
+        plan = self._plan()
+        await self.replay.delay(plan["ms"])
+        return json.dumps(plan["spec"])
+
+
+class ReplaySession:
+    """Stands in for the mcp ClientSession of `server`, answering from the trace instead of the server."""
+
+    def __init__(self, replay: "TraceReplay", server: str):
+        self.replay = replay
+        self.server = server
+
+    async def initialize(self) -> None:
+        await self.replay.delay(self.replay.connect_ms.get(self.server, 0.0))
+
+    async def send_ping(self) -> None:
+        return None
+
+    async def list_tools(self):
+        from mcp.types import ListToolsResult
+
+        return ListToolsResult.model_validate({"tools": self.replay.tools.get(self.server, [])})
+
+    async def call_tool(self, name: str, arguments: dict[str, Any] | None = None, **_):
+        from mcp.types import CallToolResult, TextContent
+
+        trace = current_trace()
+        record = trace.next_tool(name, arguments or {}) if isinstance(trace, ReplayRun) else None
+        if record is None:
+            text = f"No recorded result for {name} on MCP server '{self.server}'"
+            return CallToolResult(content=[TextContent(type="text", text=text)], isError=True)
+        await self.replay.delay(record["ms"])
+        return CallToolResult(content=[TextContent(type="text", text=record["result"])])
+
+
+class TraceReplay:
+    """Serves the runs recorded in `path` through stand-in planner, model and MCP transports.
+
+    A run is matched to a recording by its query; a query recorded several times replays
+    its recordings in turn. Recorded latencies are reproduced, scaled by `latency_scale`
+    (0 replays as fast as possible). Opening an MCP session takes the median recorded open
+    time of its server. Nothing is sent to Gemini, OpenAI or MCP servers.
+    """
+
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.runs_by_query: dict[str, list[dict[str, Any]]] = {}
+        self.tools: dict[str, list[dict[str, Any]]] = {}
+        runs: dict[str, dict[str, Any]] = {}
+        connect_ms: dict[str, list[float]] = {}
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                kind = record.get("k")
+                if kind == "tools":
+                    self.tools[record["server"]] = record["tools"]
+                    continue
+                if kind == "run":
+                    runs[record["run"]] = {"query": record["query"], "plan": None, "model": [], "tool": []}
+                    self.runs_by_query.setdefault(record["query"], []).append(runs[record["run"]])
+                    continue
+                run = runs.get(record.get("run"))
+                if run is None:
+                    continue
+                if kind == "plan":
+                    run["plan"] = record
+                elif kind in ("model", "tool"):
+                    run[kind].append(record)
+                elif kind == "mcp_open" and record.get("outcome") == "ok":
+                    connect_ms.setdefault(record["server"], []).append(record["ms"])
+        self.connect_ms = {server: statistics.median(values) for server, values in connect_ms.items()}
+        self._turns = {query: itertools.count() for query in self.runs_by_query}
+        self._http_client: httpx.AsyncClient | None = None
+
+    def queries(self) -> list[str]:
+        """The recorded queries, once per recorded run."""
+        return [run["query"] for recordings in self.runs_by_query.values() for run in recordings]
+
+    def start_run(self, query: str) -> ReplayRun:
+        recordings = self.runs_by_query.get(query)
+        recorded = recordings[next(self._turns[query]) % len(recordings)] if recordings else None
+        return ReplayRun(query, recorded)
+
+    async def delay(self, ms: float):
+        if ms > 0 and self.latency_scale > 0:
+            await asyncio.sleep(ms * self.latency_scale / 1000)
+
+    def planner_backend(self) -> ReplayPlannerBackend:
+        return ReplayPlannerBackend(self)
+
+    def model_kwargs(self) -> dict[str, Any]:
+        """Extra OpenAIChat arguments that answer the model's requests from the trace."""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(transport=_ReplayTransport(self))
+        return {"http_client": self._http_client, "api_key": "replay"}
+
+    def mcp_session(self, server: str) -> ReplaySession:
+        return ReplaySession(self, server)
+
+    def instrument_tools(self, tools_by_name: dict[str, Any]) -> None:
+        return None
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
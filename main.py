@@ -1,12 +1,28 @@
 import argparse
 import asyncio
 import contextlib
+import json
+import time
 
 from dotenv import load_dotenv
 
 from core.factory import AgentFactory
 from core.hitl_hooks import build_hitl_hooks
+from core.metrics import (
+    Timings,
+    bind_timings,
+    build_timing_hook,
+    record_phase,
+    span,
+    startup_report,
+    use_timings,
+)
+from core.plan_cache import PlanCache
 from core.planner import PlannerAgent
+from core.prewarm import SpeculativePrewarm
+from core.spill_store import SpillStore, build_spill_hook
+from core.task_graph import TaskGraphRun
+from core.tool_cache import ToolResultCache, build_result_cache_hook, tool_servers
 # from core.newplanner import ConversationalPlanner
 
 load_dotenv(override=True)
@@ -15,20 +31,106 @@ load_dotenv(override=True)
 async def main():
     parser = argparse.ArgumentParser(description="Run agent with optional debug mode")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument("--plan-cache", metavar="PATH", help="SQLite file for reusing plans across runs")
+    parser.add_argument("--timings", action="store_true", help="Print per-phase latencies after the run")
+    parser.add_argument(
+        "--spill-dir", metavar="PATH", help="Keep oversized tool results here, not in a temp dir"
+    )
+    parser.add_argument(
+        "--planner-fallback",
+        metavar="MODEL",
+        help="OpenAI model for slow or failed plans, e.g. gpt-4.1 (off by default)",
+    )
+    parser.add_argument(
+        "--prewarm", action="store_true", help="Connect likely MCP servers while the planner runs"
+    )
+    parser.add_argument(
+        "--mcp-broker", metavar="SOCKET", help="Use the stdio servers of the MCP broker on this socket"
+    )
+    parser.add_argument(
+        "--parallel-tools", action="store_true", help="Cap and fan out concurrent tool calls per server"
+    )
+    trace_mode = parser.add_mutually_exclusive_group()
+    trace_mode.add_argument(
+        "--record-trace", metavar="PATH", help="Append the run's planner, model and tool traffic to PATH"
+    )
+    trace_mode.add_argument(
+        "--replay-trace", metavar="PATH", help="Serve the run from a recorded trace, not live services"
+    )
+    parser.add_argument(
+        "--startup-report", action="store_true", help="Print startup phases and imported dependencies"
+    )
     args = parser.parse_args()
 
-    planner_agent = PlannerAgent(debug=args.debug)
-    # planner_agent = ConversationalPlanner(debug=args.debug)
-    agent_factory = AgentFactory(debug=args.debug)
+    trace = None
+    if args.replay_trace:
+        from core.trace import TraceReplay
+
+        trace = TraceReplay(args.replay_trace)
+    elif args.record_trace:
+        from core.trace import TraceRecorder
+
+        trace = TraceRecorder(args.record_trace)
+
+    startup = Timings()
+    with use_timings(startup):
+        plan_cache = PlanCache(db_path=args.plan_cache, debug=args.debug) if args.plan_cache else None
+        with span("planner_init"):
+            planner_agent = PlannerAgent(
+                api_key="replay" if args.replay_trace else None,
+                debug=args.debug,
+                plan_cache=plan_cache,
+                fallback_model=args.planner_fallback or None,
+            )
+            if args.replay_trace:
+                planner_agent.backends = [trace.planner_backend()]
+        # planner_agent = ConversationalPlanner(debug=args.debug)
+        with span("factory_init"):
+            agent_factory = AgentFactory(
+                debug=args.debug,
+                broker_socket=args.mcp_broker,
+                parallel_tool_calls=args.parallel_tools,
+                trace=trace,
+            )
+    if args.startup_report:
+        report = startup_report(startup, planner_context_precompiled=planner_agent.context_precompiled)
+        print(json.dumps(report, indent=2))
 
     user_input = input("Enter your query: ")
-    agent_spec = planner_agent.run(user_input)
+    timings = Timings(trace=trace.start_run(user_input) if trace is not None else None)
+    bind_timings(timings)
+    prewarm = None
+    if args.prewarm:
+        predicted = planner_agent.match_servers(user_input, top_k=2)
+        prewarm = SpeculativePrewarm(agent_factory, predicted, debug=args.debug)
+    agent_spec = await planner_agent.arun(user_input)
     # print(agent_spec)
     # exit()
     hitl_hooks = build_hitl_hooks(agent_spec.tools_requiring_approval, debug=args.debug)
+    registry = agent_factory.load_mcp_registry()
+    tool_to_server = tool_servers(planner_agent.mcp_tools, agent_spec.all_mcp_servers())
+    if trace is None:
+        # a traced run makes every call, so replaying it with a cold cache finds them all recorded
+        hitl_hooks.append(
+            build_result_cache_hook(ToolResultCache(debug=args.debug), registry, tool_to_server)
+        )
+    # oversized results reach the model as a preview; with --debug the full result's path is printed
+    spill_store = SpillStore(directory=args.spill_dir, debug=args.debug)
+    hitl_hooks.append(build_spill_hook(spill_store, registry, tool_to_server))
+    hitl_hooks.append(build_timing_hook())
+
+    if agent_spec.subtasks:
+        graph = TaskGraphRun(agent_factory, agent_spec, hitl_hooks, debug=args.debug)
+        async for event in graph.events():
+            print(f"[{event['id']}] {event['status']}" + (f": {event['error']}" if "error" in event else ""))
+        agent_spec = agent_spec.model_copy(update={"prompt": graph.merged_prompt()})
 
     async with contextlib.AsyncExitStack() as stack:
-        custom_agent = await agent_factory.create_agent_from_spec(agent_spec, stack, tool_hooks=hitl_hooks)
+        # warmed servers the plan uses are handed over; the others were closed by adopt
+        toolkits = await prewarm.adopt(agent_spec, stack) if prewarm is not None else None
+        custom_agent = await agent_factory.create_agent_from_spec(
+            agent_spec, stack, tool_hooks=hitl_hooks, toolkits=toolkits
+        )
 
         # Stream tokens/events to stdout
         stream = await custom_agent.arun(agent_spec.prompt, stream=True, stream_intermediate_steps=True)
@@ -47,6 +149,14 @@ async def main():
             elif getattr(event, "event", None) == "RunCancelled":
                 print(f"\n{getattr(event, 'agent_message', 'Run cancelled.')}")
                 break
+    await agent_factory.aclose()
+
+    if args.timings or trace is not None:
+        record_phase("total", time.perf_counter() - timings.started)
+    if trace is not None:
+        await trace.aclose()
+    if args.timings:
+        print("\n" + json.dumps(timings.to_dict(), indent=2))
 
 
 if __name__ == "__main__":
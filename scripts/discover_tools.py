@@ -1,6 +1,8 @@
 # mcp_dump_tools.py
+import argparse
 import asyncio
 import json
+import sys
 from pathlib import Path
 from typing import Any
 
@@ -9,11 +11,21 @@ from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
 from mcp.client.streamable_http import streamablehttp_client
 
+# run as `python scripts/discover_tools.py`; the config hash is shared with core.mcp_pool
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core.mcp_pool import config_hash  # noqa: E402
+
 MCP_CONFIG_PATH = Path("mcp/mcp_config.json")
 TOOL_MAP_OUTPUT = Path("mcp/mcp_tools.json")
+# per-server tool lists alongside the config hash they were discovered with
+# (also read by AgentFactory to register tools before a server is started)
+DISCOVERY_CACHE = Path("mcp/.mcp_tools_cache.json")
+
+# (name, description, input schema)
+ToolInfo = tuple[str, str, dict[str, Any]]
 
 
-async def _list_tools_stdio(conf: dict[str, Any]) -> list[tuple[str, str]]:
+async def _list_tools_stdio(conf: dict[str, Any]) -> list[ToolInfo]:
     params = StdioServerParameters(
         command=conf["command"],
         args=conf.get("args", []),
@@ -23,10 +35,10 @@ async def _list_tools_stdio(conf: dict[str, Any]) -> list[tuple[str, str]]:
         async with ClientSession(read, write) as session:
             await session.initialize()
             resp = await session.list_tools()
-            return [(t.name, t.description or "") for t in resp.tools]
+            return [(t.name, t.description or "", t.inputSchema) for t in resp.tools]
 
 
-async def _list_tools_sse(conf: dict[str, Any]) -> list[tuple[str, str]]:
+async def _list_tools_sse(conf: dict[str, Any]) -> list[ToolInfo]:
     # Expected keys: url, headers (opt), timeout (opt seconds), read_timeout (opt seconds)
     async with sse_client(
         url=conf["url"],
@@ -37,10 +49,10 @@ async def _list_tools_sse(conf: dict[str, Any]) -> list[tuple[str, str]]:
         async with ClientSession(read, write) as session:
             await session.initialize()
             resp = await session.list_tools()
-            return [(t.name, t.description or "") for t in resp.tools]
+            return [(t.name, t.description or "", t.inputSchema) for t in resp.tools]
 
 
-async def _list_tools_streamable_http(conf: dict[str, Any]) -> list[tuple[str, str]]:
+async def _list_tools_streamable_http(conf: dict[str, Any]) -> list[ToolInfo]:
     # Expected keys: url, headers (opt), timeout (opt seconds), read_timeout (opt seconds)
     async with streamablehttp_client(
         url=conf["url"],
@@ -51,10 +63,10 @@ async def _list_tools_streamable_http(conf: dict[str, Any]) -> list[tuple[str, s
         async with ClientSession(read, write) as session:
             await session.initialize()
             resp = await session.list_tools()
-            return [(t.name, t.description or "") for t in resp.tools]
+            return [(t.name, t.description or "", t.inputSchema) for t in resp.tools]
 
 
-async def list_tools_any(name: str, conf: dict[str, Any]) -> list[tuple[str, str]]:
+async def list_tools_any(name: str, conf: dict[str, Any]) -> list[ToolInfo]:
     stype = conf.get("type", "stdio")
     if stype == "stdio":
         return await _list_tools_stdio(conf)
@@ -66,14 +78,77 @@ async def list_tools_any(name: str, conf: dict[str, Any]) -> list[tuple[str, str
     return []
 
 
+def _read_json(path: Path) -> dict[str, Any]:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+async def _discover(
+    name: str, conf: dict[str, Any], sem: asyncio.Semaphore, timeout: float
+) -> list[ToolInfo] | None:
+    """List tools for one server under the concurrency limit; None if it failed or timed out."""
+    deadline = conf.get("discovery_timeout_seconds", timeout)
+    async with sem:
+        print(f"Discovering tools for {name}...")
+        try:
+            return await asyncio.wait_for(list_tools_any(name, conf), deadline)
+        except TimeoutError:
+            print(f"Timed out discovering {name} after {deadline}s")
+        except Exception as e:
+            print(f"Failed discovering {name}: {e}")
+    return None
+
+
 async def main() -> None:
+    parser = argparse.ArgumentParser(description="Discover MCP tools for every configured server")
+    parser.add_argument("--concurrency", type=int, default=4, help="Servers to query at once")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-server deadline in seconds")
+    parser.add_argument(
+        "--force", action="store_true", help="Re-query servers even if their config is unchanged"
+    )
+    args = parser.parse_args()
+
     registry = json.loads(MCP_CONFIG_PATH.read_text())["mcpServers"]
+    cache = _read_json(DISCOVERY_CACHE)
+    previous = _read_json(TOOL_MAP_OUTPUT)
+
+    hashes = {name: config_hash(conf) for name, conf in registry.items()}
+    stale = [
+        name
+        for name in registry
+        if args.force or name not in cache or cache[name].get("hash") != hashes[name]
+    ]
+    for name in registry:
+        if name not in stale:
+            print(f"Skipping {name} (config unchanged)")
+
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+    results = await asyncio.gather(*(_discover(name, registry[name], sem, args.timeout) for name in stale))
+
+    for name, tools in zip(stale, results, strict=True):
+        if tools is not None:
+            cache[name] = {
+                "hash": hashes[name],
+                "tools": [(t, desc) for t, desc, _ in tools],
+                "schemas": {t: schema for t, _, schema in tools},
+            }
+
+    # Keep config order; failed servers fall back to their last known tools
     tool_map: dict[str, list[tuple[str, str]]] = {}
-    for name, conf in registry.items():
-        print(f"Discovering tools for {name}...")
-        tools = await list_tools_any(name, conf)
-        tool_map[name] = tools
+    for name in registry:
+        if name in cache:
+            tool_map[name] = cache[name]["tools"]
+        elif name in previous:
+            tool_map[name] = previous[name]
+
+    cache = {name: entry for name, entry in cache.items() if name in registry}
+    DISCOVERY_CACHE.write_text(json.dumps(cache, indent=2))
     TOOL_MAP_OUTPUT.write_text(json.dumps(tool_map, indent=2))
+    failed = [name for name, tools in zip(stale, results, strict=True) if tools is None]
+    if failed:
+        print(f"Kept previous tools for failed servers: {', '.join(failed)}")
     print(f"Wrote {TOOL_MAP_OUTPUT}")
 
 
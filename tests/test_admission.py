@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api.main import app
+from core.admission import AdmissionController, AdmissionRejectedError
+
+
+def test_full_queue_is_rejected_and_waiters_time_out():
+    async def main():
+        admission = AdmissionController(max_in_flight=1, max_queued=1, queue_timeout=0.1)
+        release = await admission.acquire()
+        waiting = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        assert admission.stats()["queued"] == 1
+
+        with pytest.raises(AdmissionRejectedError) as full:
+            await admission.acquire()
+        assert (full.value.status_code, full.value.reason) == (429, "queue_full")
+
+        with pytest.raises(AdmissionRejectedError) as timed_out:
+            await waiting
+        assert (timed_out.value.status_code, timed_out.value.reason) == (503, "queue_timeout")
+
+        # a waiter that gets the slot in time runs
+        waiting = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        release()
+        release()  # releasing twice frees one slot
+        (await waiting)()
+        assert admission.stats() == {
+            "in_flight": 0,
+            "queued": 0,
+            "rejected": 2,
+            "max_in_flight": 1,
+            "max_queued": 1,
+        }
+
+    asyncio.run(main())
+
+
+def test_chat_answers_429_with_retry_after():
+    async def main():
+        app.state.admission = AdmissionController(max_in_flight=1, max_queued=0, queue_timeout=20)
+        release = await app.state.admission.acquire()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/chat", json={"query": "hello"})
+        finally:
+            release()
+
+    response = asyncio.run(main())
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert response.json()["reason"] == "queue_full"
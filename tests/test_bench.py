@@ -0,0 +1,71 @@
+from bench.fake_llm import ScriptedChat
+from bench.run import _connect_stats, _percentile, _report
+
+METRICS = """\
+# HELP jarvis_mcp_connect_seconds MCP session connect time
+jarvis_mcp_connect_seconds_count{server="gmail",outcome="ok"} 3.0
+jarvis_mcp_connect_seconds_sum{server="gmail",outcome="ok"} 0.6
+jarvis_mcp_connect_seconds_count{server="gmail",outcome="error"} 7.0
+jarvis_mcp_connect_seconds_sum{server="gmail",outcome="error"} 9.0
+jarvis_mcp_connect_seconds_bucket{server="gmail",outcome="ok",le="0.5"} 3.0
+"""
+
+
+def test_connect_stats_only_count_successful_connects():
+    assert _connect_stats(METRICS) == {"gmail": {"count": 3.0, "seconds": 0.6}}
+    assert _connect_stats("") == {}
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert _percentile(values, 50) == 50.0
+    assert _percentile(values, 99) == 99.0
+    assert _percentile([2.0], 95) == 2.0
+    assert _percentile([], 50) == 0.0
+
+
+def test_report_aggregates_latency_phases_and_connect_deltas():
+    results = [
+        (0.1, "ok", {"plan": 10.0, "run": 40.0}),
+        (0.3, "ok", {"plan": 30.0}),
+        (0.2, "error", {}),
+    ]
+    server = {"rss_kb": 1000, "fds": 10, "children": 2}
+    grown = {"rss_kb": 1500, "fds": 12, "children": 2}
+    report = _report(
+        results,
+        1.5,
+        server,
+        grown,
+        {"gmail": {"count": 1.0, "seconds": 0.2}},
+        {"gmail": {"count": 3.0, "seconds": 0.6}, "calendar": {"count": 0.0, "seconds": 0.0}},
+    )
+    assert report["requests"] == 3 and report["outcomes"] == {"ok": 2, "error": 1}
+    assert report["throughput_rps"] == 2.0
+    assert report["latency_ms"] == {"p50": 200.0, "p95": 300.0, "p99": 300.0, "max": 300.0}
+    # phases average over every request, not just the ones that reached them
+    assert report["mean_phases_ms"] == {"plan": 13.33, "run": 13.33}
+    assert report["mcp_connects"] == {
+        "gmail": {"count": 2, "mean_ms": 200.0},
+        "calendar": {"count": 0, "mean_ms": 0.0},
+    }
+    assert report["server"]["rss_kb"]["growth"] == 500 and report["server"]["fds"]["growth"] == 2
+
+
+def test_scripted_chat_calls_tools_then_answers():
+    chat = ScriptedChat(tool_calls=3, reply_words=2)
+    tools = [
+        {
+            "type": "function",
+            "function": {
+                "name": "send-email",
+                "parameters": {"properties": {"to": {"type": "string"}}, "required": ["to"]},
+            },
+        }
+    ]
+    calls, text = chat.plan_turn({"messages": [{"role": "user", "content": "hi"}], "tools": tools})
+    assert text == "" and [c["function"]["name"] for c in calls] == ["send-email"] * 3
+    assert calls[0]["function"]["arguments"] == '{"to": "bench"}'
+
+    messages = [{"role": "user", "content": "hi"}, {"role": "tool", "content": "sent"}]
+    assert chat.plan_turn({"messages": messages, "tools": tools}) == ([], "done done")
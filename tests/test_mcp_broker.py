@@ -0,0 +1,23 @@
+import asyncio
+import os
+import stat
+
+from core.mcp_broker import MCPBroker
+
+
+def test_socket_is_owner_only(tmp_path):
+    async def main():
+        broker = MCPBroker({}, str(tmp_path / "broker.sock"))
+        await broker.start()
+        try:
+            return stat.S_IMODE(os.stat(broker.socket_path).st_mode)
+        finally:
+            await broker.aclose()
+
+    previous = os.umask(0o022)
+    try:
+        assert asyncio.run(main()) == 0o600
+        # the process umask is restored
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(previous)
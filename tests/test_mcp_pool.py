@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from core.mcp_pool import MCPSessionPool, PooledSession
+
+
+class SlowTools:
+    """Stands in for MCPTools whose connect never finishes on its own."""
+
+    def __init__(self):
+        self.session = None
+        self.exited = False
+
+    async def __aenter__(self):
+        await asyncio.Event().wait()
+
+    async def __aexit__(self, *exc):
+        self.exited = True
+
+
+class FakeTools:
+    """Stands in for MCPTools that connects at once; counts how often it was opened."""
+
+    opened = 0
+
+    def __init__(self):
+        self.session = None
+
+    async def __aenter__(self):
+        FakeTools.opened += 1
+        self.session = object()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.session = None
+
+
+def _session_tasks() -> list[asyncio.Task]:
+    return [
+        task for task in asyncio.all_tasks() if task.get_name().startswith("mcp-session-") and not task.done()
+    ]
+
+
+def test_cancelled_open_leaves_no_session_task():
+    async def main():
+        tools = SlowTools()
+        session = PooledSession(("slow", "hash"), tools)
+        opening = asyncio.create_task(session.open(timeout=30))
+        await asyncio.sleep(0.05)
+        opening.cancel()
+        await asyncio.gather(opening, return_exceptions=True)
+        assert opening.cancelled()
+        await asyncio.sleep(0.05)
+        assert _session_tasks() == []
+        assert tools.exited
+
+    asyncio.run(main())
+
+
+def test_cancelled_acquire_is_closed_by_pool():
+    async def main():
+        pool = MCPSessionPool()
+        conf = {"type": "stdio", "command": "slow"}
+        acquiring = asyncio.create_task(pool.acquire("slow", conf, SlowTools))
+        await asyncio.sleep(0.05)
+        acquiring.cancel()
+        await asyncio.gather(acquiring, return_exceptions=True)
+        await pool.aclose()
+        assert _session_tasks() == []
+
+    asyncio.run(main())
+
+
+def test_leases_reuse_idle_sessions():
+    async def main():
+        FakeTools.opened = 0
+        pool = MCPSessionPool(max_sessions=2)
+        conf = {"type": "stdio", "command": "fake"}
+        async with pool.lease("fake", conf, FakeTools) as first:
+            pass
+        async with pool.lease("fake", conf, FakeTools) as second:
+            assert second is first
+            # a concurrent lease can't share the busy session, so it opens a second one
+            async with pool.lease("fake", conf, FakeTools) as third:
+                assert third is not first
+        assert FakeTools.opened == 2
+        assert pool.stats()["fake"] == {"open": 2, "idle": 2, "in_use": 0}
+        await pool.aclose()
+        assert first.session is None and third.session is None
+
+    asyncio.run(main())
+
+
+def test_full_pool_waits_for_a_release():
+    async def main():
+        pool = MCPSessionPool(max_sessions=1, acquire_timeout=0.1)
+        conf = {"type": "stdio", "command": "fake"}
+        held = await pool.acquire("fake", conf, FakeTools)
+        with pytest.raises(TimeoutError, match="No MCP session available for 'fake'"):
+            await pool.acquire("fake", conf, FakeTools)
+        waiting = asyncio.create_task(pool.acquire("fake", conf, FakeTools))
+        await asyncio.sleep(0.01)
+        await pool.release(held)
+        assert await waiting is held
+        await pool.release(held)
+        await pool.aclose()
+
+    asyncio.run(main())
+
+
+def test_config_change_retires_the_old_sessions():
+    async def main():
+        pool = MCPSessionPool(min_sessions=1)
+        old_conf = {"type": "stdio", "command": "fake", "args": ["--v1"]}
+        new_conf = {**old_conf, "args": ["--v2"]}
+        leased_old = await pool.acquire("fake", old_conf, FakeTools)
+        async with pool.lease("fake", old_conf, FakeTools) as idle_old:
+            pass
+
+        # tuning keys don't change the config, so the idle session is still handed out
+        async with pool.lease("fake", {**old_conf, "pool_max_sessions": 8}, FakeTools) as tools:
+            assert tools is idle_old
+
+        async with pool.lease("fake", new_conf, FakeTools) as new:
+            assert new is not idle_old and new is not leased_old.tools
+            await asyncio.sleep(0.01)
+            # the old config's idle session is closed at once, even below pool_min_sessions
+            assert idle_old.session is None
+            await pool.release(leased_old)
+            assert leased_old.tools.session is None
+        async with pool.lease("fake", new_conf, FakeTools) as again:
+            assert again is new
+        await pool.aclose()
+
+    asyncio.run(main())
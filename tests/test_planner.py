@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+
+from core.planner import PlannerAgent
+from core.planner_backends import HedgePolicy, PlannerBackend, hedged_generate
+
+
+class TextBackend(PlannerBackend):
+    """Answers every plan request with `text`, or raises `error`."""
+
+    def __init__(self, name: str, text: str = "", error: Exception | None = None):
+        super().__init__()
+        self.name = name
+        self.text = text
+        self.error = error
+
+    def generate(self, system_prompt: str, user_input: str) -> str:
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+    async def agenerate(self, system_prompt: str, user_input: str) -> str:
+        return self.generate(system_prompt, user_input)
+
+
+def _planner(tmp_path, *backends: PlannerBackend) -> PlannerAgent:
+    tools_file = tmp_path / "mcp_tools.json"
+    tools_file.write_text("{}")
+    planner = PlannerAgent(api_key="unused", mcp_tools_file=str(tools_file), context_path=None)
+    planner.backends = list(backends)
+    planner.hedge_policy = HedgePolicy(percentile=None)
+    return planner
+
+
+def test_invalid_plans_raise_value_error(tmp_path):
+    planner = _planner(tmp_path, TextBackend("a", '{"name": "x"}'), TextBackend("b", "not json"))
+    with pytest.raises(ValueError, match="(?s)a: AgentSpec validation failed.*b: Response is not valid JSON"):
+        planner.run("plan it")
+    with pytest.raises(ValueError):
+        asyncio.run(planner.arun("plan it"))
+
+
+def test_backend_failures_raise_runtime_error(tmp_path):
+    planner = _planner(
+        tmp_path, TextBackend("a", "not json"), TextBackend("b", error=ConnectionError("down"))
+    )
+    with pytest.raises(RuntimeError, match="Failed to generate agent specification: .*b: down"):
+        planner.run("plan it")
+    with pytest.raises(RuntimeError):
+        asyncio.run(planner.arun("plan it"))
+
+
+class SleepyBackend(TextBackend):
+    """Answers after `delay` seconds and records whether it was cancelled."""
+
+    def __init__(self, name: str, delay: float, text: str = "plan", error: Exception | None = None):
+        super().__init__(name, text, error)
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = False
+
+    async def agenerate(self, system_prompt: str, user_input: str) -> str:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.generate(system_prompt, user_input)
+
+
+def _hedge(*backends: PlannerBackend):
+    policy = HedgePolicy(initial_delay=0.05, min_samples=100)
+    return asyncio.run(hedged_generate(list(backends), policy, "system", "query", lambda text: text))
+
+
+def test_slow_backend_is_hedged_and_the_loser_cancelled():
+    slow, backup = SleepyBackend("slow", 5.0), SleepyBackend("backup", 0.01, text="backup plan")
+    started = time.perf_counter()
+    winner, plan = _hedge(slow, backup)
+    assert (winner, plan) == (backup, "backup plan")
+    assert time.perf_counter() - started < 1.0
+    assert slow.cancelled and slow.stats.outcomes == {"cancelled": 1}
+    assert backup.stats.outcomes == {"ok": 1}
+
+
+def test_fast_backend_is_not_hedged():
+    fast, backup = SleepyBackend("fast", 0.0), SleepyBackend("backup", 0.0)
+    assert _hedge(fast, backup)[0] is fast
+    assert backup.calls == 0
+
+
+def test_failed_backend_is_backed_up_without_waiting_for_the_delay():
+    broken = SleepyBackend("broken", 0.0, error=ConnectionError("down"))
+    backup = SleepyBackend("backup", 0.0)
+    policy = HedgePolicy(initial_delay=5.0, min_samples=100)
+    started = time.perf_counter()
+    winner, _ = asyncio.run(hedged_generate([broken, backup], policy, "system", "query", lambda text: text))
+    assert winner is backup and time.perf_counter() - started < 1.0
+    assert broken.stats.outcomes == {"error": 1}
@@ -0,0 +1,96 @@
+import asyncio
+import contextlib
+import json
+
+from core.factory import AgentFactory
+from core.mcp_pool import MCPSessionPool
+from core.models import AgentSpec
+from core.sessions import ChatSession, SessionStore
+
+SPEC = AgentSpec(name="a", instructions="i", mcp_servers=["srv"], prompt="p")
+
+
+class FakeTools:
+    """Stands in for MCPTools that connects at once."""
+
+    def __init__(self):
+        self.session = None
+        self.functions = {}
+
+    async def __aenter__(self):
+        self.session = object()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.session = None
+
+
+def _factory(tmp_path, pool: MCPSessionPool) -> AgentFactory:
+    config = tmp_path / "mcp_config.json"
+    config.write_text(
+        json.dumps({"mcpServers": {"srv": {"type": "stdio", "command": "srv", "lazy_connect": False}}})
+    )
+    factory = AgentFactory(str(config), pool=pool)
+    factory.build_mcp_tools = lambda name, conf: FakeTools()
+    return factory
+
+
+def test_unpooled_connects_leave_the_pool_free(tmp_path):
+    async def main():
+        pool = MCPSessionPool(max_sessions=1, acquire_timeout=0.1)
+        factory = _factory(tmp_path, pool)
+        async with contextlib.AsyncExitStack() as kept:
+            # a kept session holds its own session, so a /chat run can still lease the only pooled one
+            tools = await factory.connect_servers(["srv"], kept, pooled=False)
+            assert tools["srv"].session is not None
+            async with contextlib.AsyncExitStack() as request:
+                assert (await factory.connect_servers(["srv"], request))["srv"].session is not None
+                assert pool.stats()["srv"]["in_use"] == 1
+        assert tools["srv"].session is None
+        await pool.aclose()
+
+    asyncio.run(main())
+
+
+def _session(session_id: str, closed: list[str]) -> ChatSession:
+    stack = contextlib.AsyncExitStack()
+    stack.callback(closed.append, session_id)
+    return ChatSession(session_id, SPEC, agent=None, stack=stack)
+
+
+def test_store_evicts_least_recently_used_idle_session():
+    async def main():
+        closed, ended = [], []
+        store = SessionStore(max_sessions=2, on_close=ended.append)
+        oldest = _session("a", closed)
+        for session in (oldest, _session("b", closed)):
+            await store.put(session)
+        async with oldest.lock:
+            # a is the least recently used but mid-turn, so b makes room instead
+            await store.put(_session("c", closed))
+        assert closed == ["b"] and ended == ["b"]
+        assert [s["id"] for s in store.summaries()] == ["a", "c"]
+        store.get("a")
+        await store.put(_session("d", closed))
+        assert closed == ["b", "c"]
+        await store.aclose()
+        assert sorted(closed) == ["a", "b", "c", "d"]
+
+    asyncio.run(main())
+
+
+def test_idle_sessions_are_reaped():
+    async def main():
+        closed, ended = [], []
+        store = SessionStore(idle_timeout=0.5, on_close=ended.append)
+        await store.put(_session("idle", closed))
+        busy = _session("busy", closed)
+        await store.put(busy)
+        async with busy.lock:
+            # the reaper runs at most once a second
+            await asyncio.sleep(1.2)
+            assert closed == ["idle"] and ended == ["idle"]
+            assert store.stats()["evictions"] == 1
+        await store.aclose()
+
+    asyncio.run(main())
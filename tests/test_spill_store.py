@@ -0,0 +1,30 @@
+import asyncio
+import contextlib
+
+from core.spill_store import SpillStore
+
+
+def test_concurrent_spills_and_reads_keep_the_byte_count(tmp_path):
+    store = SpillStore(directory=str(tmp_path), max_total_bytes=10_000)
+
+    async def main():
+        handles = []
+
+        async def spill(i: int):
+            entry = await asyncio.to_thread(store.spill, "tool", bytes([i % 256]) * 1000)
+            handles.append(entry.handle)
+
+        async def read():
+            for _ in range(200):
+                for handle in list(handles):
+                    # KeyError once evicted
+                    with contextlib.suppress(KeyError):
+                        b"".join(store.iter_chunks(handle))
+                await asyncio.sleep(0)
+
+        await asyncio.gather(read(), *(spill(i) for i in range(100)))
+
+    asyncio.run(main())
+    stats = store.stats()
+    assert stats["bytes"] == stats["results"] * 1000 <= 10_000
+    assert len(list(tmp_path.iterdir())) == stats["results"]
@@ -0,0 +1,115 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from core.models import AgentSpec, SubTaskSpec
+from core.planner import PlannerAgent
+from core.planner_backends import HedgePolicy, PlannerBackend
+from core.task_graph import TaskGraphRun, validate_subtasks
+
+
+def _task(task_id: str, *depends_on: str) -> SubTaskSpec:
+    return SubTaskSpec(
+        id=task_id, instructions="i", mcp_servers=[], prompt=task_id, depends_on=list(depends_on)
+    )
+
+
+def _spec(*subtasks: SubTaskSpec) -> AgentSpec:
+    return AgentSpec(name="plan", instructions="i", mcp_servers=[], prompt="merge", subtasks=list(subtasks))
+
+
+class FakeFactory:
+    """Builds sub-agents that answer with their prompt after `delay`, or raise for `fail`."""
+
+    def __init__(self, delay: float = 0.05, fail: set[str] = frozenset()):
+        self.delay = delay
+        self.fail = fail
+        self.log: list[tuple[str, str]] = []
+        self.prompts: dict[str, str] = {}
+
+    async def create_agent_from_spec(self, spec: AgentSpec, stack, tool_hooks=None):
+        task_id = spec.name.split("/", 1)[1]
+
+        async def arun(prompt: str):
+            self.prompts[task_id] = prompt
+            self.log.append(("start", task_id))
+            await asyncio.sleep(self.delay)
+            self.log.append(("end", task_id))
+            if task_id in self.fail:
+                raise RuntimeError(f"{task_id} broke")
+            return SimpleNamespace(content=f"result of {task_id}", is_cancelled=False)
+
+        return SimpleNamespace(arun=arun)
+
+
+async def _run(graph: TaskGraphRun) -> list[dict]:
+    return [event async for event in graph.events()]
+
+
+def test_tasks_start_once_their_dependencies_finish():
+    factory = FakeFactory()
+    graph = TaskGraphRun(factory, _spec(_task("c", "a", "b"), _task("a"), _task("b")))
+    events = asyncio.run(_run(graph))
+
+    # independent tasks overlap; the dependent one waits for both
+    assert set(factory.log[:2]) == {("start", "a"), ("start", "b")}
+    assert factory.log.index(("start", "c")) > max(
+        factory.log.index(("end", "a")), factory.log.index(("end", "b"))
+    )
+    assert "### a\nresult of a" in factory.prompts["c"] and "### b\nresult of b" in factory.prompts["c"]
+    assert [e["id"] for e in events if e["status"] == "completed"][-1] == "c"
+    assert "### c\nresult of c" in graph.merged_prompt()
+
+
+def test_failed_dependency_skips_dependents_only():
+    factory = FakeFactory(fail={"a"})
+    graph = TaskGraphRun(factory, _spec(_task("a"), _task("b", "a"), _task("c")))
+    events = {e["id"]: e for e in asyncio.run(_run(graph)) if e["status"] != "started"}
+
+    assert events["a"]["status"] == "failed"
+    assert events["b"]["status"] == "failed" and "skipped because ['a'] failed" in events["b"]["error"]
+    assert events["c"]["status"] == "completed"
+    assert ("start", "b") not in factory.log
+    assert "### b\n(failed: skipped because" in graph.merged_prompt()
+
+
+@pytest.mark.parametrize(
+    "subtasks, message",
+    [
+        ([_task("a", "b"), _task("b", "a")], "dependency cycle"),
+        ([_task("a"), _task("a")], "Duplicate sub-task ids"),
+        ([_task("a", "missing")], "unknown sub-tasks"),
+    ],
+)
+def test_invalid_graphs_are_rejected(subtasks, message):
+    with pytest.raises(ValueError, match=message):
+        validate_subtasks(subtasks)
+
+
+class CannedBackend(PlannerBackend):
+    def __init__(self, name: str, spec: AgentSpec):
+        super().__init__()
+        self.name = name
+        self.text = spec.model_dump_json()
+
+    def generate(self, system_prompt: str, user_input: str) -> str:
+        return self.text
+
+    async def agenerate(self, system_prompt: str, user_input: str) -> str:
+        return self.text
+
+
+def test_planner_falls_back_when_the_plan_has_a_cycle(tmp_path):
+    tools_file = tmp_path / "mcp_tools.json"
+    tools_file.write_text(json.dumps({}))
+    planner = PlannerAgent(api_key="unused", mcp_tools_file=str(tools_file), context_path=None)
+    cyclic = _spec(_task("a", "b"), _task("b", "a"))
+    planner.backends = [CannedBackend("primary", cyclic), CannedBackend("backup", _spec(_task("a")))]
+    planner.hedge_policy = HedgePolicy(percentile=None)
+
+    spec = asyncio.run(planner.arun("plan it"))
+
+    assert [task.id for task in spec.subtasks] == ["a"]
+    assert planner.backends[0].stats.outcomes == {"error": 1}
@@ -0,0 +1,91 @@
+import asyncio
+
+from core.tool_cache import ToolResultCache, build_result_cache_hook
+
+REGISTRY = {
+    "cal": {
+        "result_cache_ttls": {"list-events": 60},
+        "result_cache_read_only": ["get-timezone"],
+    }
+}
+TOOLS = {"list-events": "cal", "create-event": "cal", "get-timezone": "cal"}
+
+
+class FakeServer:
+    """Tool functions of one server; list-events returns a new result on every call."""
+
+    def __init__(self):
+        self.calls: list[str] = []
+        self.release_read = asyncio.Event()
+        self.release_read.set()
+
+    def function(self, name: str):
+        async def call(**arguments):
+            self.calls.append(name)
+            if name == "list-events":
+                await self.release_read.wait()
+                return f"events v{self.calls.count(name)}"
+            return "ok"
+
+        return call
+
+
+def _hook(cache: ToolResultCache):
+    return build_result_cache_hook(cache, REGISTRY, TOOLS)
+
+
+async def _call(hook, server: FakeServer, name: str, **arguments):
+    return await hook(function_name=name, function_call=server.function(name), arguments=arguments)
+
+
+def test_reads_are_cached_until_a_write_invalidates_the_server():
+    async def main():
+        cache, server = ToolResultCache(), FakeServer()
+        hook = _hook(cache)
+        assert await _call(hook, server, "list-events", day="mon", tz="utc") == "events v1"
+        # argument order doesn't split entries
+        assert await _call(hook, server, "list-events", tz="utc", day="mon") == "events v1"
+        await _call(hook, server, "get-timezone")
+        assert await _call(hook, server, "list-events", day="mon", tz="utc") == "events v1"
+
+        await _call(hook, server, "create-event", title="standup")
+        assert cache.generation("cal") == 1
+        assert await _call(hook, server, "list-events", day="mon", tz="utc") == "events v2"
+        assert cache.stats() == {"entries": 1, "hits": 2, "misses": 2, "invalidations": 1}
+
+    asyncio.run(main())
+
+
+def test_read_racing_a_write_is_not_cached():
+    async def main():
+        cache, server = ToolResultCache(), FakeServer()
+        hook = _hook(cache)
+        server.release_read.clear()
+        read = asyncio.create_task(_call(hook, server, "list-events"))
+        await asyncio.sleep(0)
+        # the write lands while the read is in flight, so the read's result may already be stale
+        await _call(hook, server, "create-event")
+        server.release_read.set()
+        assert await read == "events v1"
+        assert cache.stats()["entries"] == 0
+        assert await _call(hook, server, "list-events") == "events v2"
+
+    asyncio.run(main())
+
+
+def test_errors_and_expired_entries_are_not_served():
+    cache = ToolResultCache()
+    assert cache.put("cal", "list-events", {}, "stale", ttl_seconds=-1)
+    assert cache.get("cal", "list-events", {}) is None
+    assert not cache.put("cal", "list-events", {}, "late", ttl_seconds=60, generation=-1)
+
+    async def failing(**_):
+        return "Error: upstream down"
+
+    async def main():
+        hook = _hook(cache)
+        for _ in range(2):
+            await hook(function_name="list-events", function_call=failing, arguments={})
+
+    asyncio.run(main())
+    assert cache.stats()["entries"] == 0 and cache.hits == 0
@@ -0,0 +1,51 @@
+import json
+
+from core.planner import PlannerAgent
+from core.tool_index import ToolIndex, tokenize
+
+TOOL_MAP = {
+    "gmail": [
+        ["send-email", "Send an email message to recipients"],
+        ["search-emails", "Search the mailbox for emails matching a query"],
+    ],
+    "calendar": [
+        ["list-events", "List calendar events between two dates"],
+        ["create-event", "Create a calendar event with attendees"],
+    ],
+    "weather": [["forecast", "Weather forecast for a city"]],
+}
+
+
+def test_tokenize_drops_stopwords_and_plurals():
+    assert tokenize("Send the Emails to my team") == ["send", "email", "team"]
+
+
+def test_shortlist_ranks_matching_servers_and_tools():
+    index = ToolIndex(TOOL_MAP)
+    assert index.shortlist("send an email to Bob", 2, 1) == {"gmail": ["send-email"]}
+    shortlist = index.shortlist("list my calendar events and email them", 3, 2)
+    assert set(shortlist) == {"gmail", "calendar"}
+    assert shortlist["calendar"][0] == "list-events"
+    assert index.shortlist("nothing relevant here", 3, 2) == {}
+
+
+def test_index_round_trips_through_json():
+    index = ToolIndex(TOOL_MAP)
+    restored = ToolIndex.from_dict(json.loads(json.dumps(index.to_dict())))
+    query = "weather forecast and calendar events"
+    assert restored.scores(query) == index.scores(query)
+    assert restored.shortlist(query, 3, 2) == index.shortlist(query, 3, 2)
+
+
+def test_planner_prompt_only_lists_shortlisted_servers(tmp_path):
+    tools_file = tmp_path / "mcp_tools.json"
+    tools_file.write_text(json.dumps(TOOL_MAP))
+    planner = PlannerAgent(api_key="unused", mcp_tools_file=str(tools_file), context_path=None)
+
+    prompt, shortlist = planner._system_prompt_for("what's the weather forecast in Paris")
+    assert shortlist == ["weather"]
+    assert "forecast" in prompt and "send-email" not in prompt
+
+    # no match falls back to the full tool map
+    prompt, shortlist = planner._system_prompt_for("hello there")
+    assert shortlist is None and prompt == planner.SYSTEM_PROMPT and "send-email" in prompt
@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+from api.main import _build_tool_hooks
+from core.hitl_hooks import ApprovalBroker
+from core.metrics import Timings, use_timings
+from core.models import AgentSpec
+from core.spill_store import SpillStore
+from core.tool_cache import ToolResultCache
+from core.trace import TraceRecorder, TraceReplay
+
+QUERY = "what is on my calendar"
+ARGS = {"calendar": "primary"}
+REGISTRY = {"cal": {"type": "stdio", "command": "cal", "result_cache_ttls": {"list-events": 60}}}
+SPEC = AgentSpec(name="cal", instructions="i", mcp_servers=["cal"], prompt="p")
+
+
+def _app(tmp_path, trace):
+    return SimpleNamespace(
+        state=SimpleNamespace(
+            approvals=ApprovalBroker(),
+            agent_factory=SimpleNamespace(load_mcp_registry=lambda: REGISTRY),
+            planner=SimpleNamespace(mcp_tools={"cal": [["list-events", "List events."]]}),
+            tool_cache=ToolResultCache(),
+            spill_store=SpillStore(directory=str(tmp_path / "spill")),
+            trace=trace,
+        )
+    )
+
+
+async def _call(hooks: list, function_name: str, function, arguments: dict):
+    """Run `function` through `hooks`, outermost first, the way agno chains tool hooks."""
+
+    async def invoke(depth: int, **kwargs):
+        if depth == len(hooks):
+            return await function(**kwargs)
+
+        async def next_call(**next_kwargs):
+            return await invoke(depth + 1, **next_kwargs)
+
+        return await hooks[depth](function_name=function_name, function_call=next_call, arguments=kwargs)
+
+    return await invoke(0, **arguments)
+
+
+def _toolkit():
+    function = SimpleNamespace(name="list-events", description="List events.", parameters={})
+    return SimpleNamespace(functions={"list-events": function})
+
+
+def test_untraced_runs_serve_repeat_calls_from_the_cache(tmp_path):
+    calls = []
+
+    async def list_events(**_):
+        calls.append(1)
+        return f"event {len(calls)}"
+
+    async def main():
+        hooks = _build_tool_hooks(_app(tmp_path, None), SPEC, "s")
+        return [await _call(hooks, "list-events", list_events, ARGS) for _ in range(2)]
+
+    assert asyncio.run(main()) == ["event 1", "event 1"]
+    assert len(calls) == 1
+
+
+def test_recorded_cacheable_calls_replay_with_a_cold_cache(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    calls = []
+
+    async def list_events(**_):
+        calls.append(1)
+        return f"event {len(calls)}"
+
+    async def record():
+        recorder = TraceRecorder(path)
+        hooks = _build_tool_hooks(_app(tmp_path, recorder), SPEC, "s")
+        hooks.append(recorder.instrument_tools({"cal": _toolkit()}))
+        with use_timings(Timings(trace=recorder.start_run(QUERY))):
+            results = [await _call(hooks, "list-events", list_events, ARGS) for _ in range(2)]
+        await recorder.aclose()
+        return results
+
+    recorded = asyncio.run(record())
+    # the result cache is off while recording, so the repeat call reached the server
+    assert recorded == ["event 1", "event 2"]
+
+    async def replay():
+        replay = TraceReplay(path, latency_scale=0)
+        session = replay.mcp_session("cal")
+        assert [tool.name for tool in (await session.list_tools()).tools] == ["list-events"]
+        with use_timings(Timings(trace=replay.start_run(QUERY))):
+            results = [await session.call_tool("list-events", ARGS) for _ in range(3)]
+        return [(result.content[0].text, result.isError) for result in results]
+
+    first, second, extra = asyncio.run(replay())
+    assert first == ("event 1", False)
+    assert second == ("event 2", False)
+    # nothing beyond the recorded calls is made up
+    assert extra[1] is True